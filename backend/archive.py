@@ -0,0 +1,240 @@
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+from .config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_MAX_ACTIVE_THREADS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_INTERVAL_SECONDS,
+)
+from .database import ArchivedThread, Attachment, Thread, Message, MessageReply, run_db, session_scope
+from .crud import THREAD_COLUMNS, MESSAGE_COLUMNS, paginate, paginate_by_key
+from .cache import invalidate_on_commit, ARCHIVE_SCOPE, THREADS_SCOPE, thread_scope
+from .serialization import dumps
+from . import media, render, replies
+
+logger = logging.getLogger(__name__)
+
+# Архивация тредов. Тред без новых сообщений дольше ARCHIVE_AFTER_DAYS
+# или за пределами ARCHIVE_MAX_ACTIVE_THREADS самых свежих переносится
+# в archived_threads: строка треда и сжатый список его сообщений.
+# Переносится по ARCHIVE_BATCH_SIZE тредов за короткую транзакцию,
+# поэтому запись в живые таблицы блокируется ненадолго.
+# Архивные треды доступны только для чтения: crud при промахе по живым
+# таблицам читает их отсюда (медленнее - с распаковкой сообщений),
+# список архива отдаёт /threads?archived=true, поиск находит их по
+# прежним записям поискового индекса
+
+ARCHIVE_COLUMNS = (
+    ArchivedThread.id,
+    ArchivedThread.title,
+    ArchivedThread.created_at,
+    ArchivedThread.message_count,
+    ArchivedThread.bumped_at,
+)
+
+# Сортировки списка архива, как crud.THREAD_ORDERS
+ARCHIVE_ORDERS = {
+    "bumped": ArchivedThread.bumped_at,
+    "active": ArchivedThread.message_count,
+}
+
+# Пауза между пачками, чтобы обработчики успевали писать в базу
+BATCH_PAUSE_SECONDS = 0.05
+
+def compress(messages: list) -> bytes:
+    return zlib.compress(dumps(messages))
+
+def decompress(payload: bytes) -> list:
+    return json.loads(zlib.decompress(payload))
+
+# Треды, которые не архивируются никогда: самый новый и тред с последним
+# сообщением. SQLite без AUTOINCREMENT выдаёт новой строке наибольший id + 1,
+# и после удаления строки с наибольшим id он достался бы новому треду
+# или сообщению, совпав с id в архиве
+def protected_thread_ids(db: Session) -> set:
+    newest_thread = select(func.max(Thread.id)).scalar_subquery()
+    latest_message_thread = select(Message.thread_id).order_by(Message.id.desc()).limit(1).scalar_subquery()
+    return set(db.execute(select(newest_thread, latest_message_thread)).first()) - {None}
+
+# Треды для архивации: сначала неактивные дольше срока (самые старые
+# первыми), затем вышедшие за лимит активных
+def archive_candidates(db: Session, now: datetime, limit: int) -> list:
+    protected = protected_thread_ids(db)
+    ids = []
+    if ARCHIVE_AFTER_DAYS > 0:
+        cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+        ids = list(db.execute(
+            select(Thread.id)
+            .where(Thread.bumped_at < cutoff, Thread.id.notin_(protected))
+            .order_by(Thread.bumped_at, Thread.id)
+            .limit(limit)
+        ).scalars())
+    if len(ids) < limit and ARCHIVE_MAX_ACTIVE_THREADS > 0:
+        # Лимит считается по всем тредам, защищённые отбрасываются после
+        overflow = db.execute(
+            select(Thread.id)
+            .order_by(Thread.bumped_at.desc(), Thread.id.desc())
+            .offset(ARCHIVE_MAX_ACTIVE_THREADS)
+            .limit(limit + len(protected))
+        ).scalars()
+        seen = set(ids) | protected
+        ids.extend(thread_id for thread_id in overflow if thread_id not in seen)
+    return ids[:limit]
+
+# Перенос тредов в архив одной транзакцией. Записи поискового индекса
+# остаются: поиск соединяет их и с threads, и с archived_threads, поэтому
+# архивные треды по-прежнему находятся
+def archive_threads(db: Session, thread_ids: list, now: Optional[datetime] = None) -> int:
+    if not thread_ids:
+        return 0
+    # Блокировка строк (где поддерживается) не даёт добавить сообщение
+    # в тред, пока он переносится: create_message получит "тред не найден"
+    threads = db.execute(
+        select(*THREAD_COLUMNS).where(Thread.id.in_(thread_ids)).with_for_update()
+    ).all()
+    messages = {thread.id: [] for thread in threads}
+    rows = db.execute(
+        select(*MESSAGE_COLUMNS)
+        .where(Message.thread_id.in_(list(messages)))
+        .order_by(Message.thread_id, Message.id)
+    ).all()
+    # Вложения сохраняются в архиве вместе с сообщениями, файлы остаются на диске
+    for item in media.attach_to_messages(db, [row._asdict() for row in rows]):
+        messages[item["thread_id"]].append(item)
+    now = now or datetime.now()
+    db.execute(
+        insert(ArchivedThread.__table__),
+        [
+            {**thread._asdict(), "archived_at": now, "payload": compress(messages[thread.id])}
+            for thread in threads
+        ],
+    )
+    # Граф ответов архивного треда строится заново по текстам при чтении
+    db.execute(delete(MessageReply.__table__).where(MessageReply.thread_id.in_(list(messages))))
+    db.execute(delete(Attachment.__table__).where(Attachment.thread_id.in_(list(messages))))
+    db.execute(delete(Message.__table__).where(Message.thread_id.in_(list(messages))))
+    db.execute(delete(Thread.__table__).where(Thread.id.in_(list(messages))))
+    invalidate_on_commit(db, THREADS_SCOPE, ARCHIVE_SCOPE, *(thread_scope(thread_id) for thread_id in messages))
+    db.commit()
+    return len(threads)
+
+# Один шаг архивации: не больше batch_size тредов. Возвращает их число
+def archive_step(db: Session, batch_size: Optional[int] = None, now: Optional[datetime] = None) -> int:
+    now = now or datetime.now()
+    return archive_threads(db, archive_candidates(db, now, batch_size or ARCHIVE_BATCH_SIZE), now)
+
+# Фоновая архивация: пачки подряд, пока есть кандидаты, затем пауза
+# на ARCHIVE_INTERVAL_SECONDS
+async def run_archiver(interval: float = ARCHIVE_INTERVAL_SECONDS):
+    while True:
+        try:
+            async with session_scope() as db:
+                while await run_db(db, archive_step):
+                    await asyncio.sleep(BATCH_PAUSE_SECONDS)
+        except Exception:
+            logger.exception("Ошибка фоновой архивации тредов")
+        await asyncio.sleep(interval)
+
+# Чтение архива
+
+# Список архивных тредов в тех же сортировках и с теми же курсорами,
+# что и crud.list_threads
+def list_threads(
+    db: Session,
+    after_id: Optional[int],
+    before_id: Optional[int],
+    limit: int,
+    order: str = "created",
+    cursor: Optional[str] = None,
+):
+    query = db.query(*ARCHIVE_COLUMNS)
+    if order == "created":
+        return paginate(query, ArchivedThread.id, after_id, before_id, limit)
+    return paginate_by_key(query, ARCHIVE_ORDERS[order], ArchivedThread.id, cursor, limit)
+
+# Валидаторы списка архива: архив только пополняется, поэтому достаточно
+# наибольшего id и времени последней архивации (оба - из индексов)
+def thread_list_validators(db: Session):
+    return db.execute(
+        select(
+            select(func.max(ArchivedThread.id)).scalar_subquery(),
+            select(func.max(ArchivedThread.archived_at)).scalar_subquery(),
+        )
+    ).first()
+
+# Валидаторы архивного треда (message_count, bumped_at, version) или None.
+# Архивный тред не меняется, версия всегда 0
+def thread_validators(db: Session, thread_id: int):
+    return db.execute(
+        select(ArchivedThread.message_count, ArchivedThread.bumped_at, literal(0).label("version"))
+        .where(ArchivedThread.id == thread_id)
+    ).first()
+
+# Архивный тред: (данные треда, список сообщений) или None
+def load_thread(db: Session, thread_id: int):
+    row = db.execute(
+        select(*ARCHIVE_COLUMNS, ArchivedThread.payload).where(ArchivedThread.id == thread_id)
+    ).first()
+    if row is None:
+        return None
+    thread = row._asdict()
+    messages = decompress(thread.pop("payload"))
+    # В архивах, созданных до появления номеров сообщений, номеров нет
+    for number, message in enumerate(messages, start=1):
+        message.setdefault("post_number", number)
+        message.setdefault("attachments", [])
+    # HTML старой версии (или его отсутствие в старых архивах) - разметка заново
+    return thread, render.refresh_items(messages)
+
+# Страница из уже загруженного списка сообщений, как crud.paginate
+def paginate_list(messages: list, after_id: Optional[int], before_id: Optional[int], limit: int):
+    if before_id is not None:
+        older = [message for message in messages if message["id"] < before_id]
+        items = older[-limit:]
+        next_cursor = items[0]["id"] if len(older) > limit and items else None
+    else:
+        newer = [message for message in messages if after_id is None or message["id"] > after_id]
+        items = newer[:limit]
+        next_cursor = items[-1]["id"] if len(newer) > limit and items else None
+    return {"items": items, "next_cursor": next_cursor}
+
+def list_messages(db: Session, thread_id: int, after_id: Optional[int], before_id: Optional[int], limit: int):
+    archived = load_thread(db, thread_id)
+    if archived is None:
+        return None
+    return paginate_list(archived[1], after_id, before_id, limit)
+
+def get_thread_page(db: Session, thread_id: int, limit: int, last: bool = False):
+    archived = load_thread(db, thread_id)
+    if archived is None:
+        return None
+    thread, messages = archived
+    if last:
+        page = paginate_list(messages, None, messages[-1]["id"] + 1 if messages else 0, limit)
+    else:
+        page = paginate_list(messages, None, None, limit)
+    return {"thread": thread, "messages": page}
+
+def get_replies(db: Session, thread_id: int, post_number: int, depth: int = 1):
+    archived = load_thread(db, thread_id)
+    # Номера могут идти с пропусками: сообщение ищется по номеру
+    if archived is None or not any(message["post_number"] == post_number for message in archived[1]):
+        return None
+    return {"post_number": post_number, "items": replies.tree_from_messages(archived[1], post_number, depth)}
+
+def list_backlinks(db: Session, thread_id: int, first: int, last: int):
+    archived = load_thread(db, thread_id)
+    if archived is None:
+        return None
+    pairs = sorted(
+        (edge["target_number"], edge["source_number"])
+        for edge in replies.reply_edges(archived[1])
+        if first <= edge["target_number"] <= last
+    )
+    return {"items": replies.group_backlinks(pairs)}
@@ -1,14 +1,18 @@
+import asyncio
 import logging
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from .database import SessionLocal, User
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .auth_cache import CurrentUser, TokenCache
+from .config import AUTH_CACHE_SIZE, PASSWORD_RETRY_AFTER
+from .database import get_db, run_db, User
+from . import crud
+from .passwords import hash_password, check_password, needs_rehash, password_pool
 from .schemas import UserLogin
-
-# Настройки для хэширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .workers import PoolSaturated
 
 # Настройка логгера
 logging.basicConfig(level=logging.DEBUG)
@@ -22,13 +26,37 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 # Схема для аутентификации через OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Кэш проверенных токенов: повторные запросы с тем же токеном
+# не декодируют JWT и не обращаются к таблице users
+token_cache = TokenCache(AUTH_CACHE_SIZE)
+
+# Любое изменение или удаление пользователя сбрасывает его токены в кэше
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    token_cache.invalidate_user(target.email)
+
 # Функция для хэширования пароля
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
 
 # Функция для проверки пароля
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return check_password(plain_password, hashed_password)
+
+# Выполнение работы с паролем в пуле процессов. Ожидание результата
+# не занимает ни цикл событий, ни потоки FastAPI.
+# Если очередь пула заполнена, клиент сразу получает 503 с Retry-After
+async def run_password_job(fn, *args):
+    try:
+        future = password_pool.submit(fn, *args)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": str(PASSWORD_RETRY_AFTER)},
+        )
+    return await asyncio.wrap_future(future)
 
 # Функция для создания JWT-токена
 def create_access_token(data: dict) -> str:
@@ -36,12 +64,13 @@ def create_access_token(data: dict) -> str:
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    logger.debug(f"Создан токен: {encoded_jwt}")  # Логируем созданный токен
     return encoded_jwt
 
 # Функция для получения текущего пользователя из токена
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    logger.debug(f"Токен: {token}")  # Логируем токен
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> CurrentUser:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached.user
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось подтвердить учетные данные",
@@ -49,24 +78,31 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.debug(f"Payload: {payload}")  # Логируем декодированный payload
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError as e:
         logger.error(f"Ошибка декодирования JWT: {e}")
         raise credentials_exception
-    db = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
+    user = await run_db(db, crud.get_user_by_email, email)
     if user is None:
         logger.error(f"Пользователь с email {email} не найден")
         raise credentials_exception
-    return user
+    current_user = CurrentUser(id=user.id, email=user.email, is_verified=bool(user.is_verified))
+    token_cache.put(token, payload, current_user)
+    return current_user
 
 # Функция для аутентификации пользователя
-def authenticate_user(email: str, password: str):
-    db = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password_hash):
+async def authenticate_user(db: Session, email: str, password: str):
+    user = await run_db(db, crud.get_user_by_email, email)
+    if not user or not await run_password_job(check_password, password, user.password_hash):
         return None
-    return user
\ No newline at end of file
+    # Хэш с устаревшей стоимостью пересчитываем, пока известен пароль.
+    # При перегрузке пула пересчёт откладывается до следующего входа
+    if needs_rehash(user.password_hash):
+        try:
+            new_hash = await asyncio.wrap_future(password_pool.submit(hash_password, password))
+        except PoolSaturated:
+            return user
+        await run_db(db, crud.update_password_hash, user.id, new_hash)
+    return user
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Сведения о пользователе, которых достаточно обработчикам запросов.
+# Хранятся в кэше вместо ORM-объекта, привязанного к сессии
+@dataclass(frozen=True)
+class CurrentUser:
+    id: int
+    email: str
+    is_verified: bool
+
+@dataclass(frozen=True)
+class _Entry:
+    claims: dict
+    user: CurrentUser
+    expires_at: float
+
+# Ограниченный LRU-кэш проверенных токенов.
+# Ключ - SHA-256 от токена, сам токен в памяти не хранится.
+# Запись живёт до истечения токена (exp) или до изменения пользователя
+class TokenCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._by_email = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, token: str, claims: dict, user: CurrentUser):
+        if self.max_size <= 0:
+            return
+        key = self._digest(token)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(claims, user, float(claims["exp"]))
+            self._by_email.setdefault(user.email, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    # Сброс всех токенов пользователя (вызывается при изменении пользователя)
+    def invalidate_user(self, email: str):
+        with self._lock:
+            for key in list(self._by_email.get(email, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_email.clear()
+
+    def _remove(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_email.get(entry.user.email)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_email[entry.user.email]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,193 @@
+import base64
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import DateTime, LargeBinary, func, insert, select, text
+from sqlalchemy.orm import Session
+from .database import User, Thread, Message, MessageReply, Attachment, ArchivedThread
+from .serialization import dumps
+from . import render, replies, search
+
+# Выгрузка и загрузка всего форума в NDJSON: одна запись на строку,
+# {"type": "user" | "thread" | "message" | "message_reply" | "attachment" | "archived_thread", ...колонки}.
+# Двоичные колонки (сжатые сообщения архива) пишутся в base64. Таблицы идут
+# в порядке внешних ключей, поэтому при загрузке родительские записи
+# всегда вставлены раньше дочерних. Файлы с расширением .gz сжимаются.
+# Файлы вложений (каталог MEDIA_ROOT) в выгрузку не входят и копируются отдельно
+
+TABLES = {
+    "user": User.__table__,
+    "thread": Thread.__table__,
+    "message": Message.__table__,
+    "message_reply": MessageReply.__table__,
+    "attachment": Attachment.__table__,
+    "archived_thread": ArchivedThread.__table__,
+}
+
+def open_dump(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+# Прогресс и скорость: строка в stderr не чаще раза в interval секунд
+class Progress:
+    def __init__(self, interval: float = 1.0, stream=None):
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.counts = {kind: 0 for kind in TABLES}
+        self.started = time.perf_counter()
+        self.reported = self.started
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, kind: str, count: int = 1):
+        self.counts[kind] += count
+        now = time.perf_counter()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report()
+
+    def report(self, final: bool = False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.total / elapsed if elapsed else 0.0
+        parts = ", ".join(f"{kind}: {count}" for kind, count in self.counts.items())
+        print(f"{'Готово' if final else 'Записей'}: {self.total} ({parts}), {rate:.0f} записей/с", file=self.stream)
+
+# Выгрузка. Строки читаются потоком по batch_size (yield_per),
+# поэтому память не растёт с размером базы
+def export_forum(db: Session, out, batch_size: int = 1000, progress: Progress = None) -> dict:
+    progress = progress or Progress()
+    for kind, table in TABLES.items():
+        result = db.execute(
+            select(table).order_by(table.c.id).execution_options(yield_per=batch_size)
+        )
+        binary = [column.name for column in table.columns if isinstance(column.type, LargeBinary)]
+        for row in result.mappings():
+            record = {"type": kind, **row}
+            for name in binary:
+                record[name] = base64.b64encode(record[name]).decode()
+            out.write(dumps(record).decode())
+            out.write("\n")
+            progress.add(kind)
+    progress.report(final=True)
+    return progress.counts
+
+# Контрольная точка загрузки: число строк файла, уже записанных в базу.
+# Сохраняется после каждой пачки через замену файла целиком
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> int:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def save(self, lines: int):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(lines))
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# Разбор строки выгрузки: даты из ISO-строк обратно в datetime,
+# двоичные колонки из base64
+def parse_record(line: str):
+    record = json.loads(line)
+    kind = record.pop("type")
+    table = TABLES[kind]
+    for name, value in record.items():
+        if not isinstance(value, str):
+            continue
+        if isinstance(table.c[name].type, DateTime):
+            record[name] = datetime.fromisoformat(value)
+        elif isinstance(table.c[name].type, LargeBinary):
+            record[name] = base64.b64decode(value)
+    return kind, record
+
+# Вставка накопленных записей одной транзакцией, в порядке внешних ключей.
+# Возвращает число вставленных записей каждого типа
+def flush_batch(db: Session, pending: dict) -> dict:
+    for kind, table in TABLES.items():
+        if pending[kind]:
+            db.execute(insert(table), pending[kind])
+    db.commit()
+    flushed = {kind: len(records) for kind, records in pending.items()}
+    for records in pending.values():
+        records.clear()
+    return flushed
+
+# После вставки с явными id счётчики последовательностей PostgreSQL
+# нужно сдвинуть за наибольший id, иначе новые записи получат занятые id
+def reset_sequences(db: Session):
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in TABLES.values():
+        db.execute(
+            text("SELECT setval(pg_get_serial_sequence(:table, 'id'), :value, true)"),
+            {"table": table.name, "value": db.execute(select(func.coalesce(func.max(table.c.id), 1))).scalar()},
+        )
+    db.commit()
+
+# Загрузка. Записи вставляются пачками по batch_size через executemany
+# с сохранением id. Если передан checkpoint, загрузка продолжается
+# с первой строки после последней записанной пачки
+def import_forum(
+    db: Session,
+    lines,
+    batch_size: int = 1000,
+    checkpoint: Checkpoint = None,
+    progress: Progress = None,
+) -> dict:
+    progress = progress or Progress()
+    done = checkpoint.load() if checkpoint else 0
+    pending = {kind: [] for kind in TABLES}
+    size = 0
+    number = done
+    for number, line in enumerate(lines, start=1):
+        if number <= done or not line.strip():
+            continue
+        kind, record = parse_record(line)
+        pending[kind].append(record)
+        size += 1
+        if size >= batch_size:
+            flushed = flush_batch(db, pending)
+            # Контрольная точка сохраняется сразу после commit пачки
+            if checkpoint:
+                checkpoint.save(number)
+            for name, count in flushed.items():
+                progress.add(name, count)
+            size = 0
+    flushed = flush_batch(db, pending)
+    # Последняя неполная пачка тоже отмечается: если упадёт обработка
+    # ниже, повторный запуск не будет вставлять её записи второй раз
+    if checkpoint:
+        checkpoint.save(max(number, done))
+    for name, count in flushed.items():
+        progress.add(name, count)
+    reset_sequences(db)
+    # В выгрузках до появления номеров сообщений нет ни номеров, ни графа ответов,
+    # в более поздних может не быть счётчика номеров тредов
+    if db.execute(select(Message.id).where(Message.post_number.is_(None)).limit(1)).first():
+        replies.rebuild_reply_graph(db)
+    else:
+        replies.sync_last_post_numbers(db)
+        db.commit()
+    # Сообщения без HTML или со старой версией разметки размечаются заново
+    render.rerender_messages(db, batch_size)
+    if search.is_enabled(db):
+        search.rebuild_index(db)
+    if checkpoint:
+        checkpoint.clear()
+    progress.report(final=True)
+    return progress.counts
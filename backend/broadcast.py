@@ -0,0 +1,72 @@
+import asyncio
+from collections import defaultdict
+from .config import EVENTS_QUEUE_SIZE
+
+# Событие: тип, id записи (используется как id события SSE) и данные
+# для отправки клиенту. None в очереди означает отключение подписчика
+
+# Подписка на тему. У каждой подписки своя ограниченная очередь
+class Subscription:
+    def __init__(self, topic: str, queue_size: int):
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.evicted = False
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+# Рассылка событий внутри процесса. publish не ждёт подписчиков:
+# если очередь подписчика заполнена, он отключается, а клиент
+# переподключается и догружает пропущенное по Last-Event-ID.
+# Все методы вызываются из цикла событий
+class Broadcaster:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._topics = defaultdict(set)
+        self.published = 0
+        self.evictions = 0
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(topic, self.queue_size)
+        self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def publish(self, topic: str, event):
+        self.published += 1
+        for subscription in list(self._topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._evict(subscription)
+
+    def _evict(self, subscription: Subscription):
+        self.evictions += 1
+        subscription.evicted = True
+        self.unsubscribe(subscription)
+        # Освобождаем очередь и оставляем в ней только сигнал отключения
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(s) for s in self._topics.values()),
+            "published": self.published,
+            "evictions": self.evictions,
+        }
+
+# Темы событий: список тредов и сообщения конкретного треда
+THREADS_TOPIC = "threads"
+
+def thread_topic(thread_id: int) -> str:
+    return f"thread:{thread_id}"
+
+broadcaster = Broadcaster(EVENTS_QUEUE_SIZE)
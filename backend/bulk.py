@@ -0,0 +1,134 @@
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Sequence
+from sqlalchemy import bindparam, case, insert, or_, select, update
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
+from sqlalchemy.orm import Session
+from .config import BULK_CHUNK_SIZE
+from .database import Thread, Message
+from . import render, replies, search
+from .cache import invalidate_on_commit, THREADS_SCOPE, thread_scope
+
+# Массовая загрузка сообщений (импорт архивов, перенос со старой доски).
+# Вместо отдельного запроса, commit и refresh на каждое сообщение:
+# один запрос IN на проверку всех тредов, затем вставка пачками по
+# chunk_size строк через executemany, по транзакции на пачку.
+# Функции синхронные, как и crud: обработчики вызывают их через run_db
+
+THREAD_NOT_FOUND = "Тред не найден"
+WRITE_FAILED = "Ошибка записи"
+
+messages_table = Message.__table__
+threads_table = Thread.__table__
+
+# Какие из указанных тредов существуют - один запрос IN
+def existing_thread_ids(db: Session, thread_ids) -> set:
+    thread_ids = set(thread_ids)
+    if not thread_ids:
+        return set()
+    return set(db.execute(select(Thread.id).where(Thread.id.in_(thread_ids))).scalars())
+
+# Вставка строк сообщений с получением id в порядке строк.
+# Если драйвер не умеет RETURNING для executemany, строки вставляются по одной
+def insert_rows(db: Session, rows: list) -> list:
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = insert(messages_table).returning(messages_table.c.id, sort_by_parameter_order=True)
+        return list(db.execute(statement, rows).scalars())
+    return [db.execute(insert(messages_table), row).inserted_primary_key[0] for row in rows]
+
+# Счётчики тредов за пачку: одно обновление на тред через executemany.
+# Время бампа не уходит назад, если импортируются старые сообщения
+def bump_threads(db: Session, rows: list):
+    counters = {}
+    for row in rows:
+        count, bumped_at = counters.get(row["thread_id"], (0, row["created_at"]))
+        counters[row["thread_id"]] = (count + 1, max(bumped_at, row["created_at"]))
+    new_bump = bindparam("new_bump")
+    db.execute(
+        update(threads_table)
+        .where(threads_table.c.id == bindparam("target_id"))
+        .values(
+            message_count=threads_table.c.message_count + bindparam("added"),
+            last_post_number=threads_table.c.last_post_number + bindparam("added"),
+            bumped_at=case(
+                (or_(threads_table.c.bumped_at.is_(None), threads_table.c.bumped_at < new_bump), new_bump),
+                else_=threads_table.c.bumped_at,
+            ),
+        ),
+        [
+            {"target_id": thread_id, "added": count, "new_bump": bumped_at}
+            for thread_id, (count, bumped_at) in counters.items()
+        ],
+    )
+    return counters.keys()
+
+# Номера сообщений пачки в тредах. Счётчики уже увеличены bump_threads
+# в этой же транзакции (запись блокирует тред), поэтому номера пачки -
+# последние значения счётчика, и параллельная запись их не займёт
+def assign_post_numbers(db: Session, rows: list):
+    added = Counter(row["thread_id"] for row in rows)
+    counts = dict(db.execute(
+        select(Thread.id, Thread.last_post_number).where(Thread.id.in_(list(added)))
+    ).all())
+    if len(counts) < len(added):
+        raise NoResultFound(THREAD_NOT_FOUND)
+    next_number = {thread_id: counts[thread_id] - count + 1 for thread_id, count in added.items()}
+    for row in rows:
+        row["post_number"] = next_number[row["thread_id"]]
+        next_number[row["thread_id"]] += 1
+
+# Одна пачка в своей транзакции: счётчики, сообщения с номерами,
+# поисковый индекс и граф ответов
+def insert_chunk(db: Session, rows: list) -> list:
+    thread_ids = bump_threads(db, rows)
+    assign_post_numbers(db, rows)
+    ids = insert_rows(db, rows)
+    for row, message_id in zip(rows, ids):
+        row["id"] = message_id
+    search.index_messages(db, rows)
+    replies.index_messages(db, rows)
+    # Вставка в обход ORM не вызывает события маппера, поэтому кэш
+    # ответов сбрасывается явно
+    invalidate_on_commit(db, THREADS_SCOPE, *(thread_scope(thread_id) for thread_id in thread_ids))
+    db.commit()
+    return ids
+
+# Загрузка сообщений. items - словари с ключами thread_id, content
+# и необязательным created_at. Возвращает {"ids": [...], "errors": [...]}:
+# ids по порядку items (None для невставленных), errors - {"index", "detail"}.
+# Ошибка пачки откатывает только её, остальные пачки сохраняются
+def insert_messages(db: Session, items: Sequence[dict], chunk_size: Optional[int] = None) -> dict:
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    ids = [None] * len(items)
+    errors = []
+    known = existing_thread_ids(db, (item["thread_id"] for item in items))
+    pending = []
+    for index, item in enumerate(items):
+        if item["thread_id"] in known:
+            pending.append(index)
+        else:
+            errors.append({"index": index, "detail": THREAD_NOT_FOUND})
+
+    now = datetime.now()
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        rows = [
+            {
+                "thread_id": items[index]["thread_id"],
+                "content": items[index]["content"],
+                "created_at": items[index].get("created_at") or now,
+                **render.rendered_fields(items[index]["content"]),
+            }
+            for index in chunk
+        ]
+        try:
+            chunk_ids = insert_chunk(db, rows)
+        except SQLAlchemyError:
+            db.rollback()
+            errors.extend({"index": index, "detail": WRITE_FAILED} for index in chunk)
+            continue
+        for index, message_id in zip(chunk, chunk_ids):
+            ids[index] = message_id
+
+    errors.sort(key=lambda error: error["index"])
+    return {"ids": ids, "errors": errors}
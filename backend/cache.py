@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .config import RESPONSE_CACHE_URL, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL
+from .database import Thread, Message
+
+# Кэш сериализованных ответов для списка тредов и страниц сообщений.
+#
+# Записи сгруппированы по областям: "threads" - список тредов,
+# "thread:<id>" - сообщения треда. У каждой области есть номер версии,
+# который входит в ключ записи. Инвалидация увеличивает номер версии,
+# после чего старые записи больше не читаются и вытесняются по LRU.
+# Версия читается до обращения к базе, поэтому ответ, построенный
+# до коммита записи, не может оказаться под новой версией
+
+# Хранилище в памяти процесса: LRU с ограничением по суммарному размеру.
+# Записи старше ttl секунд не читаются (0 - без ограничения)
+class MemoryBackend:
+    def __init__(self, max_bytes: int, ttl: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._size -= len(value)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (expires_at, value)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def get_version(self, scope: str) -> int:
+        with self._lock:
+            return self._versions[scope]
+
+    def bump_version(self, scope: str):
+        with self._lock:
+            self._versions[scope] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "evictions": self.evictions,
+            }
+
+# Общее хранилище (Redis или совместимый сервер) для нескольких процессов.
+# Версии областей хранятся там же, поэтому инвалидация видна всем процессам.
+# Пакет redis нужен только при таком режиме
+class RedisBackend:
+    def __init__(self, url: str, ttl: int):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(f"amichan:page:{key}")
+
+    def set(self, key: str, value: bytes):
+        self._client.set(f"amichan:page:{key}", value, ex=self.ttl)
+
+    def get_version(self, scope: str) -> int:
+        return int(self._client.get(f"amichan:version:{scope}") or 0)
+
+    def bump_version(self, scope: str):
+        self._client.incr(f"amichan:version:{scope}")
+
+    def clear(self):
+        for key in self._client.scan_iter("amichan:*"):
+            self._client.delete(key)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "ttl": self.ttl}
+
+def create_backend(url: str):
+    if url == "memory":
+        return MemoryBackend(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, RESPONSE_CACHE_TTL)
+    raise ValueError(f"Неизвестное хранилище кэша: {url}")
+
+# Результат поиска в кэше: ключ с текущей версией области и найденное значение
+class CacheLookup:
+    def __init__(self, scope: str, key: str, value: Optional[tuple]):
+        self.scope = scope
+        self.key = key
+        self.value = value
+
+# Кэш ответов. Значение - (etag, last_modified, тело ответа в байтах)
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    @staticmethod
+    def _kind(scope: str) -> str:
+        return scope.split(":", 1)[0]
+
+    def lookup(self, scope: str, params: str) -> CacheLookup:
+        key = f"{scope}:v{self.backend.get_version(scope)}:{params}"
+        raw = self.backend.get(key)
+        with self._lock:
+            if raw is None:
+                self.misses[self._kind(scope)] += 1
+            else:
+                self.hits[self._kind(scope)] += 1
+        return CacheLookup(scope, key, self._unpack(raw) if raw is not None else None)
+
+    def store(self, lookup: CacheLookup, etag: str, last_modified: str, body: bytes):
+        self.backend.set(lookup.key, self._pack(etag, last_modified, body))
+
+    def invalidate(self, *scopes: str):
+        for scope in scopes:
+            self.backend.bump_version(scope)
+
+    @staticmethod
+    def _pack(etag: str, last_modified: str, body: bytes) -> bytes:
+        return f"{etag}\n{last_modified or ''}\n".encode() + body
+
+    @staticmethod
+    def _unpack(raw: bytes) -> tuple:
+        etag, last_modified, body = raw.split(b"\n", 2)
+        return etag.decode(), last_modified.decode() or None, body
+
+    def stats(self) -> dict:
+        with self._lock:
+            kinds = set(self.hits) | set(self.misses)
+            ratios = {}
+            for kind in kinds:
+                total = self.hits[kind] + self.misses[kind]
+                ratios[kind] = {
+                    "hits": self.hits[kind],
+                    "misses": self.misses[kind],
+                    "hit_ratio": self.hits[kind] / total if total else 0.0,
+                }
+        return {**self.backend.stats(), "scopes": ratios}
+
+response_cache = ResponseCache(create_backend(RESPONSE_CACHE_URL))
+
+# Области кэша
+THREADS_SCOPE = "threads"
+ARCHIVE_SCOPE = "archive"
+
+def thread_scope(thread_id: int) -> str:
+    return f"thread:{thread_id}"
+
+# Отметить области, которые нужно сбросить после коммита сессии.
+# Изменения тредов и сообщений через ORM отмечаются автоматически,
+# вручную это нужно только для массовых UPDATE/INSERT мимо ORM.
+# Если транзакция откатится, кэш не трогается
+def invalidate_on_commit(db: Session, *scopes: str):
+    db.info.setdefault("cache_scopes", set()).update(scopes)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    scopes = session.info.pop("cache_scopes", None)
+    if scopes:
+        response_cache.invalidate(*scopes)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("cache_scopes", None)
+
+@event.listens_for(Thread, "after_insert")
+@event.listens_for(Thread, "after_update")
+@event.listens_for(Thread, "after_delete")
+def _thread_changed(mapper, connection, target):
+    invalidate_on_commit(object_session(target), THREADS_SCOPE, thread_scope(target.id))
+
+@event.listens_for(Message, "after_insert")
+@event.listens_for(Message, "after_update")
+@event.listens_for(Message, "after_delete")
+def _message_changed(mapper, connection, target):
+    invalidate_on_commit(object_session(target), THREADS_SCOPE, thread_scope(target.thread_id))
@@ -0,0 +1,103 @@
+import argparse
+from .database import SessionLocal, init_db
+from . import archive, backup, crud, render, search
+
+# Перестройка поискового индекса
+def rebuild_search(args):
+    db = SessionLocal()
+    try:
+        count = search.rebuild_index(db)
+    finally:
+        db.close()
+    print(f"Поисковый индекс перестроен, записей: {count}")
+
+# Пересчёт счётчиков активности тредов
+def repair_counters(args):
+    db = SessionLocal()
+    try:
+        repaired = crud.repair_thread_counters(db)
+    finally:
+        db.close()
+    print(f"Счётчики тредов пересчитаны, исправлено тредов: {repaired}")
+
+# Разметка сообщений со старой версией разметки (после изменения render.py)
+def rerender_messages(args):
+    db = SessionLocal()
+    try:
+        count = render.rerender_messages(db, args.batch_size)
+    finally:
+        db.close()
+    print(f"Сообщения размечены заново: {count}")
+
+# Архивация мёртвых тредов по настройкам ARCHIVE_* до тех пор,
+# пока есть кандидаты
+def archive_threads(args):
+    db = SessionLocal()
+    try:
+        total = 0
+        while archived := archive.archive_step(db, args.batch_size):
+            total += archived
+            print(f"Перенесено в архив тредов: {total}")
+    finally:
+        db.close()
+    print(f"Архивация завершена, тредов в архиве добавлено: {total}")
+
+# Выгрузка форума в NDJSON (.gz - со сжатием)
+def export_dump(args):
+    db = SessionLocal()
+    try:
+        with backup.open_dump(args.path, "w") as out:
+            backup.export_forum(db, out, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+# Загрузка выгрузки в пустую базу. Прерванная загрузка продолжается
+# с контрольной точки <файл>.checkpoint при повторном запуске
+def import_dump(args):
+    db = SessionLocal()
+    try:
+        with backup.open_dump(args.path, "r") as lines:
+            backup.import_forum(
+                db, lines,
+                batch_size=args.batch_size,
+                checkpoint=backup.Checkpoint(f"{args.path}.checkpoint"),
+            )
+    finally:
+        db.close()
+
+# Служебные команды для обслуживания базы форума.
+# Запуск: python -m backend.cli <команда>
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_rebuild = subparsers.add_parser("rebuild-search", help="Перестроить поисковый индекс")
+    parser_rebuild.set_defaults(func=rebuild_search)
+
+    parser_repair = subparsers.add_parser("repair-counters", help="Пересчитать счётчики тредов")
+    parser_repair.set_defaults(func=repair_counters)
+
+    parser_rerender = subparsers.add_parser("rerender-messages", help="Разметить сообщения текущей версией разметки")
+    parser_rerender.add_argument("--batch-size", type=int, default=1000)
+    parser_rerender.set_defaults(func=rerender_messages)
+
+    parser_archive = subparsers.add_parser("archive", help="Перенести мёртвые треды в архив")
+    parser_archive.add_argument("--batch-size", type=int, default=None)
+    parser_archive.set_defaults(func=archive_threads)
+
+    parser_export = subparsers.add_parser("export", help="Выгрузить форум в NDJSON")
+    parser_export.add_argument("path", help="Файл выгрузки (.ndjson или .ndjson.gz)")
+    parser_export.add_argument("--batch-size", type=int, default=1000)
+    parser_export.set_defaults(func=export_dump)
+
+    parser_import = subparsers.add_parser("import", help="Загрузить выгрузку NDJSON в пустую базу")
+    parser_import.add_argument("path", help="Файл выгрузки (.ndjson или .ndjson.gz)")
+    parser_import.add_argument("--batch-size", type=int, default=1000)
+    parser_import.set_defaults(func=import_dump)
+
+    args = parser.parse_args(argv)
+    init_db()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
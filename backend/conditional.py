@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response, status
+
+# Условные запросы HTTP (ETag / Last-Modified).
+# Валидаторы строятся из счётчиков тредов, поэтому проверка стоит
+# одного запроса по индексу и не требует загрузки и сериализации строк
+
+# Слабый ETag из частей валидатора
+def make_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+# Метка времени для ETag (микросекунды)
+def stamp(value: Optional[datetime]) -> int:
+    return int(value.timestamp() * 1_000_000) if value is not None else 0
+
+# Время в базе хранится как локальное без часового пояса
+def to_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value.astimezone(timezone.utc)
+
+def http_date(value: datetime) -> str:
+    return format_datetime(to_utc(value), usegmt=True)
+
+# Сравнение ETag по слабому правилу (W/ не учитывается)
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+# Не изменился ли ресурс с точки зрения клиента.
+# If-None-Match приоритетнее If-Modified-Since (RFC 9110)
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return to_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+# Заголовки валидаторов для ответа 200 и 304
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+# Ответ из готового JSON-тела (например, из кэша ответов) с учётом
+# условных заголовков запроса. last_modified - уже в формате HTTP-даты
+def conditional_json_response(request: Request, etag: str, last_modified: Optional[str], body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    modified_at = None
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+        modified_at = parsedate_to_datetime(last_modified)
+    if is_not_modified(request, etag, modified_at):
+        return not_modified_response(headers)
+    return Response(content=body, media_type="application/json", headers=headers)
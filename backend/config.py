@@ -0,0 +1,100 @@
+import os
+
+# Настройки приложения задаются переменными окружения
+
+# Подключение к базе данных
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hse_forum.db")
+
+# Пул соединений: постоянные соединения, дополнительные сверх них
+# и сколько секунд ждать свободного соединения
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Параметры SQLite: объём файла, отображаемого в память (байты),
+# и сколько ждать снятия блокировки записи (миллисекунды)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Сколько проверенных JWT-токенов держать в кэше авторизации
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# Хэширование паролей: стоимость bcrypt, число процессов-обработчиков,
+# сколько задач может ждать в очереди и через сколько секунд
+# клиенту предлагается повторить запрос, если очередь заполнена
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_QUEUE_SIZE = int(os.getenv("PASSWORD_QUEUE_SIZE", str(PASSWORD_WORKERS * 4)))
+PASSWORD_RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "1"))
+
+# Поток событий: размер очереди подписчика (при переполнении медленный
+# подписчик отключается) и интервал пустых сообщений, держащих соединение
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# Кэш ответов: "memory" - в процессе, либо адрес общего хранилища
+# (redis://host:port/db), общий для нескольких процессов сервера.
+# Объём кэша в процессе (байты) и время жизни записей (секунды). Кэш
+# в процессе сбрасывается только записями этого процесса, поэтому при
+# нескольких процессах сервера без общего хранилища TTL ограничивает,
+# как долго процесс отдаёт страницу без чужих изменений
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "memory")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+# Массовая загрузка сообщений: сколько строк вставлять в одной транзакции
+# и сколько сообщений принимать в одном запросе
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+
+# Архив тредов: через сколько дней без новых сообщений тред уходит в архив,
+# сколько тредов держать активными (0 - без ограничения), сколько тредов
+# архивировать одной транзакцией и как часто запускать фоновую архивацию
+# (секунды, 0 - только вручную: python -m backend.cli archive)
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_MAX_ACTIVE_THREADS = int(os.getenv("ARCHIVE_MAX_ACTIVE_THREADS", "0"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "20"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "600"))
+
+# Запросы медленнее этого порога (миллисекунды) пишутся в журнал
+# с разбивкой по SQL-запросам; 0 - не писать
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+# Групповая запись: новые треды и сообщения из параллельных запросов
+# копятся в очереди и записываются одной транзакцией - не больше
+# WRITE_QUEUE_MAX_BATCH штук и не дольше WRITE_QUEUE_MAX_DELAY_MS ожидания.
+# Для SQLite, где писатель один и каждый commit - это fsync
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "0").lower() in ("1", "true", "yes")
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "100"))
+WRITE_QUEUE_MAX_DELAY_MS = float(os.getenv("WRITE_QUEUE_MAX_DELAY_MS", "5"))
+
+# Реплики для чтения: адреса через запятую (драйвер как в DATABASE_URL).
+# Запросы на чтение распределяются между ними: round_robin - по очереди,
+# least_busy - в реплику с наименьшим числом занятых соединений.
+# Клиент, который только что писал, ещё READ_YOUR_WRITES_SECONDS секунд
+# читает из основной базы и видит свои изменения несмотря на отставание реплик
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+DB_READ_STRATEGY = os.getenv("DB_READ_STRATEGY", "round_robin")
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Вложения (изображения) к сообщениям: каталог хранения, наибольший размер
+# файла (байты), число файлов на сообщение и размер пачки при записи на диск.
+# Миниатюры (сторона не больше THUMBNAIL_SIZE) строятся отдельным пулом процессов
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "./media")
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(10 * 1024 * 1024)))
+MAX_ATTACHMENTS = int(os.getenv("MAX_ATTACHMENTS", "4"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "250"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+THUMBNAIL_QUEUE_SIZE = int(os.getenv("THUMBNAIL_QUEUE_SIZE", str(THUMBNAIL_WORKERS * 2)))
+
+# Фоновые задачи после записи (таблица jobs): число потоков-исполнителей,
+# период опроса таблицы (секунды), на сколько задача закрепляется за
+# исполнителем (после этого считается брошенной и выполняется снова),
+# число попыток и задержка перед повтором (удваивается, не больше максимума)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "2"))
+JOB_RETRY_MAX_DELAY_SECONDS = float(os.getenv("JOB_RETRY_MAX_DELAY_SECONDS", "600"))
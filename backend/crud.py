@@ -0,0 +1,355 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, func, literal, or_, select, update
+from sqlalchemy.orm import Session, joinedload
+from .database import User, Thread, Message, MessageReply, ArchivedThread
+from . import media, render, replies, search
+from .cache import invalidate_on_commit, THREADS_SCOPE, thread_scope
+
+# Операции с базой данных. Все функции синхронные и принимают обычную
+# сессию: обработчики вызывают их через run_db, который выполняет их
+# либо в пуле потоков, либо через AsyncSession.run_sync
+
+# Колонки, которые отдаются клиентам. Списки выбираются кортежами
+# строк, а не ORM-объектами: без идентификации объектов и отслеживания
+# изменений, и сразу превращаются в словари для сериализации
+THREAD_COLUMNS = (Thread.id, Thread.title, Thread.created_at, Thread.message_count, Thread.bumped_at)
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.thread_id,
+    Message.post_number,
+    Message.content,
+    Message.content_html,
+    Message.render_version,
+    Message.created_at,
+    Message.attachment_count,
+)
+
+# Постраничная выборка по курсору (keyset pagination).
+# Без курсора отдаётся начало списка, after_id - записи после указанного id,
+# before_id - записи перед ним. Страница всегда упорядочена по возрастанию id,
+# а next_cursor указывает, с какого id продолжать в том же направлении.
+def paginate(query, id_column, after_id: Optional[int], before_id: Optional[int], limit: int):
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+    if before_id is not None:
+        rows = query.filter(id_column < before_id).order_by(id_column.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        next_cursor = rows[0].id if has_more and rows else None
+    else:
+        if after_id is not None:
+            query = query.filter(id_column > after_id)
+        rows = query.order_by(id_column).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1].id if has_more and rows else None
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
+
+# Сообщения для ответа клиенту: вложения и HTML текущей версии разметки
+def message_items(db: Session, items: list) -> list:
+    media.attach_to_messages(db, items)
+    return render.refresh_items(items)
+
+# Сортировки списка тредов: по созданию (курсор - id), по последнему
+# сообщению, как на имиджбордах, и по числу сообщений
+THREAD_ORDERS = {
+    "bumped": Thread.bumped_at,
+    "active": Thread.message_count,
+}
+
+# Курсор для сортировок по (ключ, id): значение ключа и id последней записи
+def encode_cursor(key, row_id: int) -> str:
+    value = key.isoformat() if isinstance(key, datetime) else str(key)
+    return f"{value}~{row_id}"
+
+def decode_cursor(cursor: str, key_column):
+    value, row_id = cursor.rsplit("~", 1)
+    if key_column.key == "bumped_at":
+        return datetime.fromisoformat(value), int(row_id)
+    return int(value), int(row_id)
+
+# Постраничная выборка по убыванию (ключ, id). Использует составной индекс
+# (ключ, id), поэтому страница стоит одинаково в любом месте списка.
+# Некорректный курсор приводит к ValueError
+def paginate_by_key(query, key_column, id_column, cursor: Optional[str], limit: int):
+    if cursor is not None:
+        key, row_id = decode_cursor(cursor, key_column)
+        query = query.filter(or_(key_column < key, and_(key_column == key, id_column < row_id)))
+    rows = query.order_by(key_column.desc(), id_column.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, key_column.key), last.id)
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
+
+# Пользователь по почте
+def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    return db.query(User).filter(User.email == email).first()
+
+# Регистрация пользователя с уже вычисленным хэшем пароля
+def create_user(db: Session, email: str, password_hash: str) -> User:
+    db_user = User(email=email, password_hash=password_hash)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+# Замена хэша пароля (при пересчёте с новой стоимостью)
+def update_password_hash(db: Session, user_id: int, password_hash: str):
+    db_user = db.get(User, user_id)
+    db_user.password_hash = password_hash
+    db.commit()
+
+# Тред по id
+def get_thread(db: Session, thread_id: int) -> Optional[Thread]:
+    return db.query(Thread).filter(Thread.id == thread_id).first()
+
+# Валидаторы для условных запросов к сообщениям треда:
+# (message_count, bumped_at, version) или None, если треда нет. Один запрос по первичному ключу;
+# только если тред не найден среди живых, проверяется архив
+def thread_validators(db: Session, thread_id: int):
+    validators = live_thread_validators(db, thread_id)
+    if validators is None:
+        from . import archive
+        validators = archive.thread_validators(db, thread_id)
+    return validators
+
+def live_thread_validators(db: Session, thread_id: int):
+    return db.execute(
+        select(Thread.message_count, Thread.bumped_at, Thread.version).where(Thread.id == thread_id)
+    ).first()
+
+# Валидаторы списка тредов: наибольший id (новые треды), последний бамп
+# (новые сообщения), число активных тредов и время последней архивации
+# (треды, ушедшие в архив). Отдельные подзапросы позволяют взять
+# максимумы из индексов, не просматривая таблицы
+def thread_list_validators(db: Session):
+    return db.execute(
+        select(
+            select(func.max(Thread.id)).scalar_subquery(),
+            select(func.max(Thread.bumped_at)).scalar_subquery(),
+            select(func.count(Thread.id)).scalar_subquery(),
+            select(func.max(ArchivedThread.archived_at)).scalar_subquery(),
+        )
+    ).first()
+
+# Добавление треда без commit: транзакцией управляет вызывающий
+# (create_thread или очередь групповой записи)
+def add_thread(db: Session, title: str) -> Thread:
+    db_thread = Thread(title=title, created_at=datetime.now())
+    db.add(db_thread)
+    db.flush()
+    search.index_thread(db, db_thread)
+    return db_thread
+
+# Создание треда
+def create_thread(db: Session, title: str) -> Thread:
+    db_thread = add_thread(db, title)
+    db.commit()
+    db.refresh(db_thread)
+    return db_thread
+
+# Страница тредов. Для order="created" курсор - after_id/before_id,
+# для "bumped" и "active" - строка cursor из next_cursor предыдущей страницы
+def list_threads(
+    db: Session,
+    after_id: Optional[int],
+    before_id: Optional[int],
+    limit: int,
+    order: str = "created",
+    cursor: Optional[str] = None,
+):
+    query = db.query(*THREAD_COLUMNS)
+    if order == "created":
+        return paginate(query, Thread.id, after_id, before_id, limit)
+    return paginate_by_key(query, THREAD_ORDERS[order], Thread.id, cursor, limit)
+
+# Добавление сообщения без commit. Возвращает None, если треда нет
+# (тогда в базе ничего не изменено). Счётчики треда обновляются в той же
+# транзакции; обновление заодно проверяет, что тред существует, без отдельного
+# SELECT, и возвращает следующий номер сообщения в треде (last_post_number).
+# Ссылки >>N сразу записываются в граф ответов. Строки вложений добавляет
+# вызывающий (media.add_attachments), здесь указывается только их число.
+# Текст размечается в HTML здесь же, один раз на сообщение
+def add_message(db: Session, thread_id: int, content: str, attachment_count: int = 0) -> Optional[Message]:
+    now = datetime.now()
+    post_number = db.execute(
+        update(Thread)
+        .where(Thread.id == thread_id)
+        .values(
+            message_count=Thread.message_count + 1,
+            last_post_number=Thread.last_post_number + 1,
+            bumped_at=now,
+        )
+        .returning(Thread.last_post_number)
+    ).scalar()
+    if post_number is None:
+        return None
+    db_message = Message(
+        thread_id=thread_id,
+        content=content,
+        created_at=now,
+        post_number=post_number,
+        attachment_count=attachment_count,
+        **render.rendered_fields(content),
+    )
+    db.add(db_message)
+    db.flush()
+    search.index_message(db, db_message)
+    replies.index_message(db, db_message)
+    return db_message
+
+# Создание сообщения. Возвращает None, если треда нет
+def create_message(db: Session, thread_id: int, content: str) -> Optional[Message]:
+    db_message = add_message(db, thread_id, content)
+    if db_message is None:
+        db.rollback()
+        return None
+    db.commit()
+    db.refresh(db_message)
+    return db_message
+
+# Страница сообщений треда. Возвращает None, если треда нет.
+# Существование треда проверяется только для пустой страницы:
+# обычно запрос сообщений остаётся единственным. Сообщения
+# архивного треда читаются из архива
+def list_messages(db: Session, thread_id: int, after_id: Optional[int], before_id: Optional[int], limit: int):
+    query = db.query(*MESSAGE_COLUMNS).filter(Message.thread_id == thread_id)
+    page = paginate(query, Message.id, after_id, before_id, limit)
+    if not page["items"] and live_thread_validators(db, thread_id) is None:
+        from . import archive
+        return archive.list_messages(db, thread_id, after_id, before_id, limit)
+    message_items(db, page["items"])
+    return page
+
+# Страница треда: данные треда и первые (или последние при last=True)
+# limit сообщений одним запросом. Сообщения подгружаются через
+# отношение Thread.messages с joinedload, ограниченным подзапросом
+# по id; для одного треда это один JOIN вместо второго запроса
+# selectinload. next_cursor продолжает выборку как в list_messages:
+# after_id для первых сообщений, before_id для последних.
+# Архивный тред читается из архива. Возвращает None, если треда нет
+def get_thread_page(db: Session, thread_id: int, limit: int, last: bool = False):
+    order = Message.id.desc() if last else Message.id
+    # На одно сообщение больше, чтобы понять, есть ли продолжение
+    page_ids = (
+        select(Message.id)
+        .where(Message.thread_id == thread_id)
+        .order_by(order)
+        .limit(limit + 1)
+    )
+    thread = db.execute(
+        select(Thread)
+        .where(Thread.id == thread_id)
+        .options(joinedload(Thread.messages.and_(Message.id.in_(page_ids))))
+        .execution_options(populate_existing=True)
+    ).unique().scalar_one_or_none()
+    if thread is None:
+        from . import archive
+        return archive.get_thread_page(db, thread_id, limit, last)
+    messages = thread.messages
+    has_more = len(messages) > limit
+    if last:
+        messages = messages[-limit:]
+        next_cursor = messages[0].id if has_more else None
+    else:
+        messages = messages[:limit]
+        next_cursor = messages[-1].id if has_more else None
+    items = [{column.key: getattr(m, column.key) for column in MESSAGE_COLUMNS} for m in messages]
+    return {
+        "thread": {column.key: getattr(thread, column.key) for column in THREAD_COLUMNS},
+        "messages": {"items": message_items(db, items), "next_cursor": next_cursor},
+    }
+
+# Ответы на сообщение с номером post_number: прямые (depth=1) или дерево
+# ответов до глубины depth одним рекурсивным запросом по индексу графа.
+# Узел - сообщение, номер сообщения, на которое оно отвечает (reply_to),
+# и глубина; сообщение, отвечающее на несколько узлов дерева, входит в него
+# под каждым. Возвращает None, если нет треда или сообщения с таким номером
+def get_replies(db: Session, thread_id: int, post_number: int, depth: int = 1):
+    tree = (
+        select(
+            MessageReply.source_number.label("number"),
+            MessageReply.target_number.label("reply_to"),
+            literal(1).label("depth"),
+        )
+        .where(MessageReply.thread_id == thread_id, MessageReply.target_number == post_number)
+        .cte("reply_tree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(MessageReply.source_number, MessageReply.target_number, tree.c.depth + 1)
+        .where(
+            MessageReply.thread_id == thread_id,
+            MessageReply.target_number == tree.c.number,
+            tree.c.depth < depth,
+        )
+    )
+    rows = db.execute(
+        select(*MESSAGE_COLUMNS, tree.c.reply_to, tree.c.depth)
+        .join(tree, and_(Message.thread_id == thread_id, Message.post_number == tree.c.number))
+        .order_by(tree.c.depth, tree.c.reply_to, Message.post_number)
+        .limit(replies.MAX_TREE_NODES)
+    ).all()
+    # Без ответов нужно отличить сообщение без ответов от несуществующего:
+    # номера идут с пропусками (удалённые сообщения), поэтому сообщение
+    # ищется по номеру (уникальный индекс), а не сравнивается со счётчиком
+    if not rows and db.execute(
+        select(Message.id).where(Message.thread_id == thread_id, Message.post_number == post_number)
+    ).first() is None:
+        if live_thread_validators(db, thread_id) is None:
+            from . import archive
+            return archive.get_replies(db, thread_id, post_number, depth)
+        return None
+    return {"post_number": post_number, "items": message_items(db, [row._asdict() for row in rows])}
+
+# Ответы на сообщения с номерами от first до last: один проход по индексу
+# графа ответов. Возвращает None, если треда нет
+def list_backlinks(db: Session, thread_id: int, first: int, last: int):
+    pairs = db.execute(
+        select(MessageReply.target_number, MessageReply.source_number)
+        .where(MessageReply.thread_id == thread_id, MessageReply.target_number.between(first, last))
+        .order_by(MessageReply.target_number, MessageReply.source_number)
+    ).all()
+    if not pairs and live_thread_validators(db, thread_id) is None:
+        from . import archive
+        return archive.list_backlinks(db, thread_id, first, last)
+    return {"items": replies.group_backlinks(pairs)}
+
+# Пересчёт счётчиков тредов по таблице messages: число сообщений,
+# последний выданный номер и время бампа. Исправляет только расходящиеся
+# строки, сбрасывает кэш их страниц и возвращает их число
+def repair_thread_counters(db: Session) -> int:
+    actual_count = (
+        select(func.count(Message.id))
+        .where(Message.thread_id == Thread.id)
+        .scalar_subquery()
+    )
+    actual_last_number = func.coalesce(
+        select(func.max(Message.post_number))
+        .where(Message.thread_id == Thread.id)
+        .scalar_subquery(),
+        0,
+    )
+    actual_bump = func.coalesce(
+        select(func.max(Message.created_at))
+        .where(Message.thread_id == Thread.id)
+        .scalar_subquery(),
+        Thread.created_at,
+    )
+    repaired = db.execute(
+        update(Thread)
+        .where(or_(
+            Thread.message_count != actual_count,
+            Thread.last_post_number != actual_last_number,
+            Thread.bumped_at.is_(None),
+            Thread.bumped_at != actual_bump,
+        ))
+        .values(message_count=actual_count, last_post_number=actual_last_number, bumped_at=actual_bump)
+        .returning(Thread.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    invalidate_on_commit(db, THREADS_SCOPE, *(thread_scope(thread_id) for thread_id in repaired))
+    db.commit()
+    return len(repaired)
@@ -1,20 +1,164 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Index, LargeBinary, DDL, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
-import os
+from contextlib import asynccontextmanager
+import time
+from .config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    SQLITE_MMAP_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+)
+from .metrics import observe_pool_wait
+
+# Асинхронный режим включается драйвером в DATABASE_URL,
+# например sqlite+aiosqlite:// или postgresql+asyncpg://
+IS_ASYNC = make_url(DATABASE_URL).get_dialect().is_async
+
+# Пулы, которые замеряют ожидание свободного соединения
+class TimedQueuePool(QueuePool):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            observe_pool_wait(time.perf_counter() - started)
 
-# Настройка подключения к базе данных
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hse_forum.db")
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            observe_pool_wait(time.perf_counter() - started)
 
 # Создание движка базы данных
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+def create_db_engine(url, is_async: bool = False):
+    url = make_url(url)
+    is_sqlite = url.get_backend_name() == "sqlite"
+    # База в памяти живёт в одном соединении, пул для неё не настраивается
+    in_memory = is_sqlite and url.database in (None, "", ":memory:")
+    options = {}
+    if not in_memory:
+        options.update(
+            poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=not is_sqlite,
+        )
+    factory = create_async_engine if is_async else create_engine
+    db_engine = factory(
+        url,
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+        **options,
+    )
+    if is_sqlite:
+        @event.listens_for(db_engine.sync_engine if is_async else db_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # WAL: читатели не блокируются единственным писателем
+            if not in_memory:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.close()
+    return db_engine
+
+# Синхронный движок нужен всегда: им пользуются init_db, консольные команды
+# и тесты. В асинхронном режиме он подключается к той же базе обычным драйвером
+if IS_ASYNC:
+    async_url = make_url(DATABASE_URL)
+    engine = create_db_engine(async_url.set(drivername=async_url.get_backend_name()))
+    async_engine = create_db_engine(async_url, is_async=True)
+else:
+    engine = create_db_engine(DATABASE_URL)
+    async_engine = None
+
+# Движок, через который идут запросы обработчиков
+request_engine = async_engine.sync_engine if IS_ASYNC else engine
 
 # Создание сессии для работы с базой данных
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if IS_ASYNC else None
+)
+
+# Зависимость FastAPI: одна сессия на запрос. FastAPI кэширует зависимости
+# в пределах запроса, поэтому авторизация и обработчик получают одну и ту же
+# сессию, а по завершении запроса соединение возвращается в пул
+if IS_ASYNC:
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+else:
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+# Сессия вне зависимостей FastAPI, например для потоковых ответов,
+# которые продолжают работать после завершения обработчика
+@asynccontextmanager
+async def session_scope():
+    if IS_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+# Выполнение синхронной функции fn(session, *args) с сессией запроса.
+# С AsyncSession код выполняется через run_sync поверх асинхронного драйвера,
+# с обычной сессией - в пуле потоков. Так одни и те же функции из crud.py
+# обслуживают оба режима, не блокируя цикл событий.
+# После вызова сессия закрывается и соединение возвращается в пул (сессией
+# можно пользоваться дальше, загруженные объекты сохраняют значения).
+# Иначе запрос держал бы соединение, пока ждёт свободный поток, а потоки -
+# свободное соединение: при сотне параллельных запросов пул и пул потоков
+# блокировали бы друг друга до таймаута
+async def run_db(db, fn, *args):
+    if isinstance(db, AsyncSession):
+        try:
+            return await db.run_sync(fn, *args)
+        finally:
+            await db.close()
+    return await run_in_threadpool(run_and_release, db, fn, *args)
+
+def run_and_release(db, fn, *args):
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+# Текущая загрузка пула соединений, обслуживающего запросы
+def pool_stats(db_engine=None) -> dict:
+    pool = (db_engine or request_engine).pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+    }
 
 # Базовый класс для моделей
 Base = declarative_base()
@@ -33,6 +177,26 @@ class Thread(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.now)
+    # Счётчики активности ведёт create_message в той же транзакции,
+    # что и вставка сообщения: число сообщений и время последнего "бампа"
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    bumped_at = Column(DateTime, default=datetime.now)
+    # Последний выданный номер сообщения. Отдельно от message_count:
+    # число сообщений может уменьшиться, а номера не выдаются повторно
+    last_post_number = Column(Integer, nullable=False, default=0, server_default="0")
+    # Версия треда для валидаторов: растёт, когда сообщения треда меняются
+    # без новых сообщений (например, готова миниатюра вложения)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Сообщения треда по возрастанию id. Загружаются только явно
+    # (joinedload/selectinload в crud), ленивая загрузка запрещена,
+    # чтобы случайный доступ не превращался в лишние запросы
+    messages = relationship("Message", back_populates="thread", order_by="Message.id", lazy="raise")
+
+    # Индексы для сортировки "по бампу" и "самые активные" с курсором по id
+    __table_args__ = (
+        Index("ix_threads_bumped_at_id", "bumped_at", "id"),
+        Index("ix_threads_message_count_id", "message_count", "id"),
+    )
 
 # Модель сообщения
 class Message(Base):
@@ -41,10 +205,183 @@ class Message(Base):
     thread_id = Column(Integer, ForeignKey("threads.id"))
     content = Column(String)
     created_at = Column(DateTime, default=datetime.now)
+    # Номер сообщения в треде (1, 2, ...), на него ссылаются ответы >>N.
+    # Выдаётся при вставке из счётчика last_post_number треда
+    post_number = Column(Integer)
+    # Число вложений: страницы без вложений не запрашивают таблицу attachments
+    attachment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Текст, размеченный в HTML при записи (render.py), и версия разметки:
+    # сообщения со старой версией размечаются заново
+    content_html = Column(String)
+    render_version = Column(Integer)
+    thread = relationship("Thread", back_populates="messages", lazy="raise")
+
+    # Составной индекс для постраничной выборки сообщений треда по курсору
+    # и уникальный индекс для поиска сообщения по номеру в треде
+    __table_args__ = (
+        Index("ix_messages_thread_id_id", "thread_id", "id"),
+        Index("ix_messages_thread_id_post_number", "thread_id", "post_number", unique=True),
+    )
+
+# Ответ одного сообщения треда на другое (ссылка >>N в тексте).
+# Ссылки разбираются при записи сообщения, поэтому ответы на сообщение
+# выбираются по индексу (thread_id, target_number), без просмотра текстов
+class MessageReply(Base):
+    __tablename__ = "message_replies"
+    id = Column(Integer, primary_key=True)
+    thread_id = Column(Integer, ForeignKey("threads.id"), nullable=False)
+    source_number = Column(Integer, nullable=False)
+    target_number = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_message_replies_target", "thread_id", "target_number", "source_number", unique=True),
+    )
+
+# Вложение сообщения. Файл хранится по SHA-256 содержимого, поэтому
+# одинаковые файлы из разных сообщений лежат на диске один раз.
+# thumbnail_status - "pending", пока миниатюра строится, затем "ready"
+# или "failed"; размеры изображения известны после построения миниатюры
+class Attachment(Base):
+    __tablename__ = "attachments"
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
+    thread_id = Column(Integer, ForeignKey("threads.id"), nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    extension = Column(String(8), nullable=False)
+    content_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    name = Column(String)
+    width = Column(Integer)
+    height = Column(Integer)
+    thumbnail_status = Column(String(8), nullable=False, default="pending")
+
+    __table_args__ = (
+        Index("ix_attachments_message_id", "message_id"),
+    )
+
+# Условие частичного индекса ждущих задач (он же - цель ON CONFLICT в jobs.py)
+QUEUED_JOB = text("status = 'queued'")
+
+# Фоновая задача (jobs.py). Добавляется в транзакции записи, которая её
+# породила, и удаляется после выполнения. key - ключ объединения:
+# пока задача с этим ключом ждёт в очереди, такая же не добавляется.
+# status - "queued", "running" (закреплена за исполнителем до locked_until)
+# или "failed" (попытки исчерпаны, строка остаётся для разбора)
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    key = Column(String)
+    payload = Column(String, nullable=False, default="{}")
+    status = Column(String(8), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False, default=datetime.now)
+    locked_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.now)
+    last_error = Column(String)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+        Index("ix_jobs_key_status", "key", "status"),
+        # Одна ждущая задача на ключ: одинаковые задачи, добавленные
+        # параллельно, объединяются на вставке (см. JobQueue.enqueue)
+        Index(
+            "ix_jobs_key_queued", "key", unique=True,
+            sqlite_where=QUEUED_JOB, postgresql_where=QUEUED_JOB,
+        ),
+    )
+
+# Архивный тред: данные треда и все его сообщения одним сжатым JSON
+# (zlib). Мёртвые треды уходят сюда из threads и messages, чтобы горячие
+# таблицы и их индексы оставались небольшими; id совпадает с id треда
+class ArchivedThread(Base):
+    __tablename__ = "archived_threads"
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    created_at = Column(DateTime)
+    message_count = Column(Integer, nullable=False, default=0)
+    bumped_at = Column(DateTime)
+    # Индекс нужен для валидатора списка тредов (время последней архивации)
+    archived_at = Column(DateTime, default=datetime.now, index=True)
+    payload = Column(LargeBinary, nullable=False)
+
+    # Индексы для списка архива в тех же сортировках, что и список тредов
+    __table_args__ = (
+        Index("ix_archived_threads_bumped_at_id", "bumped_at", "id"),
+        Index("ix_archived_threads_message_count_id", "message_count", "id"),
+    )
+
+# Полнотекстовый индекс по названиям тредов и текстам сообщений (SQLite FTS5).
+# kind - "thread" или "message"; служебные колонки не индексируются.
+search_index_ddl = DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "body, kind UNINDEXED, thread_id UNINDEXED, message_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+event.listen(Base.metadata, "after_create", search_index_ddl.execute_if(dialect="sqlite"))
 
 # Создание всех таблиц в базе данных
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all пропускает уже существующие таблицы вместе с их индексами,
+    # поэтому новые колонки и индексы досоздаём отдельно
+    added_columns = set()
+    with engine.begin() as conn:
+        ddl_compiler = conn.dialect.ddl_compiler(conn.dialect, None)
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN "
+                        f"{ddl_compiler.get_column_specification(column)}"
+                    ))
+                    added_columns.add(f"{table.name}.{column.name}")
+            # Ждущие задачи с одинаковым ключом из старой базы объединяем,
+            # иначе уникальный индекс по ключу не создастся
+            if table.name == "jobs" and "ix_jobs_key_queued" not in {
+                index["name"] for index in inspector.get_indexes("jobs")
+            }:
+                conn.execute(text(
+                    "DELETE FROM jobs WHERE status = 'queued' AND key IS NOT NULL AND id NOT IN "
+                    "(SELECT min(id) FROM jobs WHERE status = 'queued' AND key IS NOT NULL GROUP BY key)"
+                ))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    # Счётчики тредов в старой базе заполняем по сообщениям
+    if added_columns & {"threads.message_count", "threads.bumped_at"}:
+        from .crud import repair_thread_counters
+        db = SessionLocal()
+        try:
+            repair_thread_counters(db)
+        finally:
+            db.close()
+    # Номера сообщений и граф ответов в старой базе строим по текстам,
+    # счётчик номеров тредов - по уже выданным номерам
+    if "messages.post_number" in added_columns:
+        from .replies import rebuild_reply_graph
+        db = SessionLocal()
+        try:
+            rebuild_reply_graph(db)
+        finally:
+            db.close()
+    elif "threads.last_post_number" in added_columns:
+        from .replies import sync_last_post_numbers
+        db = SessionLocal()
+        try:
+            sync_last_post_numbers(db)
+            db.commit()
+        finally:
+            db.close()
+    # Старые сообщения размечаем в HTML
+    if "messages.content_html" in added_columns:
+        from .render import rerender_messages
+        db = SessionLocal()
+        try:
+            rerender_messages(db)
+        finally:
+            db.close()
 
 # Функция для получения тестовой базы данных
 def get_test_db():
@@ -0,0 +1,57 @@
+import asyncio
+from typing import AsyncIterator, Callable, Optional
+from .broadcast import broadcaster
+from .serialization import dumps
+from .config import EVENTS_HEARTBEAT_SECONDS
+
+# Форматирование события в формате Server-Sent Events
+def format_event(kind: str, event_id: int, data) -> str:
+    payload = dumps(data).decode()
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+# Поток событий темы для StreamingResponse.
+# Подписка оформляется до догрузки, поэтому между догрузкой и живыми
+# событиями нет пропусков. Если клиент передал Last-Event-ID, сначала
+# отдаются все записи после него: backfill(after_id) перечисляет их как
+# (тип, id, данные). Живые события с id не больше последнего догруженного
+# уже отправлены догрузкой и пропускаются. Сами живые события между собой
+# не сравниваются: параллельные записи публикуются после commit в любом
+# порядке, и событие с меньшим id может прийти позже большего
+async def event_stream(
+    topic: str,
+    last_event_id: Optional[int],
+    backfill: Callable[[int], AsyncIterator[tuple]],
+):
+    subscription = broadcaster.subscribe(topic)
+    try:
+        backfilled = last_event_id or 0
+        if last_event_id is not None:
+            async for kind, event_id, data in backfill(last_event_id):
+                yield format_event(kind, event_id, data)
+                backfilled = max(backfilled, event_id)
+        while True:
+            try:
+                event = await subscription.get(EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is None:
+                # Подписчик не успевал читать и был отключён:
+                # клиент переподключится с Last-Event-ID
+                yield "event: evicted\ndata: {}\n\n"
+                return
+            kind, event_id, data = event
+            if event_id <= backfilled:
+                continue
+            yield format_event(kind, event_id, data)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+# Разбор Last-Event-ID (или эквивалентного параметра запроса)
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
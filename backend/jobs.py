@@ -0,0 +1,304 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import and_, delete, event, exists, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+from .config import (
+    JOB_WORKERS,
+    JOB_POLL_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_DELAY_SECONDS,
+    JOB_RETRY_MAX_DELAY_SECONDS,
+)
+from .database import QUEUED_JOB, Job, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Фоновые задачи после записи: построение миниатюр и другая работа,
+# которую не нужно делать, пока клиент ждёт ответа.
+#
+# Задача - строка таблицы jobs, добавленная в той же транзакции, что и
+# породившая её запись: если запись откатилась, задачи тоже нет, а после
+# commit задача переживёт перезапуск сервера. Исполнители - потоки
+# процесса; они запускаются при первой задаче и будятся после commit,
+# а задачи из других процессов и отложенные повторы находят опросом
+# раз в JOB_POLL_SECONDS.
+#
+# Доставка "хотя бы один раз": задача удаляется после выполнения, а
+# задача, которую исполнитель не завершил за JOB_LEASE_SECONDS (например,
+# процесс упал), выполняется снова. Поэтому обработчики должны быть
+# идемпотентными. Обработчик может не делать commit сам: его изменения
+# фиксируются вместе с удалением задачи.
+# Ошибка обработчика - повтор с удваивающейся задержкой; после
+# JOB_MAX_ATTEMPTS попыток задача остаётся со статусом failed
+
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+# Длина сохраняемого текста ошибки
+MAX_ERROR_LENGTH = 1000
+
+class JobQueue:
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_delay: float = JOB_RETRY_DELAY_SECONDS,
+        retry_max_delay: float = JOB_RETRY_MAX_DELAY_SECONDS,
+    ):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        # Исполнитель берёт только задачи тех видов, для которых у него есть обработчик
+        self.handlers = {}
+        self._on_failure = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self.completed = 0
+        self.retried = 0
+        self.coalesced = 0
+
+    # Регистрация обработчика: fn(session, **payload). on_failure(session, **payload)
+    # вызывается, когда попытки исчерпаны
+    def handler(self, kind: str, on_failure: Optional[Callable] = None):
+        def register(fn):
+            self.handlers[kind] = fn
+            if on_failure is not None:
+                self._on_failure[kind] = on_failure
+            return fn
+        return register
+
+    # Добавление задачи без commit: транзакцией управляет вызывающий.
+    # Если задача с тем же key уже ждёт в очереди (в базе или в этой
+    # транзакции), новая не добавляется. Возвращает, добавлена ли задача.
+    # Задача, которая уже выполняется, не объединяется с новой: она могла
+    # прочитать данные до этой записи
+    def enqueue(self, db: Session, kind: str, key: Optional[str] = None, delay: float = 0, **payload) -> bool:
+        values = dict(
+            kind=kind,
+            key=key,
+            payload=json.dumps(payload),
+            status=QUEUED,
+            run_at=datetime.now() + timedelta(seconds=delay),
+        )
+        if key is None:
+            db.add(Job(**values))
+        else:
+            keys = db.info.setdefault("job_keys", set())
+            if key in keys or not insert_unique(db, values):
+                with self._lock:
+                    self.coalesced += 1
+                return False
+            keys.add(key)
+        db.info.setdefault("job_queues", set()).add(self)
+        return True
+
+    # Разбудить исполнителей (после commit с новыми задачами)
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        with self._lock:
+            self._stopping = False
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"jobs-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # Остановка исполнителей: текущие задачи дорабатывают, не больше timeout секунд
+    def stop(self, timeout: float = 5):
+        with self._lock:
+            self._stopping = True
+            threads, self._threads = self._threads, []
+        self._wakeup.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Ошибка исполнителя фоновых задач")
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    # Закрепление одной готовой задачи за исполнителем. Сначала кандидат
+    # ищется чтением, чтобы простаивающие исполнители не брали блокировку
+    # записи; условие повторяется в UPDATE, поэтому задачу, которую успел
+    # взять другой исполнитель, второй не получит
+    def claim(self, db: Session):
+        if not self.handlers:
+            return None
+        now = datetime.now()
+        ready = and_(
+            Job.kind.in_(list(self.handlers)),
+            or_(
+                and_(Job.status == QUEUED, Job.run_at <= now),
+                and_(Job.status == RUNNING, Job.locked_until < now),
+            ),
+        )
+        candidate = db.execute(select(Job.id).where(ready).order_by(Job.run_at, Job.id).limit(1)).scalar()
+        if candidate is None:
+            db.rollback()
+            return None
+        job = db.execute(
+            update(Job)
+            .where(Job.id == candidate, ready)
+            .values(
+                status=RUNNING,
+                attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=self.lease_seconds),
+            )
+            .returning(Job.id, Job.kind, Job.key, Job.payload, Job.attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.commit()
+        return job
+
+    # Выполнение одной готовой задачи в этом потоке.
+    # Возвращает False, если готовых задач нет
+    def run_once(self) -> bool:
+        db = SessionLocal()
+        try:
+            job = self.claim(db)
+            if job is None:
+                return False
+            payload = json.loads(job.payload)
+            try:
+                self.handlers[job.kind](db, **payload)
+                db.execute(delete(Job).where(Job.id == job.id))
+                db.commit()
+            except Exception as error:
+                db.rollback()
+                logger.exception("Ошибка фоновой задачи %s #%s (попытка %s)", job.kind, job.id, job.attempts)
+                self._failed(db, job, payload, error)
+            else:
+                with self._lock:
+                    self.completed += 1
+            return True
+        finally:
+            db.close()
+
+    # Задержка перед повтором после attempts неудачных попыток
+    def retry_delay_for(self, attempts: int) -> float:
+        return min(self.retry_delay * 2 ** (attempts - 1), self.retry_max_delay)
+
+    def _failed(self, db: Session, job, payload: dict, error: Exception):
+        message = f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH]
+        if job.attempts >= self.max_attempts:
+            db.execute(
+                update(Job).where(Job.id == job.id)
+                .values(status=FAILED, locked_until=None, last_error=message)
+            )
+            on_failure = self._on_failure.get(job.kind)
+            if on_failure is not None:
+                try:
+                    on_failure(db, **payload)
+                except Exception:
+                    logger.exception("Ошибка обработки отказа задачи %s #%s", job.kind, job.id)
+        elif not self._requeue(db, job, message):
+            # Пока задача выполнялась, в очередь встала такая же - повтор не нужен
+            db.execute(delete(Job).where(Job.id == job.id))
+        else:
+            with self._lock:
+                self.retried += 1
+        db.commit()
+
+    # Возврат задачи в очередь для повтора. Если такая же задача уже ждёт,
+    # UPDATE ничего не меняет; если её добавили параллельно, вернувшаяся
+    # задача нарушила бы уникальный индекс - в обоих случаях возвращается False
+    def _requeue(self, db: Session, job, message: str) -> bool:
+        waiting = aliased(Job)
+        statement = (
+            update(Job)
+            .where(
+                Job.id == job.id,
+                ~exists().where(waiting.key == job.key, waiting.status == QUEUED),
+            )
+            .values(
+                status=QUEUED,
+                locked_until=None,
+                last_error=message,
+                run_at=datetime.now() + timedelta(seconds=self.retry_delay_for(job.attempts)),
+            )
+        )
+        try:
+            return db.execute(statement).rowcount == 1
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    # Глубина очереди по статусам и задержка: сколько ждёт самая старая
+    # из готовых к выполнению задач
+    def stats(self) -> dict:
+        now = datetime.now()
+        db = SessionLocal()
+        try:
+            counts = dict(db.execute(select(Job.status, func.count(Job.id)).group_by(Job.status)).all())
+            oldest = db.execute(
+                select(func.min(Job.run_at)).where(Job.status == QUEUED, Job.run_at <= now)
+            ).scalar()
+        finally:
+            db.close()
+        with self._lock:
+            return {
+                "workers": sum(thread.is_alive() for thread in self._threads),
+                "queued": counts.get(QUEUED, 0),
+                "running": counts.get(RUNNING, 0),
+                "failed": counts.get(FAILED, 0),
+                "lag_seconds": (now - oldest).total_seconds() if oldest else 0.0,
+                "completed": self.completed,
+                "retried": self.retried,
+                "coalesced": self.coalesced,
+            }
+
+# Вставка задачи с ключом, если задачи с таким ключом ещё нет в очереди.
+# Проверка и вставка - один INSERT ... ON CONFLICT DO NOTHING по частичному
+# уникальному индексу ix_jobs_key_queued, поэтому одинаковые задачи из
+# параллельных транзакций не дублируются. В других базах нарушение индекса
+# ловится в точке сохранения. Возвращает, вставлена ли задача
+def insert_unique(db: Session, values: dict) -> bool:
+    dialects = {"sqlite": sqlite, "postgresql": postgresql}
+    dialect = dialects.get(db.get_bind().dialect.name)
+    if dialect is not None:
+        statement = dialect.insert(Job).values(**values).on_conflict_do_nothing(
+            index_elements=[Job.key], index_where=QUEUED_JOB,
+        )
+        return db.execute(statement).rowcount == 1
+    try:
+        with db.begin_nested():
+            db.add(Job(**values))
+    except IntegrityError:
+        return False
+    return True
+
+# Исполнители будятся только после commit: до него задачи не видны
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session):
+    session.info.pop("job_keys", None)
+    for queue in session.info.pop("job_queues", ()):
+        queue.notify()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("job_keys", None)
+    session.info.pop("job_queues", None)
+
+job_queue = JobQueue()
@@ -1,18 +1,84 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import datetime
-from pydantic import BaseModel, EmailStr
-from .database import SessionLocal, User, Thread, Message
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from .database import get_db, run_db, session_scope, pool_stats, init_db, engine, request_engine
+from . import archive, bulk, crud, media, metrics, render, replicas, replies, search
+from .replicas import get_read_db, is_replica
+from .config import ARCHIVE_INTERVAL_SECONDS, MAX_ATTACHMENT_BYTES, MAX_ATTACHMENTS, WRITE_QUEUE_ENABLED
+from .write_queue import write_queue
+from .jobs import job_queue
+from .broadcast import broadcaster, thread_topic, THREADS_TOPIC
+from .events import event_stream, parse_last_event_id
+from .conditional import (
+    conditional_json_response,
+    http_date,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    stamp,
+    validator_headers,
+)
+from .cache import response_cache, thread_scope as thread_cache_scope, ARCHIVE_SCOPE, THREADS_SCOPE
 from .auth import (
-    get_password_hash,
-    verify_password,
     create_access_token,
     get_current_user,
     authenticate_user,
+    run_password_job,
+    token_cache,
+)
+from .passwords import hash_password
+from .auth_cache import CurrentUser
+from .serialization import FastJSONResponse, dumps
+from .schemas import (
+    UserCreate,
+    ThreadCreate,
+    MessageCreate,
+    ThreadResponse,
+    MessageResponse,
+    ThreadPage,
+    MessagePage,
+    ThreadPageResponse,
+    RepliesResponse,
+    BacklinksResponse,
+    BulkMessagesCreate,
+    BulkMessagesResponse,
+    SearchPage,
+    RegisterResponse,
+    TokenResponse,
 )
 
-app = FastAPI()
+# Размер страницы по умолчанию и максимально допустимый
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+init_db()
+
+# Фоновые задачи на время работы приложения: архивация мёртвых тредов
+# и исполнители очереди задач (задачи, оставшиеся с прошлого запуска,
+# выполняются сразу)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    archiver = asyncio.create_task(archive.run_archiver()) if ARCHIVE_INTERVAL_SECONDS > 0 else None
+    async with session_scope() as db:
+        await run_db(db, media.resume_pending)
+    job_queue.start()
+    yield
+    if archiver is not None:
+        archiver.cancel()
+    await run_in_threadpool(job_queue.stop)
+    media.thumbnail_pool.shutdown(wait=False)
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # Настройка CORS
 app.add_middleware(
@@ -23,43 +89,58 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешить все заголовки
 )
 
-# Модели Pydantic
-class UserCreate(BaseModel):
-    email: EmailStr
-    password: str
+# Метрики производительности: задержки по маршрутам, SQL на запрос,
+# ожидание пула; медленные запросы пишутся в журнал
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(request_engine)
+metrics.instrument_engine(engine)
+for replica_engine in replicas.read_router.engines:
+    metrics.instrument_engine(getattr(replica_engine, "sync_engine", replica_engine))
 
-class ThreadCreate(BaseModel):
-    title: str
+# Клиент, который только что писал, какое-то время читает из основной базы
+app.add_middleware(replicas.ReadYourWritesMiddleware)
 
-class MessageCreate(BaseModel):
-    content: str
+# Проверка курсоров постраничной выборки
+def check_cursors(after_id: Optional[int], before_id: Optional[int]):
+    if after_id is not None and before_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя указывать after_id и before_id одновременно",
+        )
+
+# Сериализация страницы, сохранение её в кэш ответов и отправка клиенту.
+# Страница состоит из словарей, выбранных из базы по колонкам схемы ответа,
+# поэтому она кодируется напрямую, минуя повторную проверку моделью.
+# Страницы, прочитанные с реплики, в кэш не кладутся
+def cache_page(request: Request, db, cached, etag: str, last_modified, page) -> Response:
+    body = dumps(page)
+    last_modified = http_date(last_modified) if last_modified is not None else None
+    if not is_replica(db):
+        response_cache.store(cached, etag, last_modified, body)
+    return conditional_json_response(request, etag, last_modified, body)
 
 # Регистрация пользователя
-@app.post("/register")
-def register(user: UserCreate):
-    db = SessionLocal()
+@app.post("/register", response_model=RegisterResponse)
+async def register(user: UserCreate, db: Session = Depends(get_db)):
     if not str(user.email).endswith("@edu.hse.ru"):  # Преобразуем EmailStr в строку
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Только почты @edu.hse.ru разрешены",
         )
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await run_db(db, crud.get_user_by_email, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Почта уже зарегистрирована",
         )
-    hashed_password = get_password_hash(user.password)
-    db_user = User(email=user.email, password_hash=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    hashed_password = await run_password_job(hash_password, user.password)
+    await run_db(db, crud.create_user, user.email, hashed_password)
     return {"message": "Пользователь зарегистрирован"}
 
 # Вход пользователя
-@app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+@app.post("/login", response_model=TokenResponse)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,47 +151,440 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Создание треда (только для аутентифицированных пользователей)
-@app.post("/threads")
-def create_thread(thread: ThreadCreate, current_user: User = Depends(get_current_user)):
-    db = SessionLocal()
-    db_thread = Thread(title=thread.title, created_at=datetime.now())
-    db.add(db_thread)
-    db.commit()
-    db.refresh(db_thread)
-    return db_thread
-
-# Получение всех тредов
-@app.get("/threads")
-def get_threads():
-    db = SessionLocal()
-    threads = db.query(Thread).all()
-    return threads
+@app.post("/threads", response_model=ThreadResponse)
+async def create_thread(
+    thread: ThreadCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if WRITE_QUEUE_ENABLED:
+        payload = await write_queue.submit(thread_payload, thread.title)
+    else:
+        db_thread = await run_db(db, crud.create_thread, thread.title)
+        payload = ThreadResponse.model_validate(db_thread).model_dump()
+    broadcaster.publish(THREADS_TOPIC, ("thread", payload["id"], payload))
+    return payload
+
+# Операции для очереди групповой записи: ответ собирается до commit,
+# пока атрибуты объектов не истекли
+def thread_payload(db: Session, title: str) -> dict:
+    return ThreadResponse.model_validate(crud.add_thread(db, title)).model_dump()
+
+def message_payload(db: Session, thread_id: int, content: str, files: list = ()) -> Optional[dict]:
+    db_message = crud.add_message(db, thread_id, content, len(files))
+    if db_message is None:
+        return None
+    payload = MessageResponse.model_validate(db_message).model_dump()
+    payload["attachments"] = media.add_attachments(db, db_message, files)
+    return payload
+
+# Создание сообщения без очереди записи: своя транзакция на запрос
+def create_message_payload(db: Session, thread_id: int, content: str, files: list) -> Optional[dict]:
+    payload = message_payload(db, thread_id, content, files)
+    if payload is None:
+        db.rollback()
+    else:
+        db.commit()
+    return payload
+
+# Получение тредов (постранично).
+# order=created - по созданию, bumped - по последнему сообщению,
+# active - по числу сообщений. Для bumped и active страницы листаются
+# параметром cursor из next_cursor. archived=true - список архивных тредов
+@app.get("/threads", response_model=ThreadPage)
+async def get_threads(
+    request: Request,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["created", "bumped", "active"] = "created",
+    cursor: Optional[str] = None,
+    archived: bool = False,
+    db: Session = Depends(get_read_db),
+):
+    check_cursors(after_id, before_id)
+    if order != "created" and (after_id is not None or before_id is not None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Для этой сортировки используйте параметр cursor",
+        )
+    if cursor is not None and order != "created":
+        try:
+            crud.decode_cursor(cursor, crud.THREAD_ORDERS[order])
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Некорректный курсор",
+            )
+    params = f"{order}:{after_id}:{before_id}:{cursor}:{limit}"
+    if archived:
+        return await get_archived_threads(request, db, params, after_id, before_id, limit, order, cursor)
+    # Готовая страница из кэша отдаётся без обращения к базе
+    cached = response_cache.lookup(THREADS_SCOPE, params)
+    if cached.value is not None:
+        return conditional_json_response(request, *cached.value)
+    # Клиенту, у которого список уже актуален, отвечаем 304 без выборки тредов
+    max_id, last_bump, live_count, last_archived = await run_db(db, crud.thread_list_validators)
+    etag = make_etag("threads", max_id or 0, live_count, stamp(last_bump), stamp(last_archived))
+    last_modified = max(filter(None, (last_bump, last_archived)), default=None)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(validator_headers(etag, last_modified))
+    page = await run_db(db, crud.list_threads, after_id, before_id, limit, order, cursor)
+    return cache_page(request, db, cached, etag, last_modified, page)
+
+# Список архивных тредов: тот же кэш и условные запросы, что у живых,
+# в своей области кэша, которую сбрасывает архивация
+async def get_archived_threads(request: Request, db, params: str, after_id, before_id, limit: int, order: str, cursor):
+    cached = response_cache.lookup(ARCHIVE_SCOPE, params)
+    if cached.value is not None:
+        return conditional_json_response(request, *cached.value)
+    max_id, last_archived = await run_db(db, archive.thread_list_validators)
+    etag = make_etag("archive", max_id or 0, stamp(last_archived))
+    if is_not_modified(request, etag, last_archived):
+        return not_modified_response(validator_headers(etag, last_archived))
+    page = await run_db(db, archive.list_threads, after_id, before_id, limit, order, cursor)
+    return cache_page(request, db, cached, etag, last_archived, page)
 
 # Создание сообщения (только для аутентифицированных пользователей)
-@app.post("/threads/{thread_id}/messages")
-def create_message(thread_id: int, message: MessageCreate, current_user: User = Depends(get_current_user)):
-    db = SessionLocal()
-    db_thread = db.query(Thread).filter(Thread.id == thread_id).first()
-    if not db_thread:
+@app.post("/threads/{thread_id}/messages", response_model=MessageResponse)
+async def create_message(
+    request: Request,
+    thread_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    # Файлы пишутся на диск ещё до вставки сообщения, поэтому тред
+    # проверяется заранее: в несуществующий тред вложения не сохраняются
+    if is_multipart(request) and await run_db(db, crud.live_thread_validators, thread_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Тред не найден",
+        )
+    content, files = await read_message_body(request)
+    if WRITE_QUEUE_ENABLED:
+        payload = await write_queue.submit(message_payload, thread_id, content, files)
+    else:
+        payload = await run_db(db, create_message_payload, thread_id, content, files)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Тред не найден",
         )
-    db_message = Message(thread_id=thread_id, content=message.content, created_at=datetime.now())
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
-    return db_message
+    broadcaster.publish(thread_topic(thread_id), ("message", payload["id"], payload))
+    return payload
+
+# Наибольший размер тела запроса с вложениями: файлы и поля формы
+MAX_UPLOAD_BYTES = MAX_ATTACHMENT_BYTES * MAX_ATTACHMENTS + 1024 * 1024
+
+def is_multipart(request: Request) -> bool:
+    return request.headers.get("content-type", "").startswith("multipart/form-data")
+
+# Тело запроса на создание сообщения: JSON {"content": ...} или
+# multipart/form-data с полем content и файлами files.
+# Файлы пишутся на диск пачками по мере чтения (media.store_upload).
+# Возвращает (текст, [поля вложений])
+async def read_message_body(request: Request) -> tuple:
+    if not is_multipart(request):
+        try:
+            message = MessageCreate.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+            )
+        return message.content, []
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Слишком большой запрос",
+        )
+    async with request.form(max_files=MAX_ATTACHMENTS, max_fields=10) as form:
+        content = form.get("content") or ""
+        if not isinstance(content, str):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Поле content должно быть текстом",
+            )
+        files = []
+        for upload in form.getlist("files"):
+            if not isinstance(upload, UploadFile):
+                continue
+            if upload.size == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Пустой файл",
+                )
+            try:
+                files.append(await run_in_threadpool(media.store_upload, upload.file, upload.filename))
+            except media.UploadError as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return content, files
+
+# Массовая загрузка сообщений в разные треды одним запросом.
+# Ошибки (несуществующий тред) возвращаются по каждому элементу,
+# остальные сообщения вставляются. Подписчикам потока событий
+# импортированные сообщения не рассылаются
+@app.post("/messages/bulk", response_model=BulkMessagesResponse)
+async def create_messages_bulk(
+    payload: BulkMessagesCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    items = [item.model_dump() for item in payload.items]
+    return await run_db(db, bulk.insert_messages, items)
 
-# Получение сообщений в треде
-@app.get("/threads/{thread_id}/messages")
-def get_messages(thread_id: int):
-    db = SessionLocal()
-    db_thread = db.query(Thread).filter(Thread.id == thread_id).first()
-    if not db_thread:
+# Получение сообщений в треде (постранично)
+@app.get("/threads/{thread_id}/messages", response_model=MessagePage)
+async def get_messages(
+    request: Request,
+    thread_id: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    check_cursors(after_id, before_id)
+    # Готовая страница из кэша отдаётся без обращения к базе. Версия
+    # разметки входит в ключ и в ETag: после её смены страницы с прежним
+    # HTML не отдаются ни из кэша, ни по 304
+    cached = response_cache.lookup(
+        thread_cache_scope(thread_id), f"r{render.RENDER_VERSION}:{after_id}:{before_id}:{limit}"
+    )
+    if cached.value is not None:
+        return conditional_json_response(request, *cached.value)
+    validators = await run_db(db, crud.thread_validators, thread_id)
+    if validators is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Тред не найден",
         )
-    messages = db.query(Message).filter(Message.thread_id == thread_id).all()
-    return messages
\ No newline at end of file
+    # Клиенту, у которого страница уже актуальна, отвечаем 304 без выборки сообщений
+    message_count, bumped_at, version = validators
+    etag = make_etag("thread", thread_id, message_count, version, render.RENDER_VERSION, stamp(bumped_at))
+    if is_not_modified(request, etag, bumped_at):
+        return not_modified_response(validator_headers(etag, bumped_at))
+    page = await run_db(db, crud.list_messages, thread_id, after_id, before_id, limit)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Тред не найден",
+        )
+    return cache_page(request, db, cached, etag, bumped_at, page)
+
+# Страница треда: данные треда и первые (last=true - последние) сообщения.
+# Клиенту не нужно загружать список тредов ради названия; в базу уходят
+# запрос валидаторов и один запрос страницы
+@app.get("/threads/{thread_id}/page", response_model=ThreadPageResponse)
+async def get_thread_page(
+    request: Request,
+    thread_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    last: bool = False,
+    db: Session = Depends(get_read_db),
+):
+    cached = response_cache.lookup(thread_cache_scope(thread_id), f"page:r{render.RENDER_VERSION}:{limit}:{int(last)}")
+    if cached.value is not None:
+        return conditional_json_response(request, *cached.value)
+    validators = await run_db(db, crud.thread_validators, thread_id)
+    if validators is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Тред не найден",
+        )
+    message_count, bumped_at, version = validators
+    etag = make_etag("page", thread_id, int(last), message_count, version, render.RENDER_VERSION, stamp(bumped_at))
+    if is_not_modified(request, etag, bumped_at):
+        return not_modified_response(validator_headers(etag, bumped_at))
+    page = await run_db(db, crud.get_thread_page, thread_id, limit, last)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Тред не найден",
+        )
+    return cache_page(request, db, cached, etag, bumped_at, page)
+
+# Файлы вложений и миниатюры. Имя файла - хэш содержимого, поэтому
+# файл по этому адресу никогда не меняется и кэшируется клиентами на год
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@app.get("/media/{kind}/{name}", response_class=FileResponse)
+async def get_media(request: Request, kind: str, name: str):
+    path = media.media_path(kind, name)
+    if path is None or not await run_in_threadpool(os.path.isfile, path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Файл не найден",
+        )
+    headers = {"ETag": f'"{name}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if is_not_modified(request, headers["ETag"], None):
+        return not_modified_response(headers)
+    return FileResponse(path, headers=headers)
+
+# Ответы на сообщение треда по его номеру: прямые (depth=1)
+# или дерево ответов до глубины depth
+@app.get("/threads/{thread_id}/posts/{post_number}/replies", response_model=RepliesResponse)
+async def get_replies(
+    thread_id: int,
+    post_number: int,
+    depth: int = Query(1, ge=1, le=replies.MAX_TREE_DEPTH),
+    db: Session = Depends(get_read_db),
+):
+    tree = await run_db(db, crud.get_replies, thread_id, post_number, depth)
+    if tree is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Сообщение не найдено",
+        )
+    return tree
+
+# Номера ответов на сообщения с номерами от start до start + limit - 1:
+# клиент запрашивает их для показанной страницы сообщений
+@app.get("/threads/{thread_id}/backlinks", response_model=BacklinksResponse)
+async def get_backlinks(
+    thread_id: int,
+    start: int = Query(1, ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    backlinks = await run_db(db, crud.list_backlinks, thread_id, start, start + limit - 1)
+    if backlinks is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Тред не найден",
+        )
+    return backlinks
+
+# Заголовки потока событий: без буферизации на прокси
+EVENT_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Догрузка записей после after_id постранично в виде событий
+def backfill_pages(kind: str, list_page, *args):
+    async def backfill(after_id: int):
+        async with session_scope() as db:
+            while True:
+                page = await run_db(db, list_page, *args, after_id, None, MAX_PAGE_SIZE)
+                if page is None:
+                    return
+                for item in page["items"]:
+                    yield kind, item["id"], item
+                if page["next_cursor"] is None:
+                    return
+                after_id = page["next_cursor"]
+    return backfill
+
+# Поток новых тредов (Server-Sent Events).
+# После переподключения с Last-Event-ID догружаются пропущенные треды
+@app.get("/threads/events", response_class=StreamingResponse)
+async def thread_list_events(
+    last_event_id: Optional[str] = Header(None),
+    after_id: Optional[int] = None,
+):
+    resume_from = after_id if after_id is not None else parse_last_event_id(last_event_id)
+    return StreamingResponse(
+        event_stream(THREADS_TOPIC, resume_from, backfill_pages("thread", crud.list_threads)),
+        media_type="text/event-stream",
+        headers=EVENT_STREAM_HEADERS,
+    )
+
+# Поток новых сообщений треда (Server-Sent Events).
+# После переподключения с Last-Event-ID догружаются только пропущенные сообщения
+@app.get("/threads/{thread_id}/events", response_class=StreamingResponse)
+async def thread_events(
+    thread_id: int,
+    last_event_id: Optional[str] = Header(None),
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    if await run_db(db, crud.get_thread, thread_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Тред не найден",
+        )
+    resume_from = after_id if after_id is not None else parse_last_event_id(last_event_id)
+    return StreamingResponse(
+        event_stream(
+            thread_topic(thread_id),
+            resume_from,
+            backfill_pages("message", crud.list_messages, thread_id),
+        ),
+        media_type="text/event-stream",
+        headers=EVENT_STREAM_HEADERS,
+    )
+
+# Полнотекстовый поиск по названиям тредов и текстам сообщений
+@app.get("/search", response_model=SearchPage)
+async def search_forum(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
+):
+    if not await run_db(db, search.is_enabled):
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Поиск доступен только для SQLite",
+        )
+    return await run_db(db, search.search, q, limit, offset)
+
+# Загрузка пула соединений с базой (для подбора его размера)
+@app.get("/stats/pool", response_model=dict)
+def get_pool_stats():
+    return pool_stats()
+
+# Статистика кэша авторизации
+@app.get("/stats/auth-cache", response_model=dict)
+def get_auth_cache_stats():
+    return token_cache.stats()
+
+# Статистика потоков событий
+@app.get("/stats/events", response_model=dict)
+def get_events_stats():
+    return broadcaster.stats()
+
+# Статистика кэша ответов
+@app.get("/stats/cache", response_model=dict)
+def get_cache_stats():
+    return response_cache.stats()
+
+# Статистика очереди групповой записи (средний размер пачки и т.п.)
+@app.get("/stats/write-queue", response_model=dict)
+def get_write_queue_stats():
+    return {"enabled": WRITE_QUEUE_ENABLED, **write_queue.stats()}
+
+# Пул построения миниатюр
+@app.get("/stats/thumbnails", response_model=dict)
+def get_thumbnail_stats():
+    return media.thumbnail_pool.stats()
+
+# Очередь фоновых задач: глубина по статусам, задержка самой старой
+# готовой задачи, выполненные, повторённые и объединённые задачи
+@app.get("/stats/jobs", response_model=dict)
+def get_job_stats():
+    return job_queue.stats()
+
+# Реплики для чтения: сколько чтений ушло на каждую и в основную базу
+@app.get("/stats/replicas", response_model=dict)
+def get_replica_stats():
+    return replicas.read_router.stats()
+
+# Числовые поля статистики как метрики-датчики с общим префиксом
+def stats_gauges(prefix: str, description: str, stats: dict):
+    return [
+        (f"{prefix}_{key}", "gauge", f"{description}: {key}", [({}, value)])
+        for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+# Метрики в текстовом формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    extra = (
+        stats_gauges("db_pool", "Пул соединений", pool_stats())
+        + stats_gauges("response_cache", "Кэш ответов", response_cache.stats())
+        + stats_gauges("auth_cache", "Кэш авторизации", token_cache.stats())
+        + stats_gauges("events", "Потоки событий", broadcaster.stats())
+        + stats_gauges("write_queue", "Очередь групповой записи", write_queue.stats())
+        + stats_gauges("thumbnails", "Построение миниатюр", media.thumbnail_pool.stats())
+        + stats_gauges("jobs", "Фоновые задачи", job_queue.stats())
+    )
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
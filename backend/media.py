@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from collections import defaultdict
+from concurrent.futures import BrokenExecutor
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from .config import (
+    MEDIA_ROOT,
+    MAX_ATTACHMENT_BYTES,
+    UPLOAD_CHUNK_SIZE,
+    THUMBNAIL_SIZE,
+    THUMBNAIL_WORKERS,
+    THUMBNAIL_QUEUE_SIZE,
+)
+from .database import Attachment, Message, Thread
+from .cache import invalidate_on_commit, thread_scope
+from .jobs import job_queue
+from .thumbnails import make_thumbnail
+from .workers import BoundedProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Вложения к сообщениям. Загруженный файл пишется на диск пачками по
+# UPLOAD_CHUNK_SIZE с подсчётом SHA-256 и кладётся под именем хэша
+# (media/src/ab/<sha256>.<ext>): повторная загрузка того же файла
+# не занимает место. Миниатюры строятся после ответа клиенту фоновой
+# задачей в отдельном пуле процессов; пока миниатюра не готова,
+# thumbnail_url равен null.
+# Файлы неизменяемы, поэтому отдаются с кэшированием на год
+
+SOURCE_DIR = "src"
+THUMBNAIL_DIR = "thumb"
+NAME_PATTERN = re.compile(r"^([0-9a-f]{64})\.(jpg|png|gif|webp)$")
+
+ATTACHMENT_COLUMNS = (
+    Attachment.id,
+    Attachment.message_id,
+    Attachment.sha256,
+    Attachment.extension,
+    Attachment.content_type,
+    Attachment.size,
+    Attachment.name,
+    Attachment.width,
+    Attachment.height,
+    Attachment.thumbnail_status,
+)
+
+# Файл отклонён: код ответа и текст ошибки для клиента
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+# Формат изображения по сигнатуре начала файла: (расширение, MIME-тип).
+# Заголовку Content-Type от клиента не доверяем
+def sniff(head: bytes) -> Optional[tuple]:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg", "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif", "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+def source_path(sha256: str, extension: str) -> str:
+    return os.path.join(MEDIA_ROOT, SOURCE_DIR, sha256[:2], f"{sha256}.{extension}")
+
+def thumbnail_path(sha256: str) -> str:
+    return os.path.join(MEDIA_ROOT, THUMBNAIL_DIR, sha256[:2], f"{sha256}.jpg")
+
+# Путь к файлу по имени из URL или None. Имя - только хэш и расширение,
+# поэтому выйти за пределы MEDIA_ROOT через него нельзя
+def media_path(kind: str, name: str) -> Optional[str]:
+    match = NAME_PATTERN.match(name)
+    if match is None:
+        return None
+    sha256, extension = match.groups()
+    if kind == SOURCE_DIR:
+        return source_path(sha256, extension)
+    if kind == THUMBNAIL_DIR and extension == "jpg":
+        return thumbnail_path(sha256)
+    return None
+
+# Сохранение загруженного файла (file - файловый объект, читается пачками).
+# Синхронная функция: обработчик вызывает её в пуле потоков.
+# Возвращает поля для строки Attachment
+def store_upload(file, name: Optional[str]) -> dict:
+    tmp_dir = os.path.join(MEDIA_ROOT, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    kind = None
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if kind is None:
+                    kind = sniff(chunk)
+                    if kind is None:
+                        raise UploadError(415, "Поддерживаются только изображения JPEG, PNG, GIF и WebP")
+                size += len(chunk)
+                if size > MAX_ATTACHMENT_BYTES:
+                    raise UploadError(413, f"Файл больше {MAX_ATTACHMENT_BYTES} байт")
+                digest.update(chunk)
+                out.write(chunk)
+        if kind is None:
+            raise UploadError(400, "Пустой файл")
+        sha256 = digest.hexdigest()
+        extension, content_type = kind
+        path = source_path(sha256, extension)
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {
+        "sha256": sha256,
+        "extension": extension,
+        "content_type": content_type,
+        "size": size,
+        "name": os.path.basename(name)[:255] if name else None,
+    }
+
+# Вложение для ответа клиенту (из строки ATTACHMENT_COLUMNS или объекта)
+def attachment_dict(row) -> dict:
+    ready = row.thumbnail_status == "ready"
+    return {
+        "id": row.id,
+        "sha256": row.sha256,
+        "name": row.name,
+        "content_type": row.content_type,
+        "size": row.size,
+        "width": row.width,
+        "height": row.height,
+        "url": f"/media/{SOURCE_DIR}/{row.sha256}.{row.extension}",
+        "thumbnail_url": f"/media/{THUMBNAIL_DIR}/{row.sha256}.jpg" if ready else None,
+        "thumbnail_status": row.thumbnail_status,
+    }
+
+# Строки вложений нового сообщения (до commit). Если тот же файл уже
+# загружался и миниатюра для него готова, она используется сразу,
+# иначе в той же транзакции ставится задача на её построение
+def add_attachments(db: Session, message: Message, files: list) -> list:
+    if not files:
+        return []
+    hashes = {file["sha256"] for file in files}
+    ready = {
+        row.sha256: (row.width, row.height)
+        for row in db.execute(
+            select(Attachment.sha256, Attachment.width, Attachment.height)
+            .where(Attachment.sha256.in_(hashes), Attachment.thumbnail_status == "ready")
+            .distinct()
+        )
+    }
+    rows = []
+    for file in files:
+        width, height = ready.get(file["sha256"], (None, None))
+        rows.append(Attachment(
+            message_id=message.id,
+            thread_id=message.thread_id,
+            width=width,
+            height=height,
+            thumbnail_status="ready" if file["sha256"] in ready else "pending",
+            **file,
+        ))
+    db.add_all(rows)
+    db.flush()
+    for row in rows:
+        if row.thumbnail_status == "pending":
+            schedule_thumbnail(db, row.sha256, row.extension)
+    return [attachment_dict(row) for row in rows]
+
+# Вложения для страницы сообщений: один запрос по индексу message_id
+# и только если на странице есть сообщения с вложениями
+def attach_to_messages(db: Session, items: list) -> list:
+    ids = [item["id"] for item in items if item.get("attachment_count")]
+    found = defaultdict(list)
+    if ids:
+        rows = db.execute(
+            select(*ATTACHMENT_COLUMNS).where(Attachment.message_id.in_(ids)).order_by(Attachment.id)
+        )
+        for row in rows:
+            found[row.message_id].append(attachment_dict(row))
+    for item in items:
+        item["attachments"] = found.get(item["id"], [])
+    return items
+
+# Итог построения миниатюры: размеры исходного изображения или None при ошибке.
+# Обновляются все ожидающие вложения с этим файлом; у их тредов растёт
+# версия (меняется ETag страниц сообщений) и сбрасывается кэш.
+# Повторный вызов ничего не меняет
+def mark_thumbnail(db: Session, sha256: str, size: Optional[tuple]):
+    pending = (Attachment.sha256 == sha256, Attachment.thumbnail_status == "pending")
+    thread_ids = db.execute(select(Attachment.thread_id).where(*pending).distinct()).scalars().all()
+    if size is None:
+        values = {"thumbnail_status": "failed"}
+    else:
+        values = {"thumbnail_status": "ready", "width": size[0], "height": size[1]}
+    db.execute(update(Attachment).where(*pending).values(**values).execution_options(synchronize_session=False))
+    if thread_ids:
+        db.execute(
+            update(Thread).where(Thread.id.in_(thread_ids))
+            .values(version=Thread.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+    invalidate_on_commit(db, *(thread_scope(thread_id) for thread_id in thread_ids))
+    db.commit()
+
+# Построение миниатюры - фоновая задача (jobs.py), добавленная в транзакции
+# сообщения и объединённая по хэшу файла. Обработчик ждёт результата из пула
+# процессов в потоке исполнителя. Переполненный или сломанный пул - повод
+# повторить задачу позже, а файл, который не удалось разобрать, сразу
+# помечается как failed
+THUMBNAIL_JOB = "thumbnail"
+
+def schedule_thumbnail(db: Session, sha256: str, extension: str) -> bool:
+    return job_queue.enqueue(db, THUMBNAIL_JOB, key=f"{THUMBNAIL_JOB}:{sha256}", sha256=sha256, extension=extension)
+
+def thumbnail_failed(db: Session, sha256: str, extension: str):
+    mark_thumbnail(db, sha256, None)
+
+@job_queue.handler(THUMBNAIL_JOB, on_failure=thumbnail_failed)
+def build_thumbnail(db: Session, sha256: str, extension: str):
+    future = thumbnail_pool.submit(make_thumbnail, source_path(sha256, extension), thumbnail_path(sha256), THUMBNAIL_SIZE)
+    try:
+        size = future.result()
+    except BrokenExecutor:
+        raise
+    except Exception:
+        logger.exception("Ошибка построения миниатюры %s", sha256)
+        size = None
+    mark_thumbnail(db, sha256, size)
+
+# Задачи для миниатюр, которые остались ожидающими без задачи
+# (вложения, загруженные до появления очереди задач)
+def resume_pending(db: Session) -> int:
+    rows = db.execute(
+        select(Attachment.sha256, Attachment.extension)
+        .where(Attachment.thumbnail_status == "pending")
+        .distinct()
+    ).all()
+    scheduled = sum(schedule_thumbnail(db, sha256, extension) for sha256, extension in rows)
+    db.commit()
+    return scheduled
+
+thumbnail_pool = BoundedProcessPool("thumbnails", THUMBNAIL_WORKERS, THUMBNAIL_QUEUE_SIZE)
@@ -0,0 +1,236 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from .config import SLOW_REQUEST_MS
+
+logger = logging.getLogger(__name__)
+
+# Метрики производительности в текстовом формате Prometheus.
+# Задержка запросов по шаблону маршрута, запросы в работе, число и время
+# SQL-запросов на HTTP-запрос (видно N+1) и ожидание соединения из пула.
+# Счётчики пишутся из цикла событий и из потоков, поэтому под общей блокировкой
+
+# Границы корзин гистограмм (секунды), как у клиентов Prometheus по умолчанию
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы корзин числа SQL-запросов на HTTP-запрос
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Сколько разных SQL-запросов хранить для журнала медленных запросов
+MAX_STATEMENTS_PER_REQUEST = 50
+
+_lock = threading.Lock()
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] += amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # labels -> [счётчики по корзинам..., сумма, количество]
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        for labels, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", repr(float(bound))),), cumulative
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), state[-1]
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса", LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP-запросы в работе")
+REQUEST_QUERIES = Histogram("http_request_db_queries", "Число SQL-запросов на HTTP-запрос", QUERY_COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram("http_request_db_seconds", "Время SQL-запросов на HTTP-запрос", LATENCY_BUCKETS)
+QUERY_DURATION = Histogram("db_query_duration_seconds", "Время выполнения SQL-запроса", LATENCY_BUCKETS)
+POOL_WAIT = Histogram("db_pool_wait_seconds", "Ожидание соединения из пула", LATENCY_BUCKETS)
+SLOW_REQUESTS = Counter("http_slow_requests_total", "HTTP-запросы медленнее SLOW_REQUEST_MS")
+
+METRICS = (
+    REQUEST_LATENCY,
+    REQUESTS_IN_FLIGHT,
+    REQUEST_QUERIES,
+    REQUEST_SQL_TIME,
+    QUERY_DURATION,
+    POOL_WAIT,
+    SLOW_REQUESTS,
+)
+
+# Статистика текущего HTTP-запроса. Объект лежит в contextvar и
+# доступен обработчикам событий движка: пул потоков (run_in_threadpool)
+# и run_sync выполняются с копией контекста запроса
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        # Текст запроса (без литералов) -> [число выполнений, время]
+        self.statements = {}
+
+    def add_query(self, statement: str, seconds: float):
+        self.queries += 1
+        self.sql_seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            if len(self.statements) >= MAX_STATEMENTS_PER_REQUEST:
+                return
+            entry = self.statements[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+def normalize_statement(statement: str) -> str:
+    return re.sub(r"\s+", " ", statement).strip()[:200]
+
+# Подписка на события движка: время каждого SQL-запроса
+def instrument_engine(db_engine):
+    if event.contains(db_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    QUERY_DURATION.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.add_query(normalize_statement(statement), elapsed)
+
+# Ожидание соединения из пула (вызывается пулом из database.py)
+def observe_pool_wait(seconds: float):
+    POOL_WAIT.observe(seconds)
+    stats = current_request.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+# Шаблон маршрута (/threads/{thread_id}/messages), а не сам путь:
+# иначе у метрик было бы по ряду на каждый тред
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+# Промежуточный слой ASGI: задержка, запросы в работе, SQL на запрос
+# и журнал медленных запросов с разбивкой по SQL
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        REQUESTS_IN_FLIGHT.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec(method=method)
+            current_request.reset(token)
+            route = route_template(scope)
+            REQUEST_LATENCY.observe(elapsed, method=method, route=route, status=status_code)
+            REQUEST_QUERIES.observe(stats.queries, method=method, route=route)
+            REQUEST_SQL_TIME.observe(stats.sql_seconds, method=method, route=route)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                SLOW_REQUESTS.inc(method=method, route=route)
+                log_slow_request(method, scope.get("path", route), status_code, elapsed, stats)
+
+def log_slow_request(method: str, path: str, status_code: int, elapsed: float, stats: RequestStats):
+    breakdown = sorted(stats.statements.items(), key=lambda item: item[1][1], reverse=True)
+    lines = [
+        f"  {count}x {seconds * 1000:.1f} мс: {statement}"
+        for statement, (count, seconds) in breakdown[:10]
+    ]
+    logger.warning(
+        "Медленный запрос %s %s -> %s: %.1f мс, SQL-запросов %d (%.1f мс), ожидание пула %.1f мс\n%s",
+        method, path, status_code, elapsed * 1000, stats.queries,
+        stats.sql_seconds * 1000, stats.pool_wait_seconds * 1000, "\n".join(lines),
+    )
+
+# Текстовый формат Prometheus. extra - дополнительные метрики,
+# снятые в момент запроса: (имя, тип, описание, [(метки, значение)])
+def render(extra=()) -> str:
+    lines = []
+    with _lock:
+        for metric in METRICS:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+    for name, kind, help_text, samples in extra:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {value}")
+    return "\n".join(lines) + "\n"
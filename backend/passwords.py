@@ -0,0 +1,29 @@
+from passlib.context import CryptContext
+from .config import BCRYPT_ROUNDS, PASSWORD_WORKERS, PASSWORD_QUEUE_SIZE
+from .workers import BoundedProcessPool
+
+# Настройки для хэширования паролей. Хэши со стоимостью ниже BCRYPT_ROUNDS
+# считаются устаревшими и пересчитываются при следующем входе.
+# Модуль импортируется процессами пула, поэтому зависит только от passlib
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+# Функция для хэширования пароля
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+# Функция для проверки пароля
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+# Нужно ли пересчитать хэш (дёшево: разбирается только заголовок хэша)
+def needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+# Отдельный пул процессов для bcrypt, чтобы вход и регистрация
+# не занимали потоки, обслуживающие остальные запросы
+password_pool = BoundedProcessPool("passwords", PASSWORD_WORKERS, PASSWORD_QUEUE_SIZE)
@@ -0,0 +1,106 @@
+import html
+import re
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+from .database import Message
+from .replies import REPLY_PATTERN
+
+# Отображение сообщений в HTML. Текст размечается один раз при записи
+# и хранится рядом с ним (Message.content_html), клиенты выводят готовый
+# HTML без своей разметки и экранирования.
+# Безопасность держится на порядке: весь текст экранируется, а теги
+# добавляет только сам разметчик из короткого списка ниже, поэтому
+# пользовательский HTML в вывод не попадает.
+# RENDER_VERSION увеличивается при любом изменении разметки: сообщения
+# со старой версией размечаются заново при чтении (без записи в базу),
+# а команда rerender-messages обновляет их в базе. Версия входит в ETag
+# и ключ кэша страниц сообщений, поэтому после её смены клиенты и общий
+# кэш (Redis переживает перезапуск) не получают страницы с прежним HTML
+
+RENDER_VERSION = 1
+
+# Разметка внутри строки: `код`, ссылка >>N на сообщение треда, адрес
+# http(s), **жирный**, *курсив* и ~~зачёркнутый~~ текст (без вложенности)
+INLINE_PATTERN = re.compile(
+    r"(?P<code>`[^`\n]+`)"
+    r"|(?P<reference>>>(?P<number>\d{1,9}))"
+    r"|(?P<url>https?://[^\s<>\"'`]+)"
+    r"|\*\*(?P<bold>[^*\n]+)\*\*"
+    r"|\*(?P<italic>[^*\n]+)\*"
+    r"|~~(?P<strike>[^~\n]+)~~"
+)
+# Знаки в конце адреса, которые обычно относятся к предложению
+URL_TRAILING = ".,;:!?)"
+
+def escape(text: str) -> str:
+    return html.escape(text, quote=True)
+
+def render_inline(match) -> str:
+    kind = match.lastgroup
+    if kind == "code":
+        return f"<code>{escape(match.group(kind)[1:-1])}</code>"
+    if kind == "reference":
+        number = int(match.group("number"))
+        return f'<a class="reply-link" href="#post-{number}">&gt;&gt;{number}</a>'
+    if kind == "url":
+        url = match.group(kind)
+        stripped = url.rstrip(URL_TRAILING)
+        tail = url[len(stripped):]
+        return f'<a href="{escape(stripped)}" rel="nofollow noopener" target="_blank">{escape(stripped)}</a>{escape(tail)}'
+    tag = {"bold": "b", "italic": "i", "strike": "s"}[kind]
+    return f"<{tag}>{escape(match.group(kind))}</{tag}>"
+
+def render_line(line: str) -> str:
+    parts = []
+    position = 0
+    for match in INLINE_PATTERN.finditer(line):
+        parts.append(escape(line[position:match.start()]))
+        parts.append(render_inline(match))
+        position = match.end()
+    parts.append(escape(line[position:]))
+    rendered = "".join(parts)
+    # Строка с > в начале (но не ссылка >>N) - цитата
+    if line.startswith(">") and not REPLY_PATTERN.match(line):
+        return f'<span class="quote">{rendered}</span>'
+    return rendered
+
+# HTML текста сообщения
+def render_message(content: str) -> str:
+    return "<br>".join(render_line(line) for line in (content or "").splitlines())
+
+# Поля отображения для новой строки messages
+def rendered_fields(content: str) -> dict:
+    return {"content_html": render_message(content), "render_version": RENDER_VERSION}
+
+# Сообщения для ответа клиенту (словари с колонками crud.MESSAGE_COLUMNS
+# или из архива): устаревший или отсутствующий HTML размечается заново,
+# служебное поле render_version из ответа убирается
+def refresh_items(items: list) -> list:
+    for item in items:
+        version = item.pop("render_version", None)
+        if version != RENDER_VERSION or item.get("content_html") is None:
+            item["content_html"] = render_message(item["content"])
+    return items
+
+# Перерисовка сообщений со старой версией разметки пачками по id,
+# по транзакции на пачку. Кэш страниц не сбрасывается: записи с прежней
+# версией разметки в нём уже не читаются (версия входит в ключ), а новые
+# содержат тот же HTML, размеченный при чтении. Возвращает число сообщений
+def rerender_messages(db: Session, batch_size: int = 1000) -> int:
+    stale = or_(Message.render_version.is_(None), Message.render_version != RENDER_VERSION)
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Message.id, Message.content)
+            .where(Message.id > last_id, stale)
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.execute(update(Message), [{"id": row.id, **rendered_fields(row.content)} for row in rows])
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
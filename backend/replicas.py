@@ -0,0 +1,119 @@
+import itertools
+import threading
+from fastapi import Request
+from .config import DATABASE_READ_URLS, DB_READ_STRATEGY, READ_YOUR_WRITES_SECONDS
+from .database import IS_ASYNC, AsyncSessionLocal, SessionLocal, create_db_engine, pool_stats
+
+# Маршрутизация чтения по репликам. Обработчики, которые только читают
+# (списки тредов, страницы сообщений, поиск), получают сессию реплики
+# через get_read_db; запись и авторизация идут в основную базу через get_db.
+# После успешного запроса на запись клиенту ставится короткоживущий cookie,
+# и пока он действует, его чтения идут в основную базу: так клиент видит
+# свои сообщения, даже если реплика ещё не догнала основную базу
+
+READ_YOUR_WRITES_COOKIE = "amichan_wrote"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+STRATEGIES = ("round_robin", "least_busy")
+
+# Число занятых соединений пула движка (0 для пулов без учёта)
+def checked_out(db_engine) -> int:
+    checkedout = getattr(db_engine.pool, "checkedout", None)
+    return checkedout() if checkedout is not None else 0
+
+class ReadRouter:
+    def __init__(self, engines, strategy: str = "round_robin"):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия выбора реплики: {strategy}")
+        self.engines = list(engines)
+        self.strategy = strategy
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self.reads = [0] * len(self.engines)
+        self.primary_reads = 0
+
+    # Реплика для очередного запроса или None, если реплик нет.
+    # least_busy при равной загрузке выбирает реплику с меньшим числом чтений
+    def choose(self):
+        if not self.engines:
+            return None
+        with self._lock:
+            if self.strategy == "least_busy":
+                index = min(
+                    range(len(self.engines)),
+                    key=lambda i: (checked_out(self.engines[i]), self.reads[i]),
+                )
+            else:
+                index = next(self._next) % len(self.engines)
+            self.reads[index] += 1
+        return self.engines[index]
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "primary_reads": self.primary_reads,
+            "replicas": [
+                {"url": db_engine.url.render_as_string(hide_password=True), "reads": reads, **pool_stats(db_engine)}
+                for db_engine, reads in zip(self.engines, self.reads)
+            ],
+        }
+
+read_router = ReadRouter(
+    [create_db_engine(url, is_async=IS_ASYNC) for url in DATABASE_READ_URLS],
+    DB_READ_STRATEGY,
+)
+
+# Клиент недавно писал и должен читать из основной базы
+def wrote_recently(request: Request) -> bool:
+    return READ_YOUR_WRITES_COOKIE in request.cookies
+
+# Реплика для запроса или None - тогда читаем из основной базы
+def choose_replica(request: Request):
+    if not read_router.engines:
+        return None
+    if wrote_recently(request):
+        read_router.primary_reads += 1
+        return None
+    return read_router.choose()
+
+# Сессия была открыта на реплике (ответы реплик не кладутся в кэш:
+# отстающая реплика записала бы старую страницу под новую версию)
+def is_replica(db) -> bool:
+    return db.info.get("replica", False)
+
+# Зависимость FastAPI для обработчиков, которые только читают
+if IS_ASYNC:
+    async def get_read_db(request: Request):
+        replica = choose_replica(request)
+        session = AsyncSessionLocal() if replica is None else AsyncSessionLocal(bind=replica, info={"replica": True})
+        async with session as db:
+            yield db
+else:
+    def get_read_db(request: Request):
+        replica = choose_replica(request)
+        db = SessionLocal() if replica is None else SessionLocal(bind=replica, info={"replica": True})
+        try:
+            yield db
+        finally:
+            db.close()
+
+# Промежуточный слой ASGI: успешный запрос на запись ставит cookie,
+# по которому следующие READ_YOUR_WRITES_SECONDS секунд чтения идут в основную базу
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or not read_router.engines:
+            await self.app(scope, receive, send)
+            return
+        cookie = (
+            f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={READ_YOUR_WRITES_SECONDS}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        ).encode("latin-1")
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie)]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,120 @@
+import re
+from collections import defaultdict
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session, aliased
+from .database import Message, MessageReply, Thread
+
+# Граф ответов. Ссылки >>N в тексте сообщения разбираются при записи
+# в таблицу message_replies (thread_id, source_number -> target_number),
+# где N - номер сообщения в треде. Ответы на сообщение и дерево ответов
+# выбираются по индексу этой таблицы, тексты сообщений не просматриваются.
+# Функции синхронные, как и crud: вызываются в транзакции записи сообщения
+
+REPLY_PATTERN = re.compile(r">>(\d{1,9})")
+# Сколько разных ссылок одного сообщения учитывать
+MAX_REFERENCES = 50
+# Наибольшая глубина дерева ответов и число узлов в ответе
+MAX_TREE_DEPTH = 10
+MAX_TREE_NODES = 500
+
+replies_table = MessageReply.__table__
+
+# Номера сообщений, на которые ссылается текст: только более ранние
+# сообщения того же треда, без повторов, по возрастанию
+def parse_references(content: str, post_number: int) -> list:
+    numbers = set()
+    for match in REPLY_PATTERN.finditer(content or ""):
+        number = int(match.group(1))
+        if 1 <= number < post_number:
+            numbers.add(number)
+            if len(numbers) >= MAX_REFERENCES:
+                break
+    return sorted(numbers)
+
+# Рёбра графа для сообщений: rows - словари с ключами thread_id, post_number и content
+def reply_edges(rows) -> list:
+    return [
+        {"thread_id": row["thread_id"], "source_number": row["post_number"], "target_number": target}
+        for row in rows
+        for target in parse_references(row["content"], row["post_number"])
+    ]
+
+# Запись рёбер одним executemany до commit, в транзакции самих сообщений
+def index_messages(db: Session, rows):
+    edges = reply_edges(rows)
+    if edges:
+        db.execute(insert(replies_table), edges)
+
+def index_message(db: Session, message: Message):
+    index_messages(db, [{
+        "thread_id": message.thread_id,
+        "post_number": message.post_number,
+        "content": message.content,
+    }])
+
+# Ответы по сообщениям: пары (target_number, source_number) по возрастанию
+# -> [{"post_number": N, "replies": [номера ответов]}]
+def group_backlinks(pairs) -> list:
+    grouped = defaultdict(list)
+    for target, source in pairs:
+        grouped[target].append(source)
+    return [{"post_number": target, "replies": sources} for target, sources in sorted(grouped.items())]
+
+# Дерево ответов по уже загруженным сообщениям треда (для архива).
+# Узлы в том же порядке и с теми же полями, что и у crud.get_replies
+def tree_from_messages(messages: list, post_number: int, depth: int) -> list:
+    by_number = {message["post_number"]: message for message in messages}
+    children = defaultdict(list)
+    for edge in reply_edges(messages):
+        children[edge["target_number"]].append(edge["source_number"])
+    items, level = [], [post_number]
+    for current_depth in range(1, depth + 1):
+        nodes = sorted((target, source) for target in level for source in children[target])
+        items.extend({**by_number[source], "reply_to": target, "depth": current_depth} for target, source in nodes)
+        level = [source for _, source in nodes]
+    return items[:MAX_TREE_NODES]
+
+# Номера сообщениям без номера и полная перестройка графа по текстам.
+# Нужна для баз и выгрузок, созданных до появления номеров сообщений
+def rebuild_reply_graph(db: Session, batch_size: int = 1000):
+    earlier = aliased(Message)
+    db.execute(
+        update(Message)
+        .where(Message.post_number.is_(None))
+        .values(post_number=(
+            select(func.count(earlier.id))
+            .where(earlier.thread_id == Message.thread_id, earlier.id <= Message.id)
+            .scalar_subquery()
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(delete(replies_table))
+    # Сообщения со ссылками читаются пачками по id
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Message.id, Message.thread_id, Message.post_number, Message.content)
+            .where(Message.id > last_id, Message.content.contains(">>"))
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+        index_messages(db, rows)
+        last_id = rows[-1]["id"]
+    sync_last_post_numbers(db)
+    db.commit()
+
+# Счётчик номеров тредов по наибольшему выданному номеру, без commit:
+# после выдачи номеров перестройкой и загрузки выгрузок без этого счётчика
+def sync_last_post_numbers(db: Session):
+    db.execute(
+        update(Thread)
+        .values(last_post_number=func.coalesce(
+            select(func.max(Message.post_number))
+            .where(Message.thread_id == Thread.id)
+            .scalar_subquery(),
+            0,
+        ))
+        .execution_options(synchronize_session=False)
+    )
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
+from typing import List, Literal, Optional, Union
+from .config import BULK_MAX_ITEMS
 
 # Модель для регистрации пользователя
 class UserCreate(BaseModel):
@@ -29,6 +31,8 @@ class ThreadResponse(BaseModel):
     id: int
     title: str
     created_at: datetime
+    message_count: int
+    bumped_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -37,11 +41,112 @@ class ThreadResponse(BaseModel):
 class MessageCreate(BaseModel):
     content: str
 
+# Вложение сообщения. thumbnail_url - null, пока миниатюра строится
+class AttachmentResponse(BaseModel):
+    id: int
+    sha256: str
+    name: Optional[str] = None
+    content_type: str
+    size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    url: str
+    thumbnail_url: Optional[str] = None
+    # "pending" - миниатюра строится, "ready" или "failed"
+    thumbnail_status: Optional[str] = None
+
 # Модель для ответа с данными сообщения
 class MessageResponse(BaseModel):
     id: int
+    thread_id: int
+    post_number: Optional[int] = None  # Номер в треде, на него ссылаются >>N
     content: str
+    content_html: Optional[str] = None  # Текст, размеченный и экранированный сервером
     created_at: datetime
+    attachment_count: int = 0
+    attachments: List[AttachmentResponse] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Страница тредов. next_cursor - id для order=created, иначе строка-курсор
+class ThreadPage(BaseModel):
+    items: List[ThreadResponse]
+    next_cursor: Union[int, str, None] = None
+
+# Страница сообщений треда
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[int] = None
+
+# Страница треда: данные треда и первая страница его сообщений
+class ThreadPageResponse(BaseModel):
+    thread: ThreadResponse
+    messages: MessagePage
+
+# Узел дерева ответов: сообщение, номер сообщения, на которое оно отвечает, и глубина
+class ReplyNode(MessageResponse):
+    reply_to: int
+    depth: int
+
+class RepliesResponse(BaseModel):
+    post_number: int
+    items: List[ReplyNode]
+
+# Номера ответов на одно сообщение треда
+class Backlinks(BaseModel):
+    post_number: int
+    replies: List[int]
+
+class BacklinksResponse(BaseModel):
+    items: List[Backlinks]
+
+# Сообщение для массовой загрузки: created_at задаётся при импорте архивов
+class BulkMessageItem(BaseModel):
+    thread_id: int
+    content: str
+    created_at: Optional[datetime] = None
+
+    # В базе время хранится локальным без часового пояса, поэтому время
+    # с поясом переводится в локальное, а не обрезается
+    @field_validator("created_at")
+    @classmethod
+    def to_local_time(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
+
+class BulkMessagesCreate(BaseModel):
+    items: List[BulkMessageItem] = Field(min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkItemError(BaseModel):
+    index: int
+    detail: str
+
+# Результат массовой загрузки: id по порядку items (null - не вставлено)
+class BulkMessagesResponse(BaseModel):
+    ids: List[Optional[int]]
+    errors: List[BulkItemError]
+
+# Результат полнотекстового поиска
+class SearchHit(BaseModel):
+    kind: Literal["thread", "message"]
+    thread_id: int
+    message_id: Optional[int] = None
+    title: str
+    snippet: str
+    # Тред в архиве: читается теми же эндпоинтами, но только для чтения
+    archived: bool = False
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_offset: Optional[int] = None
+
+# Ответ на регистрацию
+class RegisterResponse(BaseModel):
+    message: str
+
+# Ответ на вход
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
@@ -0,0 +1,119 @@
+import re
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from .database import ArchivedThread, Thread, Message
+
+# Поиск работает только на SQLite: индекс построен на расширении FTS5
+def is_enabled(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+# Добавление треда в индекс. Вызывается до commit, чтобы индекс
+# обновлялся в той же транзакции, что и сама запись
+def index_thread(db: Session, thread: Thread):
+    if not is_enabled(db):
+        return
+    db.execute(
+        text(
+            "INSERT INTO search_index (body, kind, thread_id, message_id) "
+            "VALUES (:body, 'thread', :thread_id, NULL)"
+        ),
+        {"body": thread.title, "thread_id": thread.id},
+    )
+
+# Добавление сообщения в индекс (тоже до commit)
+def index_message(db: Session, message: Message):
+    if not is_enabled(db):
+        return
+    db.execute(
+        text(
+            "INSERT INTO search_index (body, kind, thread_id, message_id) "
+            "VALUES (:body, 'message', :thread_id, :message_id)"
+        ),
+        {"body": message.content, "thread_id": message.thread_id, "message_id": message.id},
+    )
+
+# Добавление многих сообщений одним executemany: rows - словари
+# с ключами id, thread_id и content
+def index_messages(db: Session, rows):
+    if not rows or not is_enabled(db):
+        return
+    db.execute(
+        text(
+            "INSERT INTO search_index (body, kind, thread_id, message_id) "
+            "VALUES (:content, 'message', :thread_id, :id)"
+        ),
+        rows,
+    )
+
+# Преобразование пользовательского запроса в запрос FTS5.
+# Каждое слово берётся в кавычки (чтобы операторы FTS5 не интерпретировались)
+# и ищется по префиксу, как и прежний поиск по подстроке в клиенте
+def build_match_query(query: str) -> str:
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+# Поиск по индексу. Результаты упорядочены по релевантности (bm25),
+# стоимость запроса зависит от числа совпадений, а не от размера форума.
+# Записи архивных тредов остаются в индексе и находятся вместе с живыми
+# (archived=true); название берётся из той таблицы, где тред сейчас
+def search(db: Session, query: str, limit: int, offset: int = 0):
+    match = build_match_query(query)
+    if not match:
+        return {"items": [], "next_offset": None}
+    rows = db.execute(
+        text(
+            "SELECT s.kind, s.thread_id, s.message_id, coalesce(t.title, a.title) AS title, "
+            "t.id IS NULL AS archived, "
+            "snippet(search_index, 0, '**', '**', '…', 12) AS snippet "
+            "FROM search_index AS s "
+            "LEFT JOIN threads AS t ON t.id = s.thread_id "
+            "LEFT JOIN archived_threads AS a ON a.id = s.thread_id "
+            "WHERE search_index MATCH :match AND (t.id IS NOT NULL OR a.id IS NOT NULL) "
+            "ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "limit": limit + 1, "offset": offset},
+    ).mappings().all()
+    has_more = len(rows) > limit
+    return {
+        "items": [{**row, "archived": bool(row["archived"])} for row in rows[:limit]],
+        "next_offset": offset + limit if has_more else None,
+    }
+
+# Полная перестройка индекса по данным таблиц threads и messages и архива.
+# Нужна для баз, созданных до появления поиска.
+# Сообщения архива распаковываются по batch_size тредов
+def rebuild_index(db: Session, batch_size: int = 100):
+    db.execute(text("DELETE FROM search_index"))
+    db.execute(
+        text(
+            "INSERT INTO search_index (body, kind, thread_id, message_id) "
+            "SELECT title, 'thread', id, NULL FROM threads"
+        )
+    )
+    db.execute(
+        text(
+            "INSERT INTO search_index (body, kind, thread_id, message_id) "
+            "SELECT content, 'message', thread_id, id FROM messages"
+        )
+    )
+    db.execute(
+        text(
+            "INSERT INTO search_index (body, kind, thread_id, message_id) "
+            "SELECT title, 'thread', id, NULL FROM archived_threads"
+        )
+    )
+    from .archive import decompress
+    archived_ids = db.execute(select(ArchivedThread.id).order_by(ArchivedThread.id)).scalars().all()
+    for start in range(0, len(archived_ids), batch_size):
+        payloads = db.execute(
+            select(ArchivedThread.id, ArchivedThread.payload)
+            .where(ArchivedThread.id.in_(archived_ids[start:start + batch_size]))
+        ).all()
+        index_messages(db, [
+            {"id": message["id"], "thread_id": thread_id, "content": message["content"]}
+            for thread_id, payload in payloads
+            for message in decompress(payload)
+        ])
+    db.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    db.commit()
+    return db.execute(text("SELECT count(*) FROM search_index")).scalar()
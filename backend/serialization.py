@@ -0,0 +1,27 @@
+import json
+from datetime import date, datetime
+from fastapi.responses import JSONResponse
+
+# Быстрая сериализация JSON для больших списков. Строки из базы уже
+# приходят словарями из простых типов, поэтому jsonable_encoder с его
+# обходом атрибутов не нужен: orjson пишет байты напрямую.
+# Без orjson используется стандартный json с тем же форматом дат
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson указан в requirements.txt
+    orjson = None
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Объект типа {type(value).__name__} не сериализуется в JSON")
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+# Класс ответа по умолчанию для приложения
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,29 @@
+import os
+from PIL import Image
+
+# Построение миниатюр. Выполняется в процессах пула, поэтому модуль
+# зависит только от Pillow и не тянет за собой базу и FastAPI.
+# thumbnail() для JPEG декодирует файл сразу в уменьшенном масштабе
+# (draft), поэтому большие фотографии не разворачиваются в память целиком
+
+THUMBNAIL_QUALITY = 85
+
+# Миниатюра source со стороной не больше size в target (JPEG).
+# Файл пишется во временный и переименовывается, чтобы читатели не увидели
+# его недописанным. Возвращает размеры исходного изображения
+def make_thumbnail(source: str, target: str, size: int) -> tuple:
+    with Image.open(source) as image:
+        width, height = image.size
+        image.thumbnail((size, size))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        image.save(tmp, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        os.replace(tmp, target)
+    return width, height
@@ -0,0 +1,67 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Очередь пула заполнена: новую задачу нужно отклонить, а не ставить в ожидание
+class PoolSaturated(Exception):
+    pass
+
+# Пул процессов для тяжёлой CPU-работы вне общего пула потоков FastAPI.
+# Число задач в работе и в очереди ограничено max_pending: при переполнении
+# submit сразу выбрасывает PoolSaturated. Процессы запускаются при первой задаче
+class BoundedProcessPool:
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.Semaphore(max_pending)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: дочерние процессы не наследуют потоки и соединения сервера
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._pending_lock:
+                self.rejected += 1
+            raise PoolSaturated(self.name)
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "rejected": self.rejected,
+            }
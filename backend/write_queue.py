@@ -0,0 +1,116 @@
+import asyncio
+from .config import WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_DELAY_MS
+from .database import run_db, session_scope
+
+# Групповая запись (group commit). Обработчики ставят операцию в очередь
+# и ждут её результат; единственная задача-писатель забирает накопившиеся
+# операции и выполняет их одной транзакцией с одним commit. SQLite
+# допускает одного писателя, и без очереди параллельные запросы по
+# очереди ждут блокировку и fsync каждого commit.
+# Операция - синхронная функция fn(session, *args) без commit, как
+# crud.add_message; её результат должен быть готов до commit (после
+# commit объекты сессии истекают)
+
+# Выполнение пачки одной транзакцией. Если операция бросает исключение,
+# пачка откатывается и операции выполняются заново по одной, чтобы ошибка
+# досталась только своему вызывающему. Возвращает [(успех, результат)]
+def apply_batch(db, operations: list) -> list:
+    try:
+        results = [(True, fn(db, *args)) for fn, args in operations]
+        db.commit()
+        return results
+    except Exception as exc:
+        db.rollback()
+        if len(operations) == 1:
+            return [(False, exc)]
+    return [apply_one(db, fn, args) for fn, args in operations]
+
+def apply_one(db, fn, args) -> tuple:
+    try:
+        result = fn(db, *args)
+        db.commit()
+        return True, result
+    except Exception as exc:
+        db.rollback()
+        return False, exc
+
+class WriteQueue:
+    def __init__(self, max_batch: int, max_delay_ms: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._loop = None
+        self._queue = None
+        self._writer = None
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.retried_batches = 0
+
+    # Писатель запускается при первой операции в текущем цикле событий
+    # (тестовый клиент создаёт новый цикл на каждый запрос)
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._writer is None or self._writer.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._writer = loop.create_task(self._run())
+
+    # Постановка операции в очередь. Возвращает её результат или
+    # бросает её исключение
+    async def submit(self, fn, *args):
+        self._ensure_writer()
+        future = self._loop.create_future()
+        self._queue.put_nowait((fn, args, future))
+        return await future
+
+    # Сбор пачки: всё, что уже ждёт в очереди, и то, что успеет прийти
+    # за max_delay, но не больше max_batch операций
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            operations = [(fn, args) for fn, args, _ in batch]
+            try:
+                async with session_scope() as db:
+                    results = await run_db(db, apply_batch, operations)
+            except Exception as exc:
+                results = [(False, exc)] * len(batch)
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            if len(batch) > 1 and any(not ok for ok, _ in results):
+                self.retried_batches += 1
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "retried_batches": self.retried_batches,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+write_queue = WriteQueue(WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_DELAY_MS)
@@ -0,0 +1,77 @@
+"""Скорость загрузки сообщений: по одному против массовой загрузки.
+
+Запуск: python -m benchmarks.bench_bulk [--messages N] [--threads T] [--concurrency C]
+
+"По одному" - N запросов POST /threads/{id}/messages (C параллельных клиентов).
+"Массово" - те же N сообщений в POST /messages/bulk пачками по BULK_MAX_ITEMS.
+Приложение вызывается в том же процессе через ASGI, замер идёт на временной
+базе SQLite. Цель - не меньше чем в 10 раз больше строк в секунду.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="amichan_bench_")
+    # Замер заполняет базу, поэтому DATABASE_URL из окружения не используется
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+    import httpx
+    from backend.main import app
+    from backend.auth import create_access_token, get_password_hash
+    from backend.config import BULK_MAX_ITEMS
+    from backend.database import SessionLocal, User, Thread
+    from benchmarks.common import run_load
+
+    db = SessionLocal()
+    db.add(User(email="bench@edu.hse.ru", password_hash=get_password_hash("bench")))
+    threads = [Thread(title=f"Тред {i}") for i in range(args.threads)]
+    db.add_all(threads)
+    db.commit()
+    thread_ids = [thread.id for thread in threads]
+    db.close()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bench@edu.hse.ru'})}"}
+    items = [
+        {"thread_id": thread_ids[i % len(thread_ids)], "content": f"Импорт {i}"}
+        for i in range(args.messages)
+    ]
+
+    def next_request(i):
+        item = items[i]
+        return "POST messages", "POST", f"/threads/{item['thread_id']}/messages", {
+            "json": {"content": item["content"]}, "headers": headers,
+        }
+
+    started = time.perf_counter()
+    asyncio.run(run_load(app, next_request, args.messages, args.concurrency))
+    single = time.perf_counter() - started
+
+    async def load_bulk():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for start in range(0, len(items), BULK_MAX_ITEMS):
+                response = await client.post(
+                    "/messages/bulk", json={"items": items[start:start + BULK_MAX_ITEMS]}, headers=headers,
+                )
+                response.raise_for_status()
+
+    started = time.perf_counter()
+    asyncio.run(load_bulk())
+    bulk = time.perf_counter() - started
+
+    print(f"Сообщений: {args.messages}, тредов: {args.threads}")
+    print(f"  {'по одному':<12}{args.messages / single:>12.0f} строк/с")
+    print(f"  {'массово':<12}{args.messages / bulk:>12.0f} строк/с")
+    print(f"  {'ускорение':<12}{single / bulk:>12.1f}x")
+
+if __name__ == "__main__":
+    main()
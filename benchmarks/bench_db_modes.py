@@ -0,0 +1,75 @@
+"""Сравнение синхронного и асинхронного режимов работы с базой.
+
+Запуск: python -m benchmarks.bench_db_modes [--requests N] [--concurrency C]
+
+Каждый режим запускается в отдельном процессе со своей временной базой
+SQLite (sqlite:// и sqlite+aiosqlite://). Нагрузка: 80% чтений страницы
+сообщений и 20% новых сообщений в одном треде.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODES = {
+    "sync": "sqlite:///{path}",
+    "async": "sqlite+aiosqlite:///{path}",
+}
+
+# Замер в дочернем процессе: режим определяется DATABASE_URL при импорте backend
+def run_worker(requests_total: int, concurrency: int):
+    from backend.main import app
+    from backend.auth import create_access_token, get_password_hash
+    from backend.database import SessionLocal, User, Thread, Message
+    from benchmarks.common import run_load
+
+    db = SessionLocal()
+    db.add(User(email="bench@edu.hse.ru", password_hash=get_password_hash("bench")))
+    thread = Thread(title="Benchmark")
+    db.add(thread)
+    db.flush()
+    db.add_all(Message(thread_id=thread.id, content=f"Сообщение {i}") for i in range(500))
+    db.commit()
+    thread_id = thread.id
+    db.close()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bench@edu.hse.ru'})}"}
+
+    def next_request(i):
+        if i % 5 == 0:
+            return "POST messages", "POST", f"/threads/{thread_id}/messages", {
+                "json": {"content": f"Нагрузка {i}"}, "headers": headers,
+            }
+        return "GET messages", "GET", f"/threads/{thread_id}/messages", {}
+
+    report = asyncio.run(run_load(app, next_request, requests_total, concurrency))
+    print(json.dumps(report))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.concurrency)
+        return
+
+    from benchmarks.common import print_report
+    for mode, url in MODES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=url.format(path=os.path.join(tmp, "bench.db")))
+            env.setdefault("BCRYPT_ROUNDS", "4")
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_db_modes", "--worker",
+                 "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            print_report(f"{mode} ({env['DATABASE_URL'].split(':')[0]}, concurrency {args.concurrency})", report)
+
+if __name__ == "__main__":
+    main()
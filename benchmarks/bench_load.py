@@ -0,0 +1,146 @@
+"""Нагрузочный замер API на сгенерированном форуме со сравнением с эталоном.
+
+Запуск: python -m benchmarks.bench_load [--scenario NAME] [--threads N] [--messages N]
+        [--requests N] [--concurrency C] [--seed S] [--update-baseline]
+
+Форум заполняется генератором benchmarks.datagen (популярность тредов по
+Ципфу) во временной базе SQLite. Нагрузка - смесь чтений и новых сообщений,
+треды для запросов выбираются с той же популярностью. По каждому эндпоинту
+печатаются rps и p50/p95/p99. Результат сравнивается с эталоном сценария
+из benchmarks/baselines.json: если rps упал или p95 вырос больше чем на
+--tolerance, команда завершается с кодом 1. --update-baseline записывает
+текущий результат как новый эталон.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Доли запросов в смеси нагрузки
+MIX = (
+    ("GET thread page", 35),
+    ("GET messages", 20),
+    ("GET threads", 20),
+    ("GET search", 5),
+    ("POST message", 20),
+)
+
+# Сценарии: размер форума и нагрузка. Значения можно переопределить флагами
+SCENARIOS = {
+    "smoke": {"threads": 200, "messages": 5000, "requests": 1000, "concurrency": 32},
+    "default": {"threads": 2000, "messages": 100000, "requests": 5000, "concurrency": 100},
+    "large": {"threads": 20000, "messages": 1000000, "requests": 20000, "concurrency": 500},
+}
+
+# Регрессии относительно эталона: список строк с описанием
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        actual = report.get(name)
+        if actual is None:
+            regressions.append(f"{name}: нет результата")
+            continue
+        if actual["rps"] < expected["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {actual['rps']:.1f} < эталона {expected['rps']:.1f}")
+        if actual["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {actual['p95_ms']:.2f} мс > эталона {expected['p95_ms']:.2f} мс")
+        if actual.get("errors"):
+            regressions.append(f"{name}: ошибок {actual['errors']}")
+    return regressions
+
+def load_baselines() -> dict:
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(scenario: str, report: dict):
+    baselines = load_baselines()
+    baselines[scenario] = {
+        name: {"rps": round(row["rps"], 1), "p95_ms": round(row["p95_ms"], 2)}
+        for name, row in report.items()
+    }
+    with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, default="smoke")
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--messages", type=int)
+    parser.add_argument("--requests", type=int)
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+    settings = {
+        key: getattr(args, key) if getattr(args, key) is not None else value
+        for key, value in SCENARIOS[args.scenario].items()
+    }
+
+    tmp = tempfile.mkdtemp(prefix="amichan_bench_")
+    # Замер заполняет базу, поэтому DATABASE_URL из окружения не используется
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+    from backend.main import app
+    from backend.auth import create_access_token, get_password_hash
+    from backend.database import SessionLocal, User
+    from benchmarks.common import run_load, print_report
+    from benchmarks.datagen import ForumGenerator, WORDS, populate
+
+    db = SessionLocal()
+    db.add(User(email="bench@edu.hse.ru", password_hash=get_password_hash("bench")))
+    db.commit()
+    thread_ids = populate(db, settings["threads"], settings["messages"], seed=args.seed, skew=args.skew)
+    db.close()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bench@edu.hse.ru'})}"}
+
+    # План запросов строится заранее, чтобы выбор не влиял на задержки
+    generator = ForumGenerator(args.seed + 1, args.skew)
+    kinds = generator.random.choices([name for name, _ in MIX], weights=[share for _, share in MIX], k=settings["requests"])
+    targets = generator.pick_threads(thread_ids, settings["requests"])
+    plan = []
+    for kind, thread_id in zip(kinds, targets):
+        if kind == "GET thread page":
+            plan.append((kind, "GET", f"/threads/{thread_id}/page", {"params": {"last": "true"}}))
+        elif kind == "GET messages":
+            plan.append((kind, "GET", f"/threads/{thread_id}/messages", {}))
+        elif kind == "GET threads":
+            plan.append((kind, "GET", "/threads", {"params": {"order": "bumped"}}))
+        elif kind == "GET search":
+            plan.append((kind, "GET", "/search", {"params": {"q": generator.random.choice(WORDS)}}))
+        else:
+            plan.append((kind, "POST", f"/threads/{thread_id}/messages", {
+                "json": {"content": generator.text()}, "headers": headers,
+            }))
+
+    report = asyncio.run(run_load(app, plan.__getitem__, len(plan), settings["concurrency"]))
+    print_report(
+        f"{args.scenario}: тредов {settings['threads']}, сообщений {settings['messages']}, "
+        f"запросов {settings['requests']}, concurrency {settings['concurrency']}",
+        report,
+    )
+
+    if args.update_baseline:
+        save_baseline(args.scenario, report)
+        print(f"Эталон сценария {args.scenario} обновлён: {BASELINES_PATH}")
+        return 0
+    baseline = load_baselines().get(args.scenario)
+    if baseline is None:
+        print(f"Эталона для сценария {args.scenario} нет, сравнение пропущено")
+        return 0
+    regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        print(f"  РЕГРЕССИЯ {line}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
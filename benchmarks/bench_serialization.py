@@ -0,0 +1,78 @@
+"""Стоимость выборки и сериализации одной строки: ORM-объекты против кортежей.
+
+Запуск: python -m benchmarks.bench_serialization [--rows N] [--repeat R]
+
+"До" - прежний путь: выборка ORM-объектов Message и jsonable_encoder + json.
+"После" - выборка колонок кортежами (crud.MESSAGE_COLUMNS) и кодирование
+словарей через serialization.dumps (orjson). Замер идёт на временной базе.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="amichan_bench_")
+    # Замер заполняет базу, поэтому DATABASE_URL из окружения не используется
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    from fastapi.encoders import jsonable_encoder
+    from backend.database import SessionLocal, Thread, Message, init_db
+    from backend.crud import MESSAGE_COLUMNS
+    from backend.serialization import dumps
+
+    init_db()
+    db = SessionLocal()
+    thread = Thread(title="Serialization")
+    db.add(thread)
+    db.flush()
+    db.add_all(
+        Message(thread_id=thread.id, content=f"Сообщение номер {i} " * 5)
+        for i in range(args.rows)
+    )
+    db.commit()
+    thread_id = thread.id
+
+    def fetch_entities():
+        db.expunge_all()
+        return db.query(Message).filter(Message.thread_id == thread_id).order_by(Message.id).all()
+
+    def fetch_rows():
+        rows = db.query(*MESSAGE_COLUMNS).filter(Message.thread_id == thread_id).order_by(Message.id).all()
+        return [row._asdict() for row in rows]
+
+    entities = fetch_entities()
+    rows = fetch_rows()
+    results = {
+        "до: выборка ORM-объектов": measure(fetch_entities, args.repeat),
+        "до: jsonable_encoder + json": measure(
+            lambda: json.dumps(jsonable_encoder(entities), ensure_ascii=False).encode(), args.repeat
+        ),
+        "после: выборка кортежей": measure(fetch_rows, args.repeat),
+        "после: orjson": measure(lambda: dumps(rows), args.repeat),
+    }
+    db.close()
+
+    print(f"Строк: {args.rows}, лучшее из {args.repeat} повторов")
+    for name, seconds in results.items():
+        print(f"  {name:<32}{seconds * 1e6 / args.rows:>9.2f} мкс/строка")
+    before = results["до: выборка ORM-объектов"] + results["до: jsonable_encoder + json"]
+    after = results["после: выборка кортежей"] + results["после: orjson"]
+    print(f"  {'итого до / после':<32}{before * 1e6 / args.rows:>9.2f} / {after * 1e6 / args.rows:.2f} мкс/строка")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Пропускная способность построения миниатюр в зависимости от числа процессов.
+
+Запуск: python -m benchmarks.bench_thumbnails [--images N] [--width W] [--height H] [--workers 1,2,4]
+
+Набор больших JPEG генерируется во временной папке один раз. Каждое число
+процессов замеряется в отдельном процессе: миниатюры строит тот же
+BoundedProcessPool с make_thumbnail, что и сервер. Память - наибольший
+RSS процесса пула (getrusage RUSAGE_CHILDREN после остановки пула).
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Синтетические фотографии: шум поверх градиента плохо сжимается, как настоящие снимки
+def generate_images(directory: str, count: int, width: int, height: int) -> list:
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        noise = Image.effect_noise((width, height), 40 + i % 20).convert("RGB")
+        gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        image = Image.blend(noise, gradient, 0.5)
+        path = os.path.join(directory, f"source{i}.jpg")
+        image.save(path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+# Замер в дочернем процессе, чтобы RUSAGE_CHILDREN относился только к его пулу
+def run_worker(source_dir: str, workers: int, size: int):
+    from backend.thumbnails import make_thumbnail
+    from backend.workers import BoundedProcessPool, PoolSaturated
+
+    sources = sorted(os.path.join(source_dir, name) for name in os.listdir(source_dir) if name.endswith(".jpg"))
+    pool = BoundedProcessPool("bench", workers, workers * 2)
+    with tempfile.TemporaryDirectory() as target_dir:
+        # Первая задача запускает процессы пула; в замер она не входит
+        pool.submit(make_thumbnail, sources[0], os.path.join(target_dir, "warmup.jpg"), size).result()
+        started = time.perf_counter()
+        pending = []
+        for i, source in enumerate(sources):
+            while True:
+                try:
+                    pending.append(pool.submit(make_thumbnail, source, os.path.join(target_dir, f"{i}.jpg"), size))
+                    break
+                except PoolSaturated:
+                    # Пул заполнен: ждём самую старую задачу
+                    pending.pop(0).result()
+        for future in pending:
+            future.result()
+        elapsed = time.perf_counter() - started
+    pool.shutdown()
+    print(json.dumps({
+        "seconds": elapsed,
+        "images_per_second": len(sources) / elapsed,
+        # ru_maxrss в Linux - в килобайтах
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--size", type=int, default=250)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--worker", metavar="SOURCE_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, int(args.workers), args.size)
+        return
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        generate_images(source_dir, args.images, args.width, args.height)
+        print(f"{args.images} изображений {args.width}x{args.height}, миниатюры {args.size}px")
+        for workers in (int(value) for value in args.workers.split(",")):
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_thumbnails", "--worker", source_dir,
+                 "--workers", str(workers), "--size", str(args.size)],
+                capture_output=True, text=True, check=True,
+            )
+            output = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"процессов {workers}: {output['images_per_second']:.1f} изобр./с, "
+                  f"{output['seconds']:.2f} с, наибольший RSS процесса {output['max_rss_mb']:.0f} МБ")
+
+if __name__ == "__main__":
+    main()
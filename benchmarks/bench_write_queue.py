@@ -0,0 +1,82 @@
+"""Пропускная способность записи с групповой записью и без неё.
+
+Запуск: python -m benchmarks.bench_write_queue [--requests N] [--concurrency C] [--threads T]
+
+Каждый режим запускается в отдельном процессе со своей временной базой
+SQLite (WRITE_QUEUE_ENABLED=0 и 1). Нагрузка - только новые сообщения
+в T тредов от C параллельных клиентов.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODES = {
+    "commit на запрос": "0",
+    "групповая запись": "1",
+}
+
+# Замер в дочернем процессе: режим определяется переменными окружения при импорте backend
+def run_worker(requests_total: int, concurrency: int, threads: int):
+    from backend.main import app
+    from backend.auth import create_access_token, get_password_hash
+    from backend.database import SessionLocal, User, Thread
+    from backend.write_queue import write_queue
+    from benchmarks.common import run_load
+
+    db = SessionLocal()
+    db.add(User(email="bench@edu.hse.ru", password_hash=get_password_hash("bench")))
+    created = [Thread(title=f"Benchmark {i}") for i in range(threads)]
+    db.add_all(created)
+    db.commit()
+    thread_ids = [thread.id for thread in created]
+    db.close()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bench@edu.hse.ru'})}"}
+
+    def next_request(i):
+        return "POST messages", "POST", f"/threads/{thread_ids[i % threads]}/messages", {
+            "json": {"content": f"Нагрузка {i}"}, "headers": headers,
+        }
+
+    report = asyncio.run(run_load(app, next_request, requests_total, concurrency))
+    print(json.dumps({"report": report, "queue": write_queue.stats()}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.concurrency, args.threads)
+        return
+
+    from benchmarks.common import print_report
+    for mode, enabled in MODES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                WRITE_QUEUE_ENABLED=enabled,
+            )
+            env.setdefault("BCRYPT_ROUNDS", "4")
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_write_queue", "--worker",
+                 "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+                 "--threads", str(args.threads)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            output = json.loads(result.stdout.strip().splitlines()[-1])
+            print_report(f"{mode} (concurrency {args.concurrency})", output["report"])
+            if enabled == "1":
+                queue = output["queue"]
+                print(f"  пачек {queue['batches']}, средний размер {queue['average_batch']:.1f}, "
+                      f"наибольший {queue['largest_batch']}")
+
+if __name__ == "__main__":
+    main()
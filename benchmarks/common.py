@@ -0,0 +1,68 @@
+import asyncio
+import math
+import time
+from collections import defaultdict
+
+import httpx
+
+# Общие помощники для нагрузочных замеров: приложение вызывается
+# в том же процессе через ASGI, без сети и внешних сервисов
+
+# Перцентиль по методу ближайшего ранга
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+# Сводка по задержкам (в миллисекундах)
+def summarize(latencies, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+# Запуск нагрузки: concurrency параллельных клиентов выполняют
+# всего total запросов. next_request(i) возвращает (имя, метод, url, kwargs).
+# Результат - сводка по каждому имени запроса и общая ("all")
+async def run_load(app, next_request, total: int, concurrency: int) -> dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    counter = iter(range(total))
+    # Исключения приложения превращаются в ответ 500 и считаются ошибками
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for i in counter:
+                name, method, url, kwargs = next_request(i)
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                latency = time.perf_counter() - started
+                if response.status_code >= 400:
+                    errors[name] += 1
+                latencies[name].append(latency)
+                latencies["all"].append(latency)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    report = {name: summarize(values, elapsed) for name, values in latencies.items()}
+    for name, count in errors.items():
+        report[name]["errors"] = count
+    return report
+
+# Печать отчёта в виде таблицы
+def print_report(title: str, report: dict):
+    print(title)
+    print(f"  {'endpoint':<28}{'requests':>9}{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, row in sorted(report.items()):
+        print(
+            f"  {name:<28}{row['requests']:>9}{row['rps']:>10.1f}"
+            f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{row.get('errors', 0):>8}"
+        )
@@ -0,0 +1,76 @@
+import random
+from datetime import datetime, timedelta
+
+# Генератор данных форума для нагрузочных замеров. Детерминирован при
+# одном и том же seed. Популярность тредов распределена по закону Ципфа:
+# тред с рангом r получает долю сообщений, пропорциональную 1 / r^skew,
+# как на настоящей доске, где почти все сообщения приходятся на
+# небольшое число живых тредов
+
+WORDS = (
+    "матанализ коллоквиум дедлайн семинар лекция конспект экзамен пересдача "
+    "общага столовая кофе библиотека проект дискретка алгебра вышка питон "
+    "сессия зачёт преподаватель расписание курсовая стипендия кампус"
+).split()
+
+# Накопленные веса Ципфа для count элементов
+def zipf_weights(count: int, skew: float) -> list:
+    weights, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank ** skew
+        weights.append(total)
+    return weights
+
+class ForumGenerator:
+    def __init__(self, seed: int = 42, skew: float = 1.1):
+        self.random = random.Random(seed)
+        self.skew = skew
+
+    def text(self, low: int = 3, high: int = 25) -> str:
+        return " ".join(self.random.choices(WORDS, k=self.random.randint(low, high)))
+
+    # Выбор count тредов с учётом популярности (индексы в thread_ids)
+    def pick_threads(self, thread_ids: list, count: int) -> list:
+        weights = zipf_weights(len(thread_ids), self.skew)
+        return self.random.choices(thread_ids, cum_weights=weights, k=count)
+
+    # Сообщения: словари для bulk.insert_messages, по времени от start
+    def messages(self, thread_ids: list, count: int, start: datetime, span: timedelta) -> list:
+        step = span / max(count, 1)
+        return [
+            {"thread_id": thread_id, "content": self.text(), "created_at": start + step * i}
+            for i, thread_id in enumerate(self.pick_threads(thread_ids, count))
+        ]
+
+# Заполнение базы: threads тредов и messages сообщений за последние days дней.
+# Сообщения вставляются через bulk.insert_messages пачками по chunk_size.
+# Возвращает id тредов в порядке популярности (первый - самый популярный)
+def populate(db, threads: int, messages: int, seed: int = 42, skew: float = 1.1,
+             days: int = 30, chunk_size: int = 10000) -> list:
+    # backend импортируется здесь: DATABASE_URL задаётся до первого импорта
+    from sqlalchemy import insert
+    from backend import bulk, search
+    from backend.database import Thread
+
+    generator = ForumGenerator(seed, skew)
+    start = datetime.now() - timedelta(days=days)
+    thread_rows = [
+        {"title": generator.text(2, 6), "created_at": start, "bumped_at": start, "message_count": 0}
+        for _ in range(threads)
+    ]
+    thread_ids = list(db.execute(
+        insert(Thread.__table__).returning(Thread.__table__.c.id, sort_by_parameter_order=True),
+        thread_rows,
+    ).scalars())
+    db.commit()
+    # Названия тредов в поисковый индекс
+    if search.is_enabled(db):
+        search.rebuild_index(db)
+
+    span = timedelta(days=days)
+    for offset in range(0, messages, chunk_size):
+        count = min(chunk_size, messages - offset)
+        window_start = start + span * offset / max(messages, 1)
+        items = generator.messages(thread_ids, count, window_start, span * count / max(messages, 1))
+        bulk.insert_messages(db, items)
+    return thread_ids
@@ -0,0 +1,193 @@
+import functools
+import time
+from collections import OrderedDict
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+API_URL = "http://127.0.0.1:8000"
+
+# Таймауты (подключение, чтение) в секундах: зависший бэкенд не должен
+# блокировать перезапуск страницы
+TIMEOUT = (3.05, 10)
+
+# Размер пула соединений к API на процесс Streamlit
+POOL_SIZE = 10
+
+# Сколько секунд переиспользуются ответы на чтение без обращения к серверу
+READ_CACHE_TTL = 5
+
+# Сколько ответов хранить для условных запросов (ETag / Last-Modified)
+VALIDATOR_CACHE_SIZE = 100
+
+# Ошибка API: код ответа и текст из поля detail
+class ApiError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+# Общий пул соединений на процесс: соединения переиспользуются между
+# запросами, пользователями и перезапусками страницы вместо нового
+# TCP-рукопожатия
+@st.cache_resource
+def get_adapter() -> HTTPAdapter:
+    return HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+
+# Сессия requests у каждого пользователя своя: в её cookies лежит метка
+# собственных записей (чтение с основной базы), которая не должна
+# доставаться другим пользователям. Пул соединений при этом общий
+def get_session() -> requests.Session:
+    if "api_session" not in st.session_state:
+        session = requests.Session()
+        session.mount("http://", get_adapter())
+        session.mount("https://", get_adapter())
+        st.session_state["api_session"] = session
+    return st.session_state["api_session"]
+
+# Валидаторы и тела последних ответов для условных GET.
+# Когда TTL кэша чтений истёк, запрос уходит с If-None-Match и при 304
+# тело берётся отсюда, а сервер не строит его заново
+class ValidatorStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, etag, last_modified, body):
+        self._entries[key] = (etag, last_modified, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+# Валидаторы хранятся в сессии пользователя, как и его cookies:
+# ответ, прочитанный с основной базы после записи, не попадает другим
+def get_validator_store() -> ValidatorStore:
+    if "api_validators" not in st.session_state:
+        st.session_state["api_validators"] = ValidatorStore(VALIDATOR_CACHE_SIZE)
+    return st.session_state["api_validators"]
+
+def error_detail(response: requests.Response) -> str:
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = None
+    return detail if isinstance(detail, str) else f"HTTP {response.status_code}"
+
+def request(method: str, path: str, token: str = None, **kwargs):
+    """Запрос к API через сессию пользователя. Возвращает JSON или бросает ApiError."""
+    headers = kwargs.pop("headers", {})
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    response = get_session().request(method, f"{API_URL}{path}", headers=headers, timeout=TIMEOUT, **kwargs)
+    if not response.ok:
+        raise ApiError(response.status_code, error_detail(response))
+    return response.json()
+
+def get_json(path: str, params: dict = None):
+    """GET с валидаторами из предыдущего ответа на тот же запрос."""
+    params = {k: v for k, v in (params or {}).items() if v is not None}
+    store = get_validator_store()
+    key = (path, tuple(sorted(params.items())))
+    headers = {}
+    cached = store.get(key)
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    response = get_session().get(f"{API_URL}{path}", params=params, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304 and cached:
+        return cached[2]
+    if not response.ok:
+        raise ApiError(response.status_code, error_detail(response))
+    body = response.json()
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        store.put(key, etag, last_modified, body)
+    return body
+
+# Чтения кэшируются на READ_CACHE_TTL секунд в сессии пользователя:
+# после своей записи он сбрасывает только свой кэш и сразу видит её,
+# не трогая кэш остальных. Ошибки не кэшируются
+def read_cache() -> dict:
+    if "api_read_cache" not in st.session_state:
+        st.session_state["api_read_cache"] = {}
+    return st.session_state["api_read_cache"]
+
+def cached_read(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        cache = read_cache()
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        entry = cache.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        body = fn(*args, **kwargs)
+        # Заодно выбрасываем устаревшие ответы, чтобы кэш не рос
+        for stale in [k for k, (expires, _) in cache.items() if expires <= now]:
+            del cache[stale]
+        cache[key] = (now + READ_CACHE_TTL, body)
+        return body
+    return wrapper
+
+@cached_read
+def get_threads(order: str = "created", after_id: int = None, cursor: str = None, archived: bool = False):
+    params = {"order": order, "after_id": after_id, "cursor": cursor}
+    if archived:
+        params["archived"] = True
+    return get_json("/threads", params)
+
+@cached_read
+def get_thread_page(thread_id: int):
+    return get_json(f"/threads/{thread_id}/page")
+
+@cached_read
+def get_messages(thread_id: int, after_id: int = None):
+    return get_json(f"/threads/{thread_id}/messages", {"after_id": after_id})
+
+# Номера ответов на сообщения с номерами от start до start + limit - 1
+@cached_read
+def get_backlinks(thread_id: int, start: int, limit: int):
+    return get_json(f"/threads/{thread_id}/backlinks", {"start": start, "limit": limit})
+
+@cached_read
+def search(q: str):
+    return get_json("/search", {"q": q})
+
+# Сброс кэша чтений после собственных записей клиента, чтобы
+# автор сразу увидел свой тред или сообщение
+def clear_read_cache():
+    read_cache().clear()
+
+def register(email: str, password: str):
+    return request("POST", "/register", json={"email": email, "password": password})
+
+def login(email: str, password: str) -> str:
+    return request("POST", "/login", data={"username": email, "password": password})["access_token"]
+
+def create_thread(token: str, title: str):
+    thread = request("POST", "/threads", token=token, json={"title": title})
+    clear_read_cache()
+    return thread
+
+def create_message(token: str, thread_id: int, content: str, files=None):
+    """files - список (имя, байты, MIME-тип); с ними сообщение уходит как multipart."""
+    if files:
+        message = request(
+            "POST", f"/threads/{thread_id}/messages", token=token,
+            data={"content": content}, files=[("files", file) for file in files],
+        )
+    else:
+        message = request("POST", f"/threads/{thread_id}/messages", token=token, json={"content": content})
+    clear_read_cache()
+    return message
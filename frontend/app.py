@@ -1,52 +1,39 @@
+import html
 import streamlit as st
+import streamlit.components.v1 as components
 import requests
 import logging
 from datetime import datetime
 
+import api_client as api
+
 # Логирование
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-API_URL = "http://127.0.0.1:8000"
+# Как часто лента сообщений открытого треда проверяет новые сообщения (секунды)
+MESSAGES_REFRESH_SECONDS = 5
+
+def show_error(e: Exception):
+    logger.error(f"Ошибка: {e}")
+    st.error(e.detail if isinstance(e, api.ApiError) else f"Ошибка: {e}")
 
 def register(email: str, password: str):
     try:
-        response = requests.post(
-            f"{API_URL}/register",
-            json={"email": email, "password": password},
-        )
-        if response.status_code == 200:
-            st.success("Пользователь успешно зарегистрирован!")
-            return True
-        else:
-            st.error(response.json().get("detail", "Ошибка регистрации"))
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
+        api.register(email, password)
+        st.success("Пользователь успешно зарегистрирован!")
+        return True
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
         return False
 
 def login(email: str, password: str):
     try:
-        response = requests.post(
-            f"{API_URL}/login",
-            data={"username": email, "password": password},
-        )
-        if response.status_code == 200:
-            token = response.json().get("access_token")
-            if token:
-                st.session_state["access_token"] = token
-                st.success("Вход выполнен успешно!")
-                return True
-            else:
-                st.error("Не удалось получить токен.")
-                return False
-        else:
-            st.error(response.json().get("detail", "Ошибка входа"))
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
+        st.session_state["access_token"] = api.login(email, password)
+        st.success("Вход выполнен успешно!")
+        return True
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
         return False
 
 def logout():
@@ -62,135 +49,316 @@ def create_thread(title: str):
         st.error("Вы не авторизованы. Пожалуйста, войдите в систему.")
         return None
     try:
-        response = requests.post(
-            f"{API_URL}/threads",
-            json={"title": title},
-            headers={"Authorization": f"Bearer {token}"},
-        )
-        if response.status_code == 200:
-            thread_id = response.json().get("id")  # Получаем ID созданного треда
-            st.success("Тред успешно создан!")
-            return thread_id
-        else:
-            st.error(response.json().get("detail", "Ошибка создания треда"))
-            return None
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
+        thread = api.create_thread(token, title)
+        st.success("Тред успешно создан!")
+        return thread["id"]
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
         return None
 
-def get_threads():
+# Сортировки списка тредов: значение параметра order -> подпись
+THREAD_ORDERS = {
+    "bumped": "По последнему сообщению",
+    "active": "Самые активные",
+    "created": "По дате создания",
+}
+
+def get_threads(order: str = "created", after_id: int = None, cursor: str = None, archived: bool = False):
+    """Возвращает страницу тредов: {"items": [...], "next_cursor": ...}."""
     try:
-        response = requests.get(f"{API_URL}/threads")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(response.json().get("detail", "Ошибка получения тредов"))
-            return []
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
-        return []
+        return api.get_threads(order, after_id, cursor, archived)
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
+        return {"items": [], "next_cursor": None}
+
+def load_threads(load_more: bool = False, refresh: bool = False):
+    """Возвращает загруженные треды, подгружая их по страницам.
+
+    В порядке создания работает как load_messages: когда список дочитан,
+    запрашиваются только новые треды. Порядок "по бампу" и по активности
+    меняется со временем, поэтому такой список загружается заново
+    только при смене сортировки или по кнопке обновления.
+    Архивные треды листаются так же, но отдельным списком.
+    """
+    order = st.session_state.get("threads_order", "bumped")
+    archived = st.session_state.get("threads_archived", False)
+    if refresh or st.session_state.get("threads_loaded_order") != (order, archived):
+        st.session_state["threads_loaded_order"] = (order, archived)
+        st.session_state["threads"] = []
+        st.session_state["threads_cursor"] = None
+        load_more = True
+    threads = st.session_state["threads"]
+    if order == "created":
+        if load_more or st.session_state["threads_cursor"] is None:
+            after_id = threads[-1]["id"] if threads else None
+            page = get_threads(order, after_id=after_id, archived=archived)
+            threads.extend(page["items"])
+            st.session_state["threads_cursor"] = page["next_cursor"]
+    elif load_more:
+        page = get_threads(order, cursor=st.session_state["threads_cursor"], archived=archived)
+        threads.extend(page["items"])
+        st.session_state["threads_cursor"] = page["next_cursor"]
+    return threads
 
 def search_threads(query: str):
+    """Ищет треды на сервере по названию и тексту сообщений."""
     try:
-        # Если запрос пустой, возвращаем все треды
+        # Если запрос пустой, возвращаем загруженные треды
         if not query.strip():
-            return get_threads()
+            return load_threads()
+
+        page = api.search(query)
 
-        # Фильтруем треды по названию (поиск по подстроке)
-        threads = get_threads()
-        filtered_threads = [
-            thread for thread in threads
-            if query.lower() in thread["title"].lower()
-        ]
+        # Совпадения приходят по релевантности; оставляем по одному на тред
+        threads = {}
+        for hit in page["items"]:
+            threads.setdefault(hit["thread_id"], {"id": hit["thread_id"], "title": hit["title"]})
 
-        if not filtered_threads:
-            st.error("Треды с таким названием не найдены.")
+        if not threads:
+            st.error("Треды по такому запросу не найдены.")
             return []
 
-        return filtered_threads
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
+        return list(threads.values())
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
         return []
 
-def get_messages(thread_id: int):
+def get_messages(thread_id: int, after_id: int = None):
+    """Возвращает страницу сообщений треда: {"items": [...], "next_cursor": ...}."""
     try:
-        response = requests.get(f"{API_URL}/threads/{thread_id}/messages")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(response.json().get("detail", "Ошибка получения сообщений"))
-            return []
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
-        return []
+        return api.get_messages(thread_id, after_id)
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
+        return {"items": [], "next_cursor": None}
 
-def create_message(thread_id: int, content: str):
+def open_thread(thread_id: int):
+    """Загружает тред и первую страницу его сообщений одним запросом."""
+    try:
+        page = api.get_thread_page(thread_id)
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
+        page = {"thread": None, "messages": {"items": [], "next_cursor": None}}
+    st.session_state["messages_thread_id"] = thread_id
+    st.session_state["thread"] = page["thread"]
+    st.session_state["messages"] = list(page["messages"]["items"])
+    st.session_state["messages_cursor"] = page["messages"]["next_cursor"]
+    st.session_state["messages_window"] = MESSAGES_WINDOW
+    st.session_state["post_html"] = {}
+
+def load_messages(thread_id: int, load_more: bool = False):
+    """Возвращает загруженные сообщения треда, подгружая их по страницам.
+
+    При открытии треда данные треда и первая страница сообщений приходят
+    одним запросом. Пока есть непрочитанные страницы, следующая грузится
+    только по запросу пользователя. Когда тред дочитан до конца, на каждом
+    перезапуске запрашиваются лишь сообщения после последнего загруженного.
+    """
+    if st.session_state.get("messages_thread_id") != thread_id:
+        open_thread(thread_id)
+        return st.session_state["messages"]
+    messages = st.session_state["messages"]
+    if load_more or st.session_state["messages_cursor"] is None:
+        after_id = messages[-1]["id"] if messages else None
+        page = get_messages(thread_id, after_id)
+        messages.extend(page["items"])
+        st.session_state["messages_cursor"] = page["next_cursor"]
+    refresh_pending_thumbnails(thread_id, messages)
+    return messages
+
+def refresh_pending_thumbnails(thread_id: int, messages):
+    """Перечитывает загруженные сообщения, миниатюры которых ещё строятся.
+
+    Миниатюры строятся после отправки сообщения, поэтому сообщение могло
+    загрузиться без них. Страница запрашивается с первого такого сообщения;
+    пока миниатюры не готовы, сервер отвечает 304 по ETag.
+    """
+    pending = [
+        message["id"] for message in messages
+        if any(attachment.get("thumbnail_status") == "pending" for attachment in message.get("attachments", []))
+    ]
+    if not pending:
+        return
+    fresh = {item["id"]: item for item in get_messages(thread_id, pending[0] - 1)["items"]}
+    for position, message in enumerate(messages):
+        if message["id"] in fresh:
+            messages[position] = fresh[message["id"]]
+
+def create_message(thread_id: int, content: str, uploads=()):
     token = st.session_state.get("access_token")
     if not token:
         st.error("Вы не авторизованы. Пожалуйста, войдите в систему.")
         return False
+    files = [(upload.name, upload.getvalue(), upload.type) for upload in uploads]
     try:
-        response = requests.post(
-            f"{API_URL}/threads/{thread_id}/messages",
-            json={"content": content},
-            headers={"Authorization": f"Bearer {token}"},
-        )
-        if response.status_code == 200:
-            st.success("Сообщение успешно отправлено!")
-            return True
-        else:
-            st.error(response.json().get("detail", "Ошибка отправки сообщения"))
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка: {e}")
-        st.error(f"Ошибка: {e}")
+        api.create_message(token, thread_id, content, files)
+        st.success("Сообщение успешно отправлено!")
+        return True
+    except (api.ApiError, requests.RequestException) as e:
+        show_error(e)
         return False
 
 def format_date(created_at: str):
     """Форматирует дату и время в нужный формат."""
     if created_at.endswith("Z"):
         created_at = created_at[:-1]
-    dt = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S.%f")
-    formatted_date = dt.strftime("%y/%m/%d %a %H:%M:%S")
-    return formatted_date
-
-def display_chat(messages):
-    for index, message in enumerate(messages, start=1):
-        formatted_date = format_date(message["created_at"])
-        st.markdown(
-            f"""
-            <div style="
-                border: 1px solid lightgray;
-                background-color: #f9f9f9;
-                padding: 10px;
-                margin-bottom: 10px;
-                border-radius: 5px;
-            ">
-                <p style="color: orange !important;"><b>Аноним</b> {formatted_date} №{index}</p>
-                <p style="color: black !important;">{message['content']}</p>
-                <button 
-                    style="
-                        background-color: white; 
-                        border: 1px solid orange; 
-                        color: orange; 
-                        cursor: pointer; 
-                        padding: 5px 10px; 
-                        border-radius: 5px;
-                    " 
-                    onclick="document.getElementById('reply_to_{index}').click()"
-                >
-                    Ответить
-                </button>
-                <button id="reply_to_{index}" style="display: none;" 
-                    onclick="document.getElementById('new_message').value += '>>{index}\\n';">
-                </button>
-            </div>
-            """,
-            unsafe_allow_html=True,
+    return datetime.fromisoformat(created_at).strftime("%y/%m/%d %a %H:%M:%S")
+
+# Сколько номеров сообщений запрашивать за раз (ограничение limit на сервере)
+BACKLINKS_PAGE_SIZE = 200
+
+def load_backlinks(thread_id: int, messages) -> dict:
+    """Ответы на загруженные сообщения: номер сообщения -> номера ответов."""
+    numbers = [message["post_number"] for message in messages if message.get("post_number")]
+    if not numbers:
+        return {}
+    backlinks = {}
+    for start in range(min(numbers), max(numbers) + 1, BACKLINKS_PAGE_SIZE):
+        try:
+            page = api.get_backlinks(thread_id, start, BACKLINKS_PAGE_SIZE)
+        except (api.ApiError, requests.RequestException) as e:
+            logger.warning("Не удалось загрузить ответы: %s", e)
+            return backlinks
+        backlinks.update((item["post_number"], item["replies"]) for item in page["items"])
+    return backlinks
+
+# Сколько последних загруженных сообщений показывать сразу и на сколько
+# расширять окно по кнопке "Показать более ранние"
+MESSAGES_WINDOW = 100
+# Наибольшая высота ленты (пиксели): дальше лента прокручивается внутри
+# и примерная высота сообщения без вложений и с ними
+THREAD_VIEW_HEIGHT = 700
+POST_HEIGHT = 130
+ATTACHMENTS_HEIGHT = 260
+
+# Стили и скрипт ленты выводятся один раз на всю ленту, а не в каждом сообщении
+THREAD_CSS = """
+body { margin: 0; font-family: sans-serif; }
+.post {
+    border: 1px solid lightgray;
+    background-color: #f9f9f9;
+    padding: 10px;
+    margin-bottom: 10px;
+    border-radius: 5px;
+}
+.post-header { color: orange; }
+.post-content { color: black; }
+.post-content .quote { color: #789922; }
+.post-content code { background-color: #eee; padding: 0 3px; }
+.reply-link { color: orange; }
+.post-replies { color: gray; }
+.post-replies a { color: gray; }
+.post img { max-width: 250px; margin-right: 10px; }
+.reply-button {
+    background-color: white;
+    border: 1px solid orange;
+    color: orange;
+    cursor: pointer;
+    padding: 5px 10px;
+    border-radius: 5px;
+}
+"""
+
+# Кнопка "Ответить" дописывает >>N в поле нового сообщения на странице
+# Streamlit (поле управляется React, поэтому значение ставится через
+# setter прототипа и событие input)
+THREAD_SCRIPT = """
+function replyTo(number) {
+    const field = window.parent.document.querySelector('textarea[aria-label="Введите текст сообщения"]');
+    if (!field) return;
+    const setter = Object.getOwnPropertyDescriptor(window.HTMLTextAreaElement.prototype, "value").set;
+    setter.call(field, field.value + ">>" + number + "\\n");
+    field.dispatchEvent(new Event("input", { bubbles: true }));
+    field.focus();
+}
+window.addEventListener("load", () => window.scrollTo(0, document.body.scrollHeight));
+"""
+
+def attachment_html(attachment) -> str:
+    """Миниатюра со ссылкой на оригинал (пока миниатюры нет - только ссылка)."""
+    url = f"{api.API_URL}{attachment['url']}"
+    if attachment.get("thumbnail_url"):
+        preview = f'<img src="{api.API_URL}{attachment["thumbnail_url"]}" loading="lazy">'
+    else:
+        preview = html.escape(attachment.get("name") or "изображение")
+    return f'<a href="{url}" target="_blank">{preview}</a>'
+
+def content_html(message) -> str:
+    """Текст сообщения: HTML, размеченный сервером, или экранированный текст."""
+    if message.get("content_html") is not None:
+        return message["content_html"]
+    return html.escape(message["content"]).replace("\n", "<br>")
+
+def post_html(message, number: int) -> str:
+    """HTML сообщения без списка ответов, запомненный по id сообщения.
+
+    Сообщение не меняется, кроме готовности миниатюр, поэтому HTML
+    строится заново, только когда у вложений появилась миниатюра.
+    """
+    attachments = message.get("attachments", [])
+    version = tuple(attachment.get("thumbnail_url") for attachment in attachments)
+    cache = st.session_state.setdefault("post_html", {})
+    cached = cache.get(message["id"])
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    rendered = (
+        f'<p class="post-header"><b>Аноним</b> {format_date(message["created_at"])} №{number}</p>'
+        + "".join(attachment_html(attachment) for attachment in attachments)
+        + f'<p class="post-content">{content_html(message)}</p>'
+    )
+    cache[message["id"]] = (version, rendered)
+    return rendered
+
+def display_chat(messages, backlinks=None):
+    """Выводит сообщения одним HTML-компонентом вместо элемента на сообщение."""
+    backlinks = backlinks or {}
+    posts = []
+    height = 0
+    for position, message in enumerate(messages, start=1):
+        number = message.get("post_number") or position
+        replies = " ".join(f'<a href="#post-{reply}">&gt;&gt;{reply}</a>' for reply in backlinks.get(number, []))
+        replies_html = f'<p class="post-replies">Ответы: {replies}</p>' if replies else ""
+        posts.append(
+            f'<div class="post" id="post-{number}">{post_html(message, number)}{replies_html}'
+            f'<button class="reply-button" onclick="replyTo({number})">Ответить</button></div>'
+        )
+        height += POST_HEIGHT + (ATTACHMENTS_HEIGHT if message.get("attachments") else 0)
+    if not posts:
+        return
+    components.html(
+        f"<style>{THREAD_CSS}</style><script>{THREAD_SCRIPT}</script>{''.join(posts)}",
+        height=min(height, THREAD_VIEW_HEIGHT),
+        scrolling=True,
+    )
+
+def show_earlier_messages():
+    st.session_state["messages_window"] += MESSAGES_WINDOW
+
+@st.fragment(run_every=MESSAGES_REFRESH_SECONDS)
+def thread_messages_view(thread_id: int):
+    """Лента сообщений треда.
+
+    Фрагмент перезапускается отдельно от остальной страницы и запрашивает
+    только сообщения после последнего загруженного - так же, как поток
+    /threads/{id}/events догружает пропущенное по Last-Event-ID.
+    Выводятся только последние messages_window сообщений, поэтому время
+    отрисовки не растёт вместе с тредом; более ранние показываются по кнопке.
+    """
+    messages = load_messages(thread_id)
+    hidden = max(0, len(messages) - st.session_state["messages_window"])
+    if hidden:
+        st.button(
+            f"Показать более ранние сообщения ({hidden})",
+            key="show_earlier_messages",
+            on_click=show_earlier_messages,
+        )
+    visible = messages[hidden:]
+    display_chat(visible, load_backlinks(thread_id, visible))
+    if st.session_state["messages_cursor"] is not None:
+        st.button(
+            "Загрузить ещё сообщения",
+            key="load_more_messages",
+            on_click=load_messages,
+            args=(thread_id, True),
         )
 
 def main():
@@ -253,11 +421,11 @@ def main():
 
             # Поиск тредов
             st.subheader("Поиск треда")
-            search_query = st.text_input("Введите название треда или часть названия", key="search_query_sidebar")
+            search_query = st.text_input("Введите слова из названия или сообщений", key="search_query_sidebar")
             if st.button("Поиск", key="search_button_sidebar"):
                 threads = search_threads(search_query)
             else:
-                threads = get_threads()
+                threads = load_threads()
         else:
             st.write("Вы не вошли в систему.")
 
@@ -266,8 +434,8 @@ def main():
         # Если выбран тред, показываем его страницу
         if st.session_state["selected_thread_id"]:
             thread_id = st.session_state["selected_thread_id"]
-            threads = get_threads()
-            thread = next((t for t in threads if t["id"] == thread_id), None)
+            load_messages(thread_id)
+            thread = st.session_state["thread"]
             if thread:
                 st.title(f"{thread['title']} (ID: {thread['id']})")
             else:
@@ -277,13 +445,18 @@ def main():
                 st.session_state["selected_thread_id"] = None
                 st.rerun()
 
-            messages = get_messages(thread_id)
-            display_chat(messages)
+            thread_messages_view(thread_id)
 
             st.header("Новое сообщение")
             new_message = st.text_area("Введите текст сообщения", key="new_message")
-            if st.button("Отправить", disabled=not new_message.strip(), key="send_message_button"):
-                if create_message(thread_id, new_message):
+            uploads = st.file_uploader(
+                "Изображения",
+                type=["jpg", "jpeg", "png", "gif", "webp"],
+                accept_multiple_files=True,
+                key="new_message_files",
+            )
+            if st.button("Отправить", disabled=not (new_message.strip() or uploads), key="send_message_button"):
+                if create_message(thread_id, new_message, uploads):
                     st.rerun()
 
             if st.button("Вернуться к списку тредов", key="back_to_threads_bottom"):
@@ -297,10 +470,26 @@ def main():
 
         # Список тредов
         st.header("Треды")
+        st.selectbox(
+            "Сортировка",
+            list(THREAD_ORDERS),
+            format_func=THREAD_ORDERS.get,
+            key="threads_order",
+        )
+        st.checkbox("Архив", key="threads_archived")
+        if st.button("Обновить список", key="refresh_threads"):
+            threads = load_threads(refresh=True)
         for thread in threads:
-            if st.button(f"{thread['title']} (ID: {thread['id']})", key=f"thread_{thread['id']}"):
+            label = f"{thread['title']} (ID: {thread['id']})"
+            if "message_count" in thread:
+                label += f" · сообщений: {thread['message_count']}"
+            if st.button(label, key=f"thread_{thread['id']}"):
                 st.session_state["selected_thread_id"] = thread["id"]
                 st.rerun()
+        if st.session_state.get("threads_cursor") is not None:
+            if st.button("Загрузить ещё треды", key="load_more_threads"):
+                load_threads(load_more=True)
+                st.rerun()
 
     else:
         # Страница входа/регистрации
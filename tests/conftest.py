@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+# Тесты работают с отдельной временной базой, а не с рабочей hse_forum.db.
+# Переменная должна быть задана до импорта backend.database. DATABASE_URL
+# из окружения не используется: тесты пишут в базу, а адрес, оставшийся
+# в оболочке от запуска сервера, указывал бы на настоящую. Выбрать можно
+# только драйвер (TEST_DATABASE_DRIVER, например sqlite+aiosqlite)
+_test_db_dir = tempfile.mkdtemp(prefix="amichan_tests_")
+_test_db_driver = os.environ.get("TEST_DATABASE_DRIVER", "sqlite")
+os.environ["DATABASE_URL"] = f"{_test_db_driver}:///{os.path.join(_test_db_dir, 'test_forum.db')}"
+
+# Минимальная стоимость bcrypt ускоряет тесты, где создаются пользователи
+os.environ.setdefault("BCRYPT_ROUNDS", "5")
+
+# Файлы вложений тоже во временном каталоге, независимо от окружения
+os.environ["MEDIA_ROOT"] = os.path.join(_test_db_dir, "media")
@@ -0,0 +1,137 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, Message, ArchivedThread
+from backend.auth import create_access_token, get_password_hash
+from backend import archive, search
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "archive@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для треда без сообщений дольше срока архивации
+@pytest.fixture
+def dead_thread(db):
+    old = datetime.now() - timedelta(days=archive.ARCHIVE_AFTER_DAYS + 10)
+    thread = Thread(title="Мёртвый тред", created_at=old, bumped_at=old)
+    db.add(thread)
+    db.flush()
+    db.add_all(
+        Message(thread_id=thread.id, content=f"Сообщение {i}", created_at=old + timedelta(seconds=i))
+        for i in range(5)
+    )
+    thread.message_count = 5
+    # Самый новый тред и тред с последним сообщением не архивируются
+    live = Thread(title="Живой тред")
+    db.add(live)
+    db.flush()
+    db.add(Message(thread_id=live.id, content="Свежее сообщение"))
+    db.commit()
+    return thread.id
+
+# Тест архивации: тред уходит из живых таблиц, но читается через те же эндпоинты
+def test_archived_thread_stays_readable(client, db, dead_thread, auth_headers):
+    before = client.get(f"/threads/{dead_thread}/messages").json()
+    page_before = client.get(f"/threads/{dead_thread}/page", params={"limit": 2, "last": True}).json()
+
+    while archive.archive_step(db):
+        pass
+    assert db.get(Thread, dead_thread) is None
+    assert db.query(Message).filter(Message.thread_id == dead_thread).count() == 0
+    assert db.get(ArchivedThread, dead_thread).message_count == 5
+
+    response = client.get(f"/threads/{dead_thread}/messages")
+    assert response.status_code == 200
+    assert response.json() == before
+    older = client.get(f"/threads/{dead_thread}/messages", params={"before_id": before["items"][2]["id"], "limit": 1})
+    assert older.json()["items"] == [before["items"][1]]
+    assert client.get(f"/threads/{dead_thread}/page", params={"limit": 2, "last": True}).json() == page_before
+
+    # Условный запрос к архивному треду тоже отвечает 304
+    etag = response.headers["ETag"]
+    assert client.get(f"/threads/{dead_thread}/messages", headers={"If-None-Match": etag}).status_code == 304
+
+    # Архив только для чтения
+    response = client.post(f"/threads/{dead_thread}/messages", json={"content": "Некропост"}, headers=auth_headers)
+    assert response.status_code == 404
+
+# Тест списка тредов: архивация меняет ETag, и клиент с прежним ETag
+# получает новый список без архивного треда
+def test_archiving_changes_thread_list_etag(client, db, dead_thread):
+    params = {"after_id": dead_thread - 1, "limit": 1}
+    response = client.get("/threads", params=params)
+    etag = response.headers["ETag"]
+    assert dead_thread in [thread["id"] for thread in response.json()["items"]]
+
+    archive.archive_threads(db, [dead_thread])
+    response = client.get("/threads", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert dead_thread not in [thread["id"] for thread in response.json()["items"]]
+
+# Тест: архивный тред виден в списке архива (с условными запросами)
+# и находится поиском
+def test_archived_thread_is_listed_and_searchable(client, db, dead_thread):
+    # Тред фикстуры добавлен мимо crud, в индекс его добавляет перестройка
+    search.rebuild_index(db)
+    response = client.get("/threads", params={"archived": True, "order": "bumped"})
+    etag = response.headers["ETag"]
+    assert dead_thread not in [thread["id"] for thread in response.json()["items"]]
+
+    archive.archive_threads(db, [dead_thread])
+    response = client.get("/threads", params={"archived": True, "order": "bumped"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    [listed] = [thread for thread in response.json()["items"] if thread["id"] == dead_thread]
+    assert (listed["title"], listed["message_count"]) == ("Мёртвый тред", 5)
+    etag = response.headers["ETag"]
+    assert client.get(
+        "/threads", params={"archived": True, "order": "bumped"}, headers={"If-None-Match": etag}
+    ).status_code == 304
+    created = client.get("/threads", params={"archived": True, "after_id": dead_thread - 1, "limit": 1}).json()
+    assert [thread["id"] for thread in created["items"]] == [dead_thread]
+
+    hits = client.get("/search", params={"q": "Мёртвый", "limit": 200}).json()["items"]
+    assert {"kind": "thread", "thread_id": dead_thread, "archived": True} in [
+        {key: hit[key] for key in ("kind", "thread_id", "archived")} for hit in hits
+    ]
+    hits = client.get("/search", params={"q": "Сообщение", "limit": 200}).json()["items"]
+    assert any(hit["thread_id"] == dead_thread and hit["kind"] == "message" for hit in hits)
+
+    # После перестройки индекса архив тоже ищется
+    search.rebuild_index(db)
+    hits = client.get("/search", params={"q": "Мёртвый", "limit": 200}).json()["items"]
+    assert any(hit["thread_id"] == dead_thread and hit["archived"] for hit in hits)
+
+# Тест лимита активных тредов: в архив уходят треды с самым давним бампом
+def test_archive_candidates_respect_active_cap(db, monkeypatch):
+    stale = Thread(title="Самый давний бамп", bumped_at=datetime(1990, 1, 1))
+    db.add(stale)
+    db.add(Thread(title="Свежий тред"))
+    db.commit()
+    active = db.query(Thread).count()
+    monkeypatch.setattr(archive, "ARCHIVE_AFTER_DAYS", 0)
+    monkeypatch.setattr(archive, "ARCHIVE_MAX_ACTIVE_THREADS", active - 1)
+    assert archive.archive_candidates(db, datetime.now(), 10) == [stale.id]
+    monkeypatch.setattr(archive, "ARCHIVE_MAX_ACTIVE_THREADS", active)
+    assert archive.archive_candidates(db, datetime.now(), 10) == []
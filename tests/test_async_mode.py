@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Тест: те же сценарии проходят в асинхронном режиме (AsyncSession + aiosqlite).
+# Режим выбирается при импорте backend, поэтому тесты запускаются в отдельном процессе
+def test_async_mode():
+    pytest.importorskip("aiosqlite")
+    env = dict(os.environ, TEST_DATABASE_DRIVER="sqlite+aiosqlite")
+    result = subprocess.run(
+        [
+            sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider",
+            "tests/test_search.py", "tests/test_auth_cache.py", "tests/test_database.py", "tests/test_bulk.py", "tests/test_metrics.py",
+            "tests/test_write_queue.py", "tests/test_replicas.py", "tests/test_replies.py",
+            "tests/test_attachments.py", "tests/test_render.py", "tests/test_jobs.py",
+            "tests/test_auth.py::test_login_rehashes_outdated_password",
+        ],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stdout
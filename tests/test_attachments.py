@@ -0,0 +1,174 @@
+import io
+import os
+import time
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, Message, Attachment
+from backend.auth import create_access_token, get_password_hash
+from backend import media
+from backend.config import MAX_ATTACHMENTS
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "attachments@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для тестового треда
+@pytest.fixture
+def thread_id(db):
+    thread = Thread(title="Тред с картинками")
+    db.add(thread)
+    db.commit()
+    return thread.id
+
+# Изображение PNG с уникальным содержимым
+def make_png(width=800, height=600) -> bytes:
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def wait_for_thumbnail(db, attachment_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.expire_all()
+        attachment = db.get(Attachment, attachment_id)
+        if attachment.thumbnail_status != "pending":
+            return attachment
+        time.sleep(0.1)
+    raise AssertionError("Миниатюра не построена")
+
+# Тест загрузки: файл по хэшу, повтор без копии, миниатюра вне запроса
+# и отдача файлов с долгим кэшированием
+def test_upload_attachment_and_thumbnail(client, db, auth_headers, thread_id):
+    png = make_png()
+    response = client.post(
+        f"/threads/{thread_id}/messages",
+        data={"content": "Смотрите"},
+        files=[("files", ("cat.png", png, "image/png"))],
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    message = response.json()
+    assert message["content"] == "Смотрите"
+    assert message["attachment_count"] == 1
+    attachment = message["attachments"][0]
+    assert attachment["name"] == "cat.png"
+    assert attachment["size"] == len(png)
+    assert attachment["url"] == f"/media/src/{attachment['sha256']}.png"
+
+    # Тот же файл во втором сообщении хранится на диске один раз
+    response = client.post(
+        f"/threads/{thread_id}/messages",
+        data={"content": ">>1 и ещё раз"},
+        files=[("files", ("copy.png", png, "image/png"))],
+        headers=auth_headers,
+    )
+    assert response.json()["attachments"][0]["sha256"] == attachment["sha256"]
+    stored = os.listdir(os.path.dirname(media.source_path(attachment["sha256"], "png")))
+    assert stored.count(f"{attachment['sha256']}.png") == 1
+
+    ready = wait_for_thumbnail(db, attachment["id"])
+    assert (ready.thumbnail_status, ready.width, ready.height) == ("ready", 800, 600)
+    items = client.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert [item["attachments"][0]["thumbnail_url"] for item in items] == [f"/media/thumb/{attachment['sha256']}.jpg"] * 2
+
+    response = client.get(items[0]["attachments"][0]["thumbnail_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    assert max(Image.open(io.BytesIO(response.content)).size) <= media.THUMBNAIL_SIZE
+    response = client.get(attachment["url"], headers={"If-None-Match": f'"{attachment["sha256"]}.png"'})
+    assert response.status_code == 304
+
+# Тест условных запросов: готовая миниатюра меняет ETag страниц треда,
+# клиент с прежним ETag получает страницу с адресом миниатюры
+def test_thumbnail_changes_etag(client, db, auth_headers, thread_id):
+    response = client.post(f"/threads/{thread_id}/messages", json={"content": "Картинка"}, headers=auth_headers)
+    message_id = response.json()["id"]
+    sha256 = os.urandom(32).hex()
+    db.add(Attachment(
+        message_id=message_id, thread_id=thread_id, sha256=sha256,
+        extension="png", content_type="image/png", size=1, name="cat.png",
+    ))
+    db.query(Message).filter(Message.id == message_id).update({"attachment_count": 1})
+    db.commit()
+
+    urls = (f"/threads/{thread_id}/messages", f"/threads/{thread_id}/page")
+    responses = [client.get(url) for url in urls]
+    etags = [response.headers["ETag"] for response in responses]
+    assert responses[0].json()["items"][0]["attachments"][0]["thumbnail_status"] == "pending"
+    assert client.get(urls[0], headers={"If-None-Match": etags[0]}).status_code == 304
+
+    media.mark_thumbnail(db, sha256, (800, 600))
+    for url, etag in zip(urls, etags):
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+    item = response.json()["messages"]["items"][0]
+    assert item["attachments"][0]["thumbnail_url"] == f"/media/thumb/{sha256}.jpg"
+    assert item["attachments"][0]["thumbnail_status"] == "ready"
+
+# Тест проверок: не изображение, слишком много файлов, недопустимое имя файла
+def test_rejected_uploads(client, auth_headers, thread_id):
+    response = client.post(
+        f"/threads/{thread_id}/messages",
+        data={"content": "Не картинка"},
+        files=[("files", ("script.png", b"#!/bin/sh\necho", "image/png"))],
+        headers=auth_headers,
+    )
+    assert response.status_code == 415
+    response = client.post(
+        f"/threads/{thread_id}/messages",
+        data={"content": "Много"},
+        files=[("files", (f"{i}.png", make_png(8, 8), "image/png")) for i in range(MAX_ATTACHMENTS + 1)],
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+    assert client.post(f"/threads/{thread_id}/messages", content=b"{", headers=auth_headers).status_code == 422
+    assert client.get("/media/src/..%2F..%2Fhse_forum.db").status_code == 404
+    assert media.media_path("src", "../" + "0" * 64 + ".png") is None
+
+# Тест: вложения не сохраняются, если треда нет, и пустые файлы отклоняются
+def test_upload_checks_before_storing(client, auth_headers, thread_id):
+    def stored_files():
+        return sorted(os.path.relpath(os.path.join(root, name), media.MEDIA_ROOT)
+                      for root, _, names in os.walk(media.MEDIA_ROOT) for name in names)
+
+    before = stored_files()
+    response = client.post(
+        "/threads/999999/messages",
+        data={"content": "В никуда"},
+        files=[("files", ("lost.png", make_png(8, 8), "image/png"))],
+        headers=auth_headers,
+    )
+    assert response.status_code == 404
+    response = client.post(
+        f"/threads/{thread_id}/messages",
+        data={"content": "Пусто"},
+        files=[("files", ("empty.png", b"", "image/png"))],
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+    assert stored_files() == before
@@ -57,4 +57,33 @@ def test_invalid_login(client, test_user):
         data={"username": test_user["email"], "password": "wrongpassword"}
     )
     assert response.status_code == 401
-    assert response.json()["detail"] == "Неверная почта или пароль"
\ No newline at end of file
+    assert response.json()["detail"] == "Неверная почта или пароль"
+
+# Тест пересчёта хэша с устаревшей стоимостью bcrypt при входе
+def test_login_rehashes_outdated_password(client):
+    from passlib.context import CryptContext
+    db = SessionLocal()
+    email = "rehash@edu.hse.ru"
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password123")
+    db.add(User(email=email, password_hash=old_hash))
+    db.commit()
+
+    response = client.post("/login", data={"username": email, "password": "password123"})
+    assert response.status_code == 200
+    db.expire_all()
+    new_hash = db.query(User).filter(User.email == email).first().password_hash
+    db.close()
+    assert new_hash != old_hash
+    assert new_hash.startswith("$2b$05$")
+
+# Тест: при заполненной очереди пула паролей сервер сразу отвечает 503
+def test_register_rejected_when_password_pool_saturated(client, monkeypatch):
+    from backend import auth
+    from backend.workers import BoundedProcessPool
+    monkeypatch.setattr(auth, "password_pool", BoundedProcessPool("test", max_workers=1, max_pending=0))
+    response = client.post(
+        "/register",
+        json={"email": "busy@edu.hse.ru", "password": "password123"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,76 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from backend.main import app
+from backend.database import SessionLocal, User, request_engine
+from backend.auth import create_access_token, get_password_hash, token_cache
+from backend.auth_cache import CurrentUser, TokenCache
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для создания тестового пользователя
+@pytest.fixture
+def test_user():
+    db = SessionLocal()
+    email = "cache@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    db.close()
+    return {"email": email}
+
+# Сбор SQL-запросов, выполненных движком
+@pytest.fixture
+def statements():
+    collected = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(request_engine, "before_cursor_execute", collect)
+    yield collected
+    event.remove(request_engine, "before_cursor_execute", collect)
+
+# Тест: повторный запрос с тем же токеном не обращается к таблице users
+def test_cached_token_skips_user_query(client, test_user, statements):
+    token_cache.clear()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user['email']})}"}
+    thread = client.post("/threads", json={"title": "Cache Thread"}, headers=headers).json()
+    assert any("FROM users" in s for s in statements)
+
+    statements.clear()
+    response = client.post(f"/threads/{thread['id']}/messages", json={"content": "hi"}, headers=headers)
+    assert response.status_code == 200
+    assert not any("FROM users" in s for s in statements)
+    assert client.get("/stats/auth-cache").json()["hits"] >= 1
+
+# Тест: изменение пользователя сбрасывает его токены
+def test_user_update_invalidates_cache(client, test_user):
+    token = create_access_token(data={"sub": test_user["email"]})
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/threads", json={"title": "Cache Thread"}, headers=headers)
+    assert token_cache.get(token) is not None
+
+    db = SessionLocal()
+    user = db.query(User).filter(User.email == test_user["email"]).first()
+    user.is_verified = 1
+    db.commit()
+    db.close()
+    assert token_cache.get(token) is None
+
+# Тест: запись удаляется по истечении токена и при переполнении кэша
+def test_token_cache_expiry_and_eviction():
+    cache = TokenCache(max_size=2)
+    user = CurrentUser(id=1, email="a@edu.hse.ru", is_verified=False)
+    cache.put("expired", {"exp": time.time() - 1}, user)
+    assert cache.get("expired") is None
+
+    for token in ("t1", "t2", "t3"):
+        cache.put(token, {"exp": time.time() + 60}, user)
+    assert cache.get("t1") is None
+    assert cache.get("t3").user == user
+    assert cache.stats()["evictions"] == 1
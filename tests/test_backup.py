@@ -0,0 +1,108 @@
+import io
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from backend.database import SessionLocal, Base, User, Thread, Message, create_db_engine, init_db
+from backend import backup, search
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    init_db()
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для пустой базы, в которую загружается выгрузка
+@pytest.fixture
+def target_db(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'target.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+# Фикстура для данных форума
+@pytest.fixture
+def forum(db):
+    if not db.query(User).filter(User.email == "backup@edu.hse.ru").first():
+        db.add(User(email="backup@edu.hse.ru", password_hash="hash"))
+    thread = Thread(title="Резервная копия")
+    db.add(thread)
+    db.flush()
+    db.add_all(Message(thread_id=thread.id, content=f"Сообщение {i}") for i in range(5))
+    db.commit()
+    return thread.id
+
+def counts(db):
+    return [db.execute(select(func.count()).select_from(table)).scalar() for table in backup.TABLES.values()]
+
+# Тест выгрузки в .gz и загрузки в пустую базу
+def test_export_import_roundtrip(db, target_db, forum, tmp_path):
+    path = str(tmp_path / "forum.ndjson.gz")
+    with backup.open_dump(path, "w") as out:
+        exported = backup.export_forum(db, out, batch_size=2, progress=backup.Progress(stream=io.StringIO()))
+    with backup.open_dump(path, "r") as lines:
+        imported = backup.import_forum(target_db, lines, batch_size=3, progress=backup.Progress(stream=io.StringIO()))
+
+    assert exported == imported
+    assert counts(target_db) == counts(db)
+    thread = target_db.get(Thread, forum)
+    assert thread.title == "Резервная копия"
+    assert thread.created_at == db.get(Thread, forum).created_at
+    assert search.search(target_db, "Резервная", limit=10)["items"]
+
+# Прогресс, который прерывает загрузку после первой пачки
+class FailingProgress(backup.Progress):
+    def add(self, kind, count=1):
+        super().add(kind, count)
+        if self.total:
+            raise KeyboardInterrupt
+
+# Тест продолжения прерванной загрузки с контрольной точки
+def test_import_resumes_from_checkpoint(db, target_db, forum, tmp_path):
+    path = str(tmp_path / "forum.ndjson")
+    with backup.open_dump(path, "w") as out:
+        backup.export_forum(db, out, progress=backup.Progress(stream=io.StringIO()))
+    checkpoint = backup.Checkpoint(path + ".checkpoint")
+
+    with pytest.raises(KeyboardInterrupt):
+        with backup.open_dump(path, "r") as lines:
+            backup.import_forum(target_db, lines, batch_size=2, checkpoint=checkpoint, progress=FailingProgress(stream=io.StringIO()))
+    assert checkpoint.load() == 2
+
+    with backup.open_dump(path, "r") as lines:
+        backup.import_forum(target_db, lines, batch_size=2, checkpoint=checkpoint, progress=backup.Progress(stream=io.StringIO()))
+    assert counts(target_db) == counts(db)
+    assert checkpoint.load() == 0
+
+# Тест: последняя неполная пачка попадает в контрольную точку, поэтому
+# после сбоя в обработке после загрузки повтор не вставляет её заново
+def test_import_checkpoints_final_batch(db, target_db, forum, tmp_path, monkeypatch):
+    path = str(tmp_path / "forum.ndjson")
+    with backup.open_dump(path, "w") as out:
+        backup.export_forum(db, out, progress=backup.Progress(stream=io.StringIO()))
+    with backup.open_dump(path, "r") as lines:
+        total = sum(1 for line in lines if line.strip())
+    checkpoint = backup.Checkpoint(path + ".checkpoint")
+
+    def broken_rerender(db, batch_size):
+        raise RuntimeError("сбой разметки")
+
+    monkeypatch.setattr(backup.render, "rerender_messages", broken_rerender)
+    with pytest.raises(RuntimeError):
+        with backup.open_dump(path, "r") as lines:
+            backup.import_forum(target_db, lines, batch_size=total + 1, checkpoint=checkpoint, progress=backup.Progress(stream=io.StringIO()))
+    assert checkpoint.load() == total
+    monkeypatch.undo()
+
+    with backup.open_dump(path, "r") as lines:
+        backup.import_forum(target_db, lines, batch_size=total + 1, checkpoint=checkpoint, progress=backup.Progress(stream=io.StringIO()))
+    assert counts(target_db) == counts(db)
+    assert checkpoint.load() == 0
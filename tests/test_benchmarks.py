@@ -0,0 +1,20 @@
+from collections import Counter
+from benchmarks.bench_load import compare
+from benchmarks.datagen import ForumGenerator
+
+# Тест генератора: один seed - одни и те же данные, популярность по Ципфу
+def test_generator_is_seeded_and_skewed():
+    threads = list(range(1, 101))
+    first = ForumGenerator(seed=7).pick_threads(threads, 5000)
+    assert first == ForumGenerator(seed=7).pick_threads(threads, 5000)
+    counts = Counter(first)
+    assert counts[1] > counts[10] > counts[100]
+    assert counts[1] > 5000 * 0.1
+
+# Тест сравнения с эталоном: падение rps, рост p95 и ошибки считаются регрессией
+def test_compare_with_baseline():
+    baseline = {"GET threads": {"rps": 100.0, "p95_ms": 10.0}}
+    assert compare({"GET threads": {"rps": 90.0, "p95_ms": 12.0}}, baseline, 0.3) == []
+    regressions = compare({"GET threads": {"rps": 60.0, "p95_ms": 14.0, "errors": 2}}, baseline, 0.3)
+    assert len(regressions) == 3
+    assert compare({}, baseline, 0.3) == ["GET threads: нет результата"]
@@ -0,0 +1,101 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, Message
+from backend.auth import create_access_token, get_password_hash
+from backend import bulk
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "bulk@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для двух тестовых тредов
+@pytest.fixture
+def threads(db):
+    created = [Thread(title="Bulk A"), Thread(title="Bulk B")]
+    db.add_all(created)
+    db.commit()
+    return [thread.id for thread in created]
+
+# Тест массовой загрузки: id по порядку, ошибки по элементам, счётчики тредов
+def test_bulk_insert_messages(client, auth_headers, threads):
+    first, second = threads
+    items = [
+        {"thread_id": first, "content": "один"},
+        {"thread_id": 999999, "content": "мимо"},
+        {"thread_id": second, "content": "два"},
+        {"thread_id": first, "content": "три"},
+    ]
+    response = client.post("/messages/bulk", json={"items": items}, headers=auth_headers)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["errors"] == [{"index": 1, "detail": "Тред не найден"}]
+    ids = result["ids"]
+    assert ids[1] is None and ids[0] < ids[2] < ids[3]
+
+    messages = client.get(f"/threads/{first}/messages").json()["items"]
+    assert [(m["id"], m["content"]) for m in messages] == [(ids[0], "один"), (ids[3], "три")]
+    page = client.get(f"/threads/{first}/page").json()
+    assert page["thread"]["message_count"] == 2
+    assert client.post("/messages/bulk", json={"items": items}).status_code == 401
+
+# Тест времени с часовым поясом: переводится в локальное время базы,
+# в том числе вперемешку со временем без пояса
+def test_bulk_created_at_with_timezone(client, db, auth_headers, threads):
+    first, _ = threads
+    aware = datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=3)))
+    local = aware.astimezone().replace(tzinfo=None)
+    response = client.post("/messages/bulk", json={"items": [
+        {"thread_id": first, "content": "с поясом", "created_at": aware.isoformat()},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    stored = db.get(Message, response.json()["ids"][0])
+    assert stored.created_at == local
+
+    response = client.post("/messages/bulk", json={"items": [
+        {"thread_id": first, "content": "без пояса", "created_at": "2024-01-01T00:00:00"},
+        {"thread_id": first, "content": "с поясом", "created_at": aware.isoformat()},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["errors"] == []
+    db.expire_all()
+    assert [db.get(Message, message_id).created_at for message_id in response.json()["ids"]] == [
+        datetime(2024, 1, 1), local,
+    ]
+
+# Тест пачек: импорт старых сообщений не сдвигает бамп назад
+def test_bulk_chunks_keep_bump(db, threads):
+    first, _ = threads
+    bumped_at = db.get(Thread, first).bumped_at
+    items = [
+        {"thread_id": first, "content": f"архив {i}", "created_at": datetime(2020, 1, 1, 0, 0, i)}
+        for i in range(7)
+    ]
+    result = bulk.insert_messages(db, items, chunk_size=3)
+    assert result["errors"] == [] and None not in result["ids"]
+    db.expire_all()
+    thread = db.get(Thread, first)
+    assert thread.message_count == 7
+    assert thread.bumped_at == bumped_at
+    assert db.query(Message).filter(Message.thread_id == first).count() == 7
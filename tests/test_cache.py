@@ -0,0 +1,101 @@
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from backend.main import app
+from backend.database import SessionLocal, Thread, request_engine
+from backend.cache import MemoryBackend, ResponseCache, response_cache
+from backend import crud
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для создания тестового треда
+@pytest.fixture
+def test_thread(db):
+    thread = Thread(title="Cached Thread", created_at=datetime.now())
+    db.add(thread)
+    db.commit()
+    db.refresh(thread)
+    return thread
+
+# Сбор SQL-запросов, выполненных движком
+@pytest.fixture
+def statements():
+    collected = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(request_engine, "before_cursor_execute", collect)
+    yield collected
+    event.remove(request_engine, "before_cursor_execute", collect)
+
+# Тест: повторное чтение страницы не обращается к базе
+def test_cached_messages_skip_database(client, test_thread, db, statements):
+    crud.create_message(db, test_thread.id, "Кэшируемое сообщение")
+    url = f"/threads/{test_thread.id}/messages"
+    first = client.get(url)
+    statements.clear()
+
+    second = client.get(url)
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert statements == []
+    assert client.get(url, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert response_cache.stats()["scopes"]["thread"]["hits"] >= 2
+
+# Тест: новое сообщение сбрасывает кэш треда и списка тредов
+def test_new_message_invalidates_cache(client, test_thread, db):
+    url = f"/threads/{test_thread.id}/messages"
+    client.get(url)
+    client.get("/threads", params={"order": "bumped"})
+
+    crud.create_message(db, test_thread.id, "Свежее сообщение")
+    messages = client.get(url).json()["items"]
+    assert messages[-1]["content"] == "Свежее сообщение"
+    threads = client.get("/threads", params={"order": "bumped"}).json()["items"]
+    assert threads[0]["id"] == test_thread.id
+
+# Тест: откат транзакции не сбрасывает кэш
+def test_rollback_keeps_cache(db, test_thread):
+    version = response_cache.backend.get_version(f"thread:{test_thread.id}")
+    test_thread.title = "Не сохранится"
+    db.flush()
+    db.rollback()
+    assert response_cache.backend.get_version(f"thread:{test_thread.id}") == version
+
+# Тест вытеснения по объёму
+def test_memory_backend_evicts_by_size():
+    cache = ResponseCache(MemoryBackend(max_bytes=100))
+    for i in range(3):
+        lookup = cache.lookup("thread:1", str(i))
+        cache.store(lookup, "etag", None, b"x" * 40)
+    assert cache.lookup("thread:1", "0").value is None
+    assert cache.lookup("thread:1", "2").value == ("etag", None, b"x" * 40)
+    assert cache.backend.stats()["evictions"] == 1
+
+# Тест времени жизни: устаревшая запись не читается и освобождает место
+def test_memory_backend_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("backend.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(MemoryBackend(max_bytes=100, ttl=30))
+    cache.store(cache.lookup("thread:1", "0"), "etag", None, b"x" * 40)
+    now[0] += 29
+    assert cache.lookup("thread:1", "0").value == ("etag", None, b"x" * 40)
+    now[0] += 1
+    assert cache.lookup("thread:1", "0").value is None
+    assert cache.backend.stats()["bytes"] == 0
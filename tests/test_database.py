@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from backend.main import app
+from backend import database
+from backend.database import SessionLocal, User, engine, pool_stats
+from backend.auth import create_access_token, get_password_hash
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers():
+    db = SessionLocal()
+    email = "pool@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    db.close()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Тест: авторизация и обработчик используют одну сессию на запрос
+def test_session_shared_within_request(client, auth_headers, monkeypatch):
+    sessions = []
+    name = "AsyncSessionLocal" if database.IS_ASYNC else "SessionLocal"
+    session_factory = getattr(database, name)
+
+    def tracking_session_factory():
+        db = session_factory()
+        sessions.append(db)
+        return db
+
+    monkeypatch.setattr(database, name, tracking_session_factory)
+    response = client.post("/threads", json={"title": "Pool Thread"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert len(sessions) == 1
+
+# Тест: после запросов все соединения возвращаются в пул
+def test_connections_returned_to_pool(client, auth_headers):
+    for _ in range(5):
+        client.get("/threads")
+        client.post("/threads", json={"title": "Pool Thread"}, headers=auth_headers)
+    stats = client.get("/stats/pool").json()
+    assert stats["checked_out"] == 0
+    assert stats == pool_stats()
+
+# Тест настроек SQLite для файловой базы
+def test_sqlite_pragmas():
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+
+# Тест: run_db возвращает соединение в пул сразу после вызова. Иначе
+# открытые сессии запросов, ждущие свободный поток, держат все соединения
+# пула, и следующий запрос ждёт соединение до таймаута
+@pytest.mark.parametrize("use_async", [False, True])
+def test_run_db_releases_connection(tmp_path, use_async):
+    url = f"sqlite:///{tmp_path / 'run_db.db'}"
+    options = {"pool_size": 1, "max_overflow": 0, "pool_timeout": 1}
+    if use_async:
+        db_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"), **options)
+        session_factory = async_sessionmaker(bind=db_engine)
+    else:
+        db_engine = create_engine(url, poolclass=QueuePool, **options)
+        session_factory = sessionmaker(bind=db_engine)
+    select_one = lambda db: db.execute(text("SELECT 1")).scalar()
+
+    async def scenario():
+        # Сессии не закрываются, как у запросов, которые ещё не ответили
+        sessions = [session_factory() for _ in range(3)]
+        results = [await database.run_db(db, select_one) for db in sessions]
+        pool = db_engine.sync_engine.pool if use_async else db_engine.pool
+        return results, pool.checkedout()
+
+    assert asyncio.run(scenario()) == ([1, 1, 1], 0)
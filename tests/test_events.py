@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+from backend.main import backfill_pages
+from backend.database import SessionLocal, Thread, Message
+from backend.broadcast import Broadcaster, broadcaster, thread_topic
+from backend.events import event_stream
+from backend import crud
+
+# Фикстура-помощник: тред с несколькими сообщениями
+def create_thread_with_messages(count):
+    db = SessionLocal()
+    thread = Thread(title="Events Thread", created_at=datetime.now())
+    db.add(thread)
+    db.flush()
+    messages = [Message(thread_id=thread.id, content=f"Event {i}", created_at=datetime.now()) for i in range(count)]
+    db.add_all(messages)
+    db.commit()
+    ids = (thread.id, [m.id for m in messages])
+    db.close()
+    return ids
+
+# Тест: медленный подписчик отключается, не задерживая публикацию
+def test_slow_subscriber_is_evicted():
+    async def scenario():
+        hub = Broadcaster(queue_size=2)
+        slow = hub.subscribe("topic")
+        for i in range(3):
+            hub.publish("topic", ("message", i, {}))
+        assert slow.evicted
+        assert await slow.get(1) is None
+        assert hub.stats()["subscribers"] == 0
+    asyncio.run(scenario())
+
+# Тест: переподключение с Last-Event-ID догружает только пропущенное,
+# а живые события идут следом без повторов
+def test_stream_resumes_from_last_event_id():
+    thread_id, ids = create_thread_with_messages(4)
+
+    async def scenario():
+        stream = event_stream(
+            thread_topic(thread_id),
+            ids[1],
+            backfill_pages("message", crud.list_messages, thread_id),
+        )
+        received = [await stream.__anext__(), await stream.__anext__()]
+        # Повтор уже отправленного сообщения и новое сообщение
+        broadcaster.publish(thread_topic(thread_id), ("message", ids[3], {"id": ids[3]}))
+        broadcaster.publish(thread_topic(thread_id), ("message", ids[3] + 1000, {"id": ids[3] + 1000}))
+        received.append(await stream.__anext__())
+        await stream.aclose()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [chunk.split("\n")[0] for chunk in received] == [
+        f"id: {ids[2]}", f"id: {ids[3]}", f"id: {ids[3] + 1000}",
+    ]
+    assert "Event 2" in received[0]
+    assert broadcaster.stats()["subscribers"] == 0
+
+# Тест: живые события, опубликованные не по порядку id (commit
+# параллельных записей), доходят все
+def test_live_events_out_of_order():
+    thread_id, ids = create_thread_with_messages(1)
+
+    async def scenario():
+        stream = event_stream(
+            thread_topic(thread_id),
+            None,
+            backfill_pages("message", crud.list_messages, thread_id),
+        )
+        # Первый __anext__ оформляет подписку и ждёт события
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        broadcaster.publish(thread_topic(thread_id), ("message", ids[0] + 2, {"id": ids[0] + 2}))
+        broadcaster.publish(thread_topic(thread_id), ("message", ids[0] + 1, {"id": ids[0] + 1}))
+        received = [await first, await stream.__anext__()]
+        await stream.aclose()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [chunk.split("\n")[0] for chunk in received] == [f"id: {ids[0] + 2}", f"id: {ids[0] + 1}"]
+
+# Тест: поток событий несуществующего треда отвечает 404
+def test_events_for_missing_thread():
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    response = TestClient(app).get("/threads/999999/events")
+    assert response.status_code == 404
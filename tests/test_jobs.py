@@ -0,0 +1,152 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from backend.main import app
+from backend.database import SessionLocal, Job
+from backend.jobs import JobQueue, QUEUED, FAILED
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Очередь без потоков-исполнителей: задачи выполняются в тесте через run_once
+def make_queue(**options) -> JobQueue:
+    return JobQueue(workers=0, **options)
+
+def jobs_of(db, kind):
+    db.expire_all()
+    return db.query(Job).filter(Job.kind == kind).order_by(Job.id).all()
+
+# Тест: задача появляется только вместе с commit записи, одинаковые
+# задачи в очереди объединяются, выполненная задача удаляется
+def test_enqueue_coalesce_and_run(db):
+    queue = make_queue()
+    done = []
+    queue.handler("test_reindex")(lambda session, thread_id: done.append(thread_id))
+
+    queue.enqueue(db, "test_reindex", key="reindex:42", thread_id=42)
+    db.rollback()
+    assert jobs_of(db, "test_reindex") == []
+
+    assert queue.enqueue(db, "test_reindex", key="reindex:42", thread_id=42)
+    assert not queue.enqueue(db, "test_reindex", key="reindex:42", thread_id=42)
+    db.commit()
+    assert not queue.enqueue(db, "test_reindex", key="reindex:42", thread_id=42)
+    db.commit()
+    assert len(jobs_of(db, "test_reindex")) == 1
+
+    assert queue.run_once()
+    assert not queue.run_once()
+    assert done == [42]
+    assert jobs_of(db, "test_reindex") == []
+    stats = queue.stats()
+    assert (stats["completed"], stats["coalesced"]) == (1, 2)
+
+# Тест повторов: задержка удваивается, после последней попытки задача
+# остаётся со статусом failed и вызывается обработчик отказа
+def test_retry_with_backoff_then_fail(db):
+    queue = make_queue(max_attempts=2, retry_delay=60)
+    gave_up = []
+
+    def broken(session, name):
+        raise RuntimeError(f"сбой {name}")
+
+    queue.handler("test_broken", on_failure=lambda session, name: gave_up.append(name))(broken)
+    queue.enqueue(db, "test_broken", name="первая")
+    db.commit()
+
+    assert queue.run_once()
+    [job] = jobs_of(db, "test_broken")
+    assert (job.status, job.attempts, job.last_error) == (QUEUED, 1, "RuntimeError: сбой первая")
+    assert job.run_at > datetime.now() + timedelta(seconds=50)
+    assert queue.retry_delay_for(3) == 240
+    # Повтор ещё не наступил
+    assert not queue.run_once()
+
+    db.execute(update(Job).where(Job.id == job.id).values(run_at=datetime.now()))
+    db.commit()
+    assert queue.run_once()
+    [job] = jobs_of(db, "test_broken")
+    assert (job.status, job.attempts) == (FAILED, 2)
+    assert gave_up == ["первая"]
+    assert not queue.run_once()
+
+# Тест доставки "хотя бы один раз": задача, брошенная исполнителем
+# (истёк срок закрепления), выполняется снова
+def test_abandoned_job_is_reclaimed(db):
+    queue = make_queue()
+    done = []
+    queue.handler("test_lease")(lambda session: done.append(True))
+    queue.enqueue(db, "test_lease")
+    db.commit()
+
+    claimed = queue.claim(db)
+    assert claimed.attempts == 1
+    assert not queue.run_once()
+
+    db.execute(update(Job).where(Job.id == claimed.id).values(locked_until=datetime.now() - timedelta(seconds=1)))
+    db.commit()
+    assert queue.run_once()
+    assert done == [True]
+    assert jobs_of(db, "test_lease") == []
+
+# Тест гонки: две транзакции добавляют одинаковую задачу, и вторая не
+# видит первую, пока та не зафиксирована. Уникальный индекс по ключу
+# ждущих задач оставляет одну задачу, повтор не возвращается в очередь
+def test_concurrent_enqueue_coalesces(db):
+    queue = make_queue(retry_delay=60)
+    queue.handler("test_race")(lambda session: None)
+    assert queue.enqueue(db, "test_race", key="race:1")
+    db.flush()
+
+    added = []
+    def enqueue_in_other_session():
+        other = SessionLocal()
+        try:
+            added.append(queue.enqueue(other, "test_race", key="race:1"))
+            other.commit()
+        finally:
+            other.close()
+
+    thread = threading.Thread(target=enqueue_in_other_session)
+    thread.start()
+    time.sleep(0.2)
+    db.commit()
+    thread.join()
+    assert added == [False]
+    assert len(jobs_of(db, "test_race")) == 1
+    db.rollback()
+
+    # Пока задача выполняется, встала такая же; упавшая не возвращается второй копией
+    def broken(session):
+        queue.enqueue(session, "test_race", key="race:1")
+        session.commit()
+        raise RuntimeError("сбой")
+
+    queue.handler("test_race")(broken)
+    assert queue.run_once()
+    [job] = jobs_of(db, "test_race")
+    assert (job.status, job.attempts) == (QUEUED, 0)
+    db.rollback()
+    db.query(Job).filter(Job.kind == "test_race").delete()
+    db.commit()
+
+# Тест статистики очереди
+def test_job_stats_endpoint(client):
+    stats = client.get("/stats/jobs").json()
+    assert {"queued", "running", "failed", "lag_seconds", "completed", "retried", "coalesced"} <= set(stats)
+    assert "jobs_queued" in client.get("/metrics").text
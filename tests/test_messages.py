@@ -57,5 +57,113 @@ def test_create_message(client, test_thread, db):
 def test_get_messages(client, test_thread, test_message):
     response = client.get(f"/threads/{test_thread.id}/messages")
     assert response.status_code == 200
-    assert len(response.json()) > 0
-    assert any(msg["id"] == test_message.id for msg in response.json())
\ No newline at end of file
+    messages = response.json()["items"]
+    assert len(messages) > 0
+    assert any(msg["id"] == test_message.id for msg in messages)
+
+# Тест постраничной выборки сообщений по курсору
+def test_get_messages_pagination(client, test_thread, db):
+    for i in range(5):
+        db.add(Message(thread_id=test_thread.id, content=f"Message {i}", created_at=datetime.now()))
+    db.commit()
+
+    first = client.get(f"/threads/{test_thread.id}/messages", params={"limit": 2}).json()
+    assert [m["content"] for m in first["items"]] == ["Message 0", "Message 1"]
+    assert first["next_cursor"] == first["items"][-1]["id"]
+
+    rest = client.get(
+        f"/threads/{test_thread.id}/messages",
+        params={"limit": 10, "after_id": first["next_cursor"]},
+    ).json()
+    assert [m["content"] for m in rest["items"]] == ["Message 2", "Message 3", "Message 4"]
+    assert rest["next_cursor"] is None
+
+    # Загрузка более ранних сообщений при прокрутке вверх
+    older = client.get(
+        f"/threads/{test_thread.id}/messages",
+        params={"limit": 1, "before_id": rest["items"][0]["id"]},
+    ).json()
+    assert [m["content"] for m in older["items"]] == ["Message 1"]
+    assert older["next_cursor"] == older["items"][0]["id"]
+
+# Тест запрета на одновременное указание after_id и before_id
+def test_get_messages_conflicting_cursors(client, test_thread):
+    response = client.get(
+        f"/threads/{test_thread.id}/messages",
+        params={"after_id": 1, "before_id": 2},
+    )
+    assert response.status_code == 400
+# Тест условных запросов: 304 без выборки сообщений, пока тред не изменился
+def test_get_messages_conditional(client, test_thread, db):
+    from sqlalchemy import event
+    from backend import crud
+    from backend.database import request_engine
+    url = f"/threads/{test_thread.id}/messages"
+    first = client.get(url)
+    etag = first.headers["ETag"]
+
+    statements = []
+    collect = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(request_engine, "before_cursor_execute", collect)
+    try:
+        cached = client.get(url, headers={"If-None-Match": etag})
+    finally:
+        event.remove(request_engine, "before_cursor_execute", collect)
+    assert cached.status_code == 304
+    assert not any("FROM messages" in s for s in statements)
+
+    modified = client.get(url, headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert modified.status_code == 304
+
+    crud.create_message(db, test_thread.id, "Новое сообщение")
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+# Тест: страница сообщений содержит ровно поля схемы ответа
+def test_messages_match_response_model(client, test_thread, test_message):
+    from backend.schemas import MessageResponse
+    items = client.get(f"/threads/{test_thread.id}/messages").json()["items"]
+    assert set(items[0]) == set(MessageResponse.model_fields)
+    assert MessageResponse.model_validate(items[0]).id == items[0]["id"]
+
+# Тест страницы треда: данные треда и сообщения одним запросом
+def test_get_thread_page(client, test_thread, test_message):
+    response = client.get(f"/threads/{test_thread.id}/page")
+    assert response.status_code == 200
+    page = response.json()
+    assert page["thread"]["title"] == "Test Thread"
+    assert [m["id"] for m in page["messages"]["items"]] == [test_message.id]
+    assert client.get("/threads/999999/page").status_code == 404
+
+# Тест страницы треда: последние сообщения и число запросов к базе
+def test_get_thread_page_last_and_query_count(client, test_thread, db):
+    from sqlalchemy import event
+    from backend.database import request_engine
+
+    ids = []
+    for i in range(5):
+        message = Message(thread_id=test_thread.id, content=f"Message {i}", created_at=datetime.now())
+        db.add(message)
+        db.commit()
+        ids.append(message.id)
+    thread_id = test_thread.id
+
+    statements = []
+    collect = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(request_engine, "before_cursor_execute", collect)
+    try:
+        first = client.get(f"/threads/{thread_id}/page", params={"limit": 2}).json()
+    finally:
+        event.remove(request_engine, "before_cursor_execute", collect)
+    # Запрос валидаторов и один запрос треда вместе с сообщениями
+    assert len(statements) == 2
+    assert sum("messages" in s for s in statements) == 1
+    assert [m["id"] for m in first["messages"]["items"]] == ids[:2]
+    assert first["messages"]["next_cursor"] == ids[1]
+
+    last = client.get(f"/threads/{test_thread.id}/page", params={"limit": 2, "last": True}).json()
+    assert [m["id"] for m in last["messages"]["items"]] == ids[-2:]
+    assert last["messages"]["next_cursor"] == ids[-2]
+    older = client.get(f"/threads/{test_thread.id}/messages", params={"before_id": ids[-2]}).json()
+    assert [m["id"] for m in older["items"]] == ids[:3]
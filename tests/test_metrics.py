@@ -0,0 +1,63 @@
+import logging
+import pytest
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, Thread, Message
+from backend import metrics
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для тестового треда с сообщением
+@pytest.fixture
+def test_thread(db):
+    thread = Thread(title="Metrics Thread")
+    db.add(thread)
+    db.flush()
+    db.add(Message(thread_id=thread.id, content="Metrics message"))
+    db.commit()
+    return thread.id
+
+def sample(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+# Тест: задержка по шаблону маршрута и SQL-запросы, посчитанные на HTTP-запрос
+def test_metrics_endpoint(client, test_thread):
+    labels = 'method="GET",route="/threads/{thread_id}/messages"'
+    before = client.get("/metrics").text
+    assert client.get(f"/threads/{test_thread}/messages").status_code == 200
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    count = f'http_request_duration_seconds_count{{{labels},status="200"}}'
+    assert sample(text, count) == sample(before, count) + 1
+    queries = f"http_request_db_queries_sum{{{labels}}}"
+    assert sample(text, queries) > sample(before, queries)
+    assert "# TYPE db_pool_wait_seconds histogram" in text
+    assert "db_pool_checked_out " in text
+    assert f"/threads/{test_thread}/" not in text
+
+# Тест журнала медленных запросов с разбивкой по SQL
+def test_slow_request_logged(client, test_thread, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_MS", 0.001)
+    with caplog.at_level(logging.WARNING, logger="backend.metrics"):
+        client.get(f"/threads/{test_thread}/page")
+    record = next(r for r in caplog.records if "Медленный запрос" in r.getMessage())
+    assert f"/threads/{test_thread}/page" in record.getMessage()
+    assert "FROM threads" in record.getMessage()
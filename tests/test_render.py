@@ -0,0 +1,104 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, Message
+from backend.auth import create_access_token, get_password_hash
+from backend import archive, render
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "render@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для тестового треда
+@pytest.fixture
+def thread_id(db):
+    thread = Thread(title="Тред с разметкой")
+    db.add(thread)
+    db.commit()
+    return thread.id
+
+# Тест разметки: пользовательский HTML экранируется, теги ставит только разметчик
+def test_render_message():
+    assert render.render_message('<img src=x onerror="alert(1)">') == (
+        "&lt;img src=x onerror=&quot;alert(1)&quot;&gt;"
+    )
+    assert render.render_message(">>12 **да**\n>цитата\n`<b>`") == (
+        '<a class="reply-link" href="#post-12">&gt;&gt;12</a> <b>да</b><br>'
+        '<span class="quote">&gt;цитата</span><br><code>&lt;b&gt;</code>'
+    )
+    assert render.render_message("см. https://hse.ru/?a=1&b=2.") == (
+        'см. <a href="https://hse.ru/?a=1&amp;b=2" rel="nofollow noopener" target="_blank">'
+        "https://hse.ru/?a=1&amp;b=2</a>."
+    )
+    assert render.render_message("javascript:alert(1) *x*") == "javascript:alert(1) <i>x</i>"
+
+# Тест: HTML строится при записи и отдаётся вместе с текстом
+def test_message_html_is_stored(client, db, auth_headers, thread_id):
+    response = client.post(f"/threads/{thread_id}/messages", json={"content": "<b>жирно</b>"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["content_html"] == "&lt;b&gt;жирно&lt;/b&gt;"
+    stored = db.get(Message, response.json()["id"])
+    assert stored.render_version == render.RENDER_VERSION
+
+    items = client.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert items[0]["content_html"] == "&lt;b&gt;жирно&lt;/b&gt;"
+    assert "render_version" not in items[0]
+
+# Тест устаревшей разметки: при чтении сообщение размечается заново,
+# команда перерисовки обновляет его в базе
+def test_stale_render_is_rebuilt(client, db, auth_headers, thread_id):
+    response = client.post(f"/threads/{thread_id}/messages", json={"content": "**новая**"}, headers=auth_headers)
+    message_id = response.json()["id"]
+    db.execute(update(Message).where(Message.id == message_id).values(content_html="старая", render_version=0))
+    db.commit()
+
+    page = client.get(f"/threads/{thread_id}/page").json()
+    assert page["messages"]["items"][0]["content_html"] == "<b>новая</b>"
+
+    assert render.rerender_messages(db) >= 1
+    db.expire_all()
+    stored = db.get(Message, message_id)
+    assert (stored.content_html, stored.render_version) == ("<b>новая</b>", render.RENDER_VERSION)
+    assert render.rerender_messages(db) == 0
+
+# Тест смены версии разметки: прежние ETag и записи кэша страниц
+# больше не подходят
+def test_render_version_changes_etag(client, auth_headers, thread_id, monkeypatch):
+    client.post(f"/threads/{thread_id}/messages", json={"content": "*текст*"}, headers=auth_headers)
+    urls = (f"/threads/{thread_id}/messages", f"/threads/{thread_id}/page")
+    etags = [client.get(url).headers["ETag"] for url in urls]
+    assert client.get(urls[0], headers={"If-None-Match": etags[0]}).status_code == 304
+
+    monkeypatch.setattr(render, "RENDER_VERSION", render.RENDER_VERSION + 1)
+    for url, etag in zip(urls, etags):
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+# Тест архива: сообщения архивного треда тоже отдаются с HTML
+def test_archived_messages_have_html(client, db, auth_headers, thread_id):
+    client.post(f"/threads/{thread_id}/messages", json={"content": ">>1 ~~нет~~"}, headers=auth_headers)
+    archive.archive_threads(db, [thread_id])
+    items = client.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert items[0]["content_html"] == '<a class="reply-link" href="#post-1">&gt;&gt;1</a> <s>нет</s>'
@@ -0,0 +1,94 @@
+import sqlite3
+import pytest
+from fastapi.testclient import TestClient
+from backend import database, replicas
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, create_db_engine
+from backend.auth import create_access_token, get_password_hash
+from backend.replicas import ReadRouter, READ_YOUR_WRITES_COOKIE
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "replicas@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для тестового треда
+@pytest.fixture
+def thread_id(db):
+    thread = Thread(title="Тред с репликой")
+    db.add(thread)
+    db.commit()
+    return thread.id
+
+# Копия тестовой базы в роли реплики: после копирования она не обновляется,
+# то есть ведёт себя как сильно отстающая реплика
+def make_replica(path):
+    source = sqlite3.connect(database.engine.url.database)
+    target = sqlite3.connect(path)
+    source.backup(target)
+    target.close()
+    source.close()
+    url = (database.async_engine or database.engine).url
+    return create_db_engine(url.set(database=str(path)), is_async=database.IS_ASYNC)
+
+# Тест маршрутизации: чтение идёт в реплику, а клиент, который только что
+# написал сообщение, читает из основной базы и видит его
+def test_reads_go_to_replica_except_after_write(db, auth_headers, thread_id, tmp_path, monkeypatch):
+    replica = make_replica(tmp_path / "replica.db")
+    router = ReadRouter([replica])
+    monkeypatch.setattr(replicas, "read_router", router)
+
+    writer = TestClient(app)
+    response = writer.post(f"/threads/{thread_id}/messages", json={"content": "Моё сообщение"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert READ_YOUR_WRITES_COOKIE in response.cookies
+
+    # Обычный читатель получает данные реплики, где сообщения ещё нет
+    reader = TestClient(app)
+    items = reader.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert items == []
+    assert router.stats()["replicas"][0]["reads"] == 1
+
+    # Автор читает из основной базы
+    items = writer.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert [item["content"] for item in items] == ["Моё сообщение"]
+    assert router.primary_reads == 1
+    assert router.stats()["replicas"][0]["reads"] == 1
+
+    # Страница с реплики не попала в кэш: следующий читатель видит актуальную
+    # страницу, которую в кэш положило чтение из основной базы
+    items = reader.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert [item["content"] for item in items] == ["Моё сообщение"]
+    getattr(replica, "sync_engine", replica).dispose()
+
+# Тест стратегий выбора реплики: по очереди и в наименее загруженную
+def test_router_strategies(tmp_path):
+    engines = [create_db_engine(f"sqlite:///{tmp_path / f'replica{i}.db'}") for i in range(2)]
+
+    router = ReadRouter(engines)
+    assert [router.choose() for _ in range(4)] == engines * 2
+
+    router = ReadRouter(engines, "least_busy")
+    with engines[0].connect():
+        assert [router.choose() for _ in range(3)] == [engines[1]] * 3
+    assert router.choose() is engines[0]
+    assert router.stats()["replicas"][1]["reads"] == 3
+
+    with pytest.raises(ValueError):
+        ReadRouter(engines, "random")
+    for db_engine in engines:
+        db_engine.dispose()
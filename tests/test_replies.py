@@ -0,0 +1,147 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, update
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, Message, MessageReply
+from backend.auth import create_access_token, get_password_hash
+from backend import archive, bulk, crud, replies
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "replies@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для треда с ответами: 3 отвечает на 1 и 2, 4 - на 3 и 1
+# (ссылка на ещё не существующее сообщение 9 не учитывается)
+@pytest.fixture
+def thread_id(client, auth_headers, db):
+    thread = Thread(title="Тред с ответами")
+    db.add(thread)
+    db.commit()
+    for content in ("Первый", "Второй", ">>1\n>>2\nОтвет обоим", ">>3 >>1 >>9 >>3"):
+        response = client.post(f"/threads/{thread.id}/messages", json={"content": content}, headers=auth_headers)
+        assert response.status_code == 200
+    return thread.id
+
+def numbers(items):
+    return [(item["reply_to"], item["post_number"], item["depth"]) for item in items]
+
+def test_parse_references():
+    assert replies.parse_references(">>3 >>1 >>9 >>3 >>0", 5) == [1, 3]
+    assert replies.parse_references("без ссылок", 5) == []
+
+# Тест номеров сообщений, ответов и дерева ответов
+def test_post_numbers_backlinks_and_tree(client, thread_id):
+    items = client.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert [item["post_number"] for item in items] == [1, 2, 3, 4]
+
+    response = client.get(f"/threads/{thread_id}/backlinks")
+    assert response.json()["items"] == [
+        {"post_number": 1, "replies": [3, 4]},
+        {"post_number": 2, "replies": [3]},
+        {"post_number": 3, "replies": [4]},
+    ]
+    response = client.get(f"/threads/{thread_id}/backlinks", params={"start": 2, "limit": 1})
+    assert response.json()["items"] == [{"post_number": 2, "replies": [3]}]
+
+    direct = client.get(f"/threads/{thread_id}/posts/1/replies").json()
+    assert numbers(direct["items"]) == [(1, 3, 1), (1, 4, 1)]
+    assert direct["items"][0]["content"].endswith("Ответ обоим")
+    tree = client.get(f"/threads/{thread_id}/posts/1/replies", params={"depth": 3}).json()
+    assert numbers(tree["items"]) == [(1, 3, 1), (1, 4, 1), (3, 4, 2)]
+
+    assert client.get(f"/threads/{thread_id}/posts/4/replies").json()["items"] == []
+    assert client.get(f"/threads/{thread_id}/posts/5/replies").status_code == 404
+    assert client.get("/threads/1000000000/backlinks").status_code == 404
+
+# Тест: дерево по загруженным сообщениям (архив) совпадает с деревом из графа
+def test_tree_from_messages_matches_graph(db, thread_id):
+    messages = crud.list_messages(db, thread_id, None, None, 100)["items"]
+    for post_number in range(1, 5):
+        expected = crud.get_replies(db, thread_id, post_number, 3)["items"]
+        assert replies.tree_from_messages(messages, post_number, 3) == expected
+
+# Тест массовой загрузки: номера продолжают нумерацию треда, ссылки попадают в граф
+def test_bulk_insert_numbers_and_replies(db, thread_id):
+    result = bulk.insert_messages(db, [
+        {"thread_id": thread_id, "content": ">>2"},
+        {"thread_id": thread_id, "content": ">>5 >>1"},
+    ])
+    assert result["errors"] == []
+    assert [db.get(Message, message_id).post_number for message_id in result["ids"]] == [5, 6]
+    assert crud.list_backlinks(db, thread_id, 1, 5)["items"] == [
+        {"post_number": 1, "replies": [3, 4, 6]},
+        {"post_number": 2, "replies": [3, 5]},
+        {"post_number": 3, "replies": [4]},
+        {"post_number": 5, "replies": [6]},
+    ]
+
+# Тест: номера выдаются из last_post_number, а не из числа сообщений,
+# поэтому после удаления сообщения номер не повторяется
+def test_post_numbers_survive_deletion(client, auth_headers, db, thread_id):
+    db.execute(delete(MessageReply).where(MessageReply.thread_id == thread_id, MessageReply.source_number == 4))
+    db.execute(delete(Message).where(Message.thread_id == thread_id, Message.post_number == 4))
+    db.execute(update(Thread).where(Thread.id == thread_id).values(message_count=3))
+    db.commit()
+
+    response = client.post(f"/threads/{thread_id}/messages", json={"content": "Пятый"}, headers=auth_headers)
+    assert response.json()["post_number"] == 5
+    result = bulk.insert_messages(db, [{"thread_id": thread_id, "content": "Шестой"}])
+    assert db.get(Message, result["ids"][0]).post_number == 6
+    thread = db.get(Thread, thread_id)
+    db.refresh(thread)
+    assert (thread.message_count, thread.last_post_number) == (5, 6)
+
+# Тест ответов при пропуске в номерах: сообщения с номерами больше
+# числа сообщений находятся, удалённое - нет, в том числе в архиве
+def test_replies_with_gap_in_numbers(client, db, thread_id):
+    db.execute(delete(MessageReply).where(
+        MessageReply.thread_id == thread_id,
+        (MessageReply.source_number == 2) | (MessageReply.target_number == 2),
+    ))
+    db.execute(delete(Message).where(Message.thread_id == thread_id, Message.post_number == 2))
+    db.execute(update(Thread).where(Thread.id == thread_id).values(message_count=3))
+    db.commit()
+
+    for archived in (False, True):
+        if archived:
+            archive.archive_threads(db, [thread_id])
+        assert client.get(f"/threads/{thread_id}/posts/4/replies").json()["items"] == []
+        assert client.get(f"/threads/{thread_id}/posts/2/replies").status_code == 404
+        assert client.get(f"/threads/{thread_id}/posts/5/replies").status_code == 404
+
+# Тест перестройки для старой базы: номера и граф восстанавливаются по текстам
+def test_rebuild_reply_graph(db, thread_id):
+    before = crud.list_backlinks(db, thread_id, 1, 10)
+    db.execute(update(Message).where(Message.thread_id == thread_id).values(post_number=None))
+    db.execute(delete(MessageReply).where(MessageReply.thread_id == thread_id))
+    db.commit()
+
+    replies.rebuild_reply_graph(db)
+    numbered = db.query(Message.post_number).filter(Message.thread_id == thread_id).order_by(Message.id).all()
+    assert [row.post_number for row in numbered] == [1, 2, 3, 4]
+    db.execute(update(Thread).where(Thread.id == thread_id).values(last_post_number=0))
+    db.commit()
+    replies.rebuild_reply_graph(db)
+    db.expire_all()
+    assert db.get(Thread, thread_id).last_post_number == 4
+    assert crud.list_backlinks(db, thread_id, 1, 10) == before
@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, User
+from backend.auth import create_access_token, get_password_hash
+from backend import search
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "search@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Тест поиска по названию треда и тексту сообщения
+def test_search_threads_and_messages(client, auth_headers):
+    thread = client.post("/threads", json={"title": "Матанализ коллоквиум"}, headers=auth_headers).json()
+    client.post(
+        f"/threads/{thread['id']}/messages",
+        json={"content": "Кто знает билеты по линейной алгебре?"},
+        headers=auth_headers,
+    )
+
+    hits = client.get("/search", params={"q": "коллоквиум"}).json()["items"]
+    assert any(h["kind"] == "thread" and h["thread_id"] == thread["id"] for h in hits)
+
+    hits = client.get("/search", params={"q": "алгебр"}).json()["items"]
+    message_hits = [h for h in hits if h["kind"] == "message"]
+    assert message_hits and message_hits[0]["title"] == "Матанализ коллоквиум"
+    assert "**" in message_hits[0]["snippet"]
+
+# Тест: операторы FTS5 в запросе не ломают поиск
+def test_search_escapes_query(client):
+    response = client.get("/search", params={"q": 'NOT "OR ('})
+    assert response.status_code == 200
+
+# Тест перестройки индекса для уже существующих данных
+def test_rebuild_index(client, auth_headers, db):
+    client.post("/threads", json={"title": "Перестройка индекса"}, headers=auth_headers)
+    assert search.rebuild_index(db) > 0
+    hits = client.get("/search", params={"q": "перестройка"}).json()["items"]
+    assert len(hits) == 1
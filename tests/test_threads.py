@@ -1,7 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import delete, update
 from backend.main import app
-from backend.database import SessionLocal, Thread
+from backend.database import SessionLocal, Thread, Message
 from datetime import datetime
 from backend.auth import create_access_token
 
@@ -46,7 +47,93 @@ def test_create_thread(client, db):
 
 # Тест получения всех тредов
 def test_get_threads(client, test_thread):
-    response = client.get("/threads")
+    # Общая база тестов давно больше одной страницы, поэтому читаем с курсора
+    response = client.get("/threads", params={"after_id": test_thread.id - 1})
     assert response.status_code == 200
-    assert len(response.json()) > 0
-    assert any(thread["id"] == test_thread.id for thread in response.json())
\ No newline at end of file
+    threads = response.json()["items"]
+    assert len(threads) > 0
+    assert any(thread["id"] == test_thread.id for thread in threads)
+
+# Тест постраничной выборки тредов по курсору
+def test_get_threads_pagination(client, db):
+    for i in range(3):
+        db.add(Thread(title=f"Page Thread {i}", created_at=datetime.now()))
+    db.commit()
+
+    first = client.get("/threads", params={"limit": 2}).json()
+    assert len(first["items"]) == 2
+    assert first["next_cursor"] == first["items"][-1]["id"]
+
+    second = client.get("/threads", params={"limit": 2, "after_id": first["next_cursor"]}).json()
+    assert all(t["id"] > first["next_cursor"] for t in second["items"])
+
+    back = client.get("/threads", params={"limit": 2, "before_id": second["items"][0]["id"]}).json()
+    assert [t["id"] for t in back["items"]] == [t["id"] for t in first["items"]][-2:]
+
+# Тест: счётчики треда обновляются вместе с созданием сообщения
+def test_message_updates_thread_counters(db, test_thread):
+    from backend import crud
+    message = crud.create_message(db, test_thread.id, "Bump")
+    db.refresh(test_thread)
+    assert test_thread.message_count == 1
+    assert test_thread.bumped_at == message.created_at
+    assert crud.create_message(db, 999999, "Нет треда") is None
+
+# Тест сортировок "по бампу" и "самые активные" с курсором
+def test_get_threads_bumped_and_active_order(client, db):
+    from backend import crud
+    threads = [crud.create_thread(db, f"Order Thread {i}") for i in range(3)]
+    crud.create_message(db, threads[0].id, "first")
+    crud.create_message(db, threads[0].id, "second")
+    crud.create_message(db, threads[1].id, "third")
+
+    bumped = client.get("/threads", params={"order": "bumped", "limit": 1}).json()
+    assert bumped["items"][0]["id"] == threads[1].id
+    following = client.get(
+        "/threads", params={"order": "bumped", "limit": 1, "cursor": bumped["next_cursor"]}
+    ).json()
+    assert following["items"][0]["id"] == threads[0].id
+
+    active = client.get("/threads", params={"order": "active", "limit": 1}).json()
+    assert active["items"][0]["message_count"] >= 2
+
+    bad = client.get("/threads", params={"order": "bumped", "cursor": "garbage"})
+    assert bad.status_code == 400
+
+# Тест пересчёта счётчиков после рассинхронизации
+def test_repair_thread_counters(db, test_thread):
+    from backend import crud
+    crud.create_message(db, test_thread.id, "Counted")
+    test_thread.message_count = 42
+    db.commit()
+    assert crud.repair_thread_counters(db) >= 1
+    db.refresh(test_thread)
+    assert test_thread.message_count == 1
+
+# Тест пересчёта после удаления сообщения: число сообщений настоящее,
+# новое сообщение получает следующий номер, а кэш страницы треда сброшен
+def test_repair_counts_after_deletion(client, db, test_thread):
+    from backend import crud
+    first = crud.create_message(db, test_thread.id, "Первое")
+    crud.create_message(db, test_thread.id, "Второе")
+    page = client.get(f"/threads/{test_thread.id}/page").json()
+    assert page["thread"]["message_count"] == 2
+
+    # Изменения мимо ORM: кэш страницы сам не сбрасывается
+    db.execute(delete(Message).where(Message.id == first.id))
+    db.execute(update(Thread).where(Thread.id == test_thread.id).values(message_count=42, last_post_number=0))
+    db.commit()
+    crud.repair_thread_counters(db)
+    db.refresh(test_thread)
+    assert (test_thread.message_count, test_thread.last_post_number) == (1, 2)
+    page = client.get(f"/threads/{test_thread.id}/page").json()
+    assert page["thread"]["message_count"] == 1
+    assert crud.create_message(db, test_thread.id, "Третье").post_number == 3
+
+# Тест условного запроса списка тредов
+def test_get_threads_conditional(client, db):
+    from backend import crud
+    etag = client.get("/threads").headers["ETag"]
+    assert client.get("/threads", headers={"If-None-Match": etag}).status_code == 304
+    crud.create_thread(db, "Conditional Thread")
+    assert client.get("/threads", headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from backend import main
+from backend.main import app
+from backend.database import SessionLocal, User, Thread, Message
+from backend.auth import create_access_token, get_password_hash
+from backend.write_queue import WriteQueue
+
+# Фикстура для клиента FastAPI
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+# Фикстура для базы данных
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Откатываем изменения после теста
+        db.close()
+
+# Фикстура для заголовков авторизации существующего пользователя
+@pytest.fixture
+def auth_headers(db):
+    email = "writequeue@edu.hse.ru"
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(email=email, password_hash=get_password_hash("password123")))
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+# Фикстура для тестового треда
+@pytest.fixture
+def thread_id(db):
+    thread = Thread(title="Очередь записи")
+    db.add(thread)
+    db.commit()
+    return thread.id
+
+def failing_operation(db, content):
+    raise ValueError(content)
+
+# Тест групповой записи: параллельные операции уходят одной пачкой,
+# каждый вызывающий получает свой id, а ошибка одной операции
+# не мешает остальным
+def test_concurrent_submits_share_one_batch(db, thread_id):
+    queue = WriteQueue(max_batch=100, max_delay_ms=50)
+
+    async def post_all():
+        return await asyncio.gather(
+            *(queue.submit(main.message_payload, thread_id, f"Пачка {i}") for i in range(10)),
+            queue.submit(main.message_payload, 10 ** 9, "Нет треда"),
+            queue.submit(failing_operation, "сбой"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(post_all())
+    payloads, missing, failed = results[:10], results[10], results[11]
+    assert len({payload["id"] for payload in payloads}) == 10
+    assert [payload["content"] for payload in payloads] == [f"Пачка {i}" for i in range(10)]
+    assert missing is None
+    assert isinstance(failed, ValueError)
+    assert queue.stats()["batches"] == 1
+    assert queue.stats()["retried_batches"] == 1
+
+    db.expire_all()
+    assert db.query(Message).filter(Message.thread_id == thread_id).count() == 10
+    assert db.get(Thread, thread_id).message_count == 10
+
+# Тест эндпоинтов в режиме очереди: ответы и 404 как без неё
+def test_endpoints_use_write_queue(client, auth_headers, thread_id, monkeypatch):
+    monkeypatch.setattr(main, "WRITE_QUEUE_ENABLED", True)
+    before = main.write_queue.stats()["items"]
+
+    response = client.post(f"/threads/{thread_id}/messages", json={"content": "Через очередь"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["content"] == "Через очередь"
+    response = client.post("/threads/1000000000/messages", json={"content": "Нет треда"}, headers=auth_headers)
+    assert response.status_code == 404
+    response = client.post("/threads", json={"title": "Тред через очередь"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["message_count"] == 0
+
+    assert main.write_queue.stats()["items"] == before + 3
+    items = client.get(f"/threads/{thread_id}/messages").json()["items"]
+    assert items[-1]["content"] == "Через очередь"